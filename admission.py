@@ -0,0 +1,219 @@
+"""Kiểm soát tải cho /api/fetch: token bucket, giới hạn đồng thời, cache SĐT sai.
+
+Token bucket, cache SĐT sai và danh sách lookup đang chạy nằm trong StateBackend
+(xem state_backend.py) để nhiều node/worker dùng chung. Giới hạn đồng thời bảo vệ
+trình duyệt của chính process nên vẫn là semaphore cục bộ; số liệu từ chối được
+đếm theo lý do (theo từng process) để hiển thị ở /admin/metrics.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+
+from state_backend import MemoryBackend, StateBackend
+
+
+class Rejected(Exception):
+    """Request bị từ chối trước khi chạm tới DB/trình duyệt."""
+
+    def __init__(self, status: int, reason: str, message: str, retry_after: float = 0):
+        super().__init__(message)
+        self.status = status
+        self.reason = reason
+        self.message = message
+        self.retry_after = retry_after
+
+
+class TokenBucketLimiter:
+    """Token bucket theo khóa: `rate_per_minute` token/phút, tối đa `burst` token."""
+
+    def __init__(self, rate_per_minute: float, burst: int, *, backend: StateBackend, name: str):
+        self.rate = max(rate_per_minute, 0.0) / 60.0
+        self.burst = max(1, int(burst))
+        self.backend = backend
+        self.prefix = f"rate:{name}:"
+
+    def allow(self, key: str) -> tuple[bool, float]:
+        """Trả về (được phép, số giây nên chờ trước khi thử lại)."""
+        if not key or self.rate <= 0:
+            return True, 0.0
+        now = time.time()
+
+        def take(state):
+            tokens, last = state if state else (float(self.burst), now)
+            tokens = min(float(self.burst), tokens + max(0.0, now - last) * self.rate)
+            if tokens >= 1.0:
+                return [tokens - 1.0, now], (True, 0.0)
+            return [tokens, now], (False, (1.0 - tokens) / self.rate)
+
+        # Bucket đã hồi đầy thì tương đương chưa từng thấy → để khóa hết hạn
+        return self.backend.update(self.prefix + key, take, ttl=self.burst / self.rate)
+
+    def __len__(self):
+        return self.backend.count(self.prefix)
+
+
+class NegativeCache:
+    """Nhớ các khóa (SĐT) không hợp lệ trong `ttl` giây."""
+
+    def __init__(self, ttl: float, *, backend: StateBackend, name: str):
+        self.ttl = ttl
+        self.backend = backend
+        self.prefix = f"neg:{name}:"
+
+    def __contains__(self, key: str) -> bool:
+        return bool(key) and self.backend.get(self.prefix + key) is not None
+
+    def add(self, key: str):
+        if not key or self.ttl <= 0:
+            return
+        self.backend.set(self.prefix + key, 1, ttl=self.ttl)
+
+    def clear(self):
+        self.backend.clear(self.prefix)
+
+    def __len__(self):
+        return self.backend.count(self.prefix)
+
+
+class JobRegistry:
+    """Các lookup đang chạy (theo kind + email), thấy được từ mọi node.
+
+    Mỗi lần giữ chỗ có token riêng nên chỉ người giữ mới gỡ được; TTL bảo đảm
+    khóa tự mất nếu process chết giữa chừng.
+    """
+
+    def __init__(self, *, backend: StateBackend, name: str = "fetch"):
+        self.backend = backend
+        self.prefix = f"job:{name}:"
+
+    def claim(self, key: str, ttl: float) -> str | None:
+        token = uuid.uuid4().hex
+        if self.backend.add(self.prefix + key, {"token": token, "started": time.time()}, ttl=ttl):
+            return token
+        return None
+
+    def release(self, key: str, token: str) -> bool:
+        """Gỡ chỗ nếu vẫn là của `token`; chỗ của người khác giữ nguyên cả hạn TTL."""
+        return self.backend.delete_if(self.prefix + key, lambda state: bool(state) and state.get("token") == token)
+
+    def wait(self, key: str, timeout: float, poll: float = 0.2) -> bool:
+        """Chờ chỗ `key` được gỡ (hoặc hết TTL); False nếu sau `timeout` giây vẫn còn."""
+        end = time.monotonic() + max(0.0, timeout)
+        while self.backend.get(self.prefix + key) is not None:
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(poll, remaining))
+        return True
+
+    def __len__(self):
+        return self.backend.count(self.prefix)
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        *,
+        phone_rate: tuple[float, int],
+        email_rate: tuple[float, int],
+        ip_rate: tuple[float, int],
+        max_inflight: int,
+        slot_wait: float,
+        negative_ttl: float,
+        backend: StateBackend | None = None,
+    ):
+        self.backend = backend or MemoryBackend()
+        self.by_phone = TokenBucketLimiter(*phone_rate, backend=self.backend, name="phone")
+        self.by_email = TokenBucketLimiter(*email_rate, backend=self.backend, name="email")
+        self.by_ip = TokenBucketLimiter(*ip_rate, backend=self.backend, name="ip")
+        self.unknown_phones = NegativeCache(negative_ttl, backend=self.backend, name="phone")
+        self.jobs = JobRegistry(backend=self.backend)
+        self.max_inflight = max(1, int(max_inflight))
+        self.slot_wait = max(0.0, slot_wait)
+        self._slots = threading.BoundedSemaphore(self.max_inflight)
+        self._inflight = 0
+        self._counters: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    def reject(self, status: int, reason: str, message: str, retry_after: float = 0):
+        self._count(f"rejected.{reason}")
+        raise Rejected(status, reason, message, retry_after)
+
+    def check_client(self, ip: str):
+        allowed, retry_after = self.by_ip.allow(ip)
+        if not allowed:
+            self.reject(429, "ip_rate", "Quá nhiều yêu cầu, vui lòng thử lại sau.", retry_after)
+
+    def check_phone(self, phone: str):
+        allowed, retry_after = self.by_phone.allow(phone)
+        if not allowed:
+            self.reject(429, "phone_rate", "Số điện thoại này gửi quá nhiều yêu cầu, vui lòng thử lại sau.", retry_after)
+
+    def check_email(self, email: str):
+        """Chỉ gọi sau khi SĐT đã hợp lệ, để người đoán SĐT không làm cạn hạn mức email của khách."""
+        allowed, retry_after = self.by_email.allow(email)
+        if not allowed:
+            self.reject(429, "email_rate", "Email này gửi quá nhiều yêu cầu, vui lòng thử lại sau.", retry_after)
+
+    @contextmanager
+    def job(self, key: str, ttl: float, *, wait: float = 0.0):
+        """Giữ chỗ cho một lookup (cùng kind + email), thấy được từ mọi node.
+
+        Yield True khi request này chạy lookup. Nếu lookup trùng đang chạy: `wait` = 0
+        thì từ chối (429); ngược lại chờ lookup kia xong (tối đa `wait` giây) rồi
+        yield False để người gọi dùng lại kết quả của nó.
+        """
+        token = self.jobs.claim(key, ttl)
+        if token is None:
+            if wait <= 0:
+                self.reject(429, "in_progress", "Yêu cầu cho email này đang được xử lý, vui lòng chờ kết quả.", 5)
+            self._count("coalesced")
+            self.jobs.wait(key, wait)
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            self.jobs.release(key, token)
+
+    @contextmanager
+    def slot(self):
+        """Giữ một chỗ trong giới hạn lookup đồng thời; hết chỗ thì trả 503 ngay."""
+        if not self._slots.acquire(timeout=self.slot_wait):
+            self.reject(503, "overloaded", "Hệ thống đang bận, vui lòng thử lại sau ít giây.", 5)
+        with self._lock:
+            self._inflight += 1
+            self._counters["admitted"] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._inflight -= 1
+            self._slots.release()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            inflight = self._inflight
+        return {
+            "backend": self.backend.name,
+            "inflight": inflight,
+            "max_inflight": self.max_inflight,
+            "counters": counters,
+            "tracked_keys": {
+                "phone": len(self.by_phone),
+                "email": len(self.by_email),
+                "ip": len(self.by_ip),
+                "unknown_phones": len(self.unknown_phones),
+                "jobs": len(self.jobs),
+            },
+        }
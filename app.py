@@ -1,5 +1,6 @@
 from flask import (
     Flask,
+    Response,
     render_template,
     request,
     jsonify,
@@ -7,28 +8,147 @@ from flask import (
     url_for,
     session,
     flash,
+    send_file,
+    stream_with_context,
 )
+import click
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import func, or_, text
+from markupsafe import Markup
+from sqlalchemy import and_, case, func, or_, text, update
+from sqlalchemy import inspect as sa_inspect
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import validates
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timezone, timedelta, date
-from tuki_persistent import TukiPersistent
+import atexit
+import contextvars
+import csv
+import gc
 import importlib
+import inspect
+import io
+import json
+import logging
+import threading
+import time
 import config
 import re
+import static_assets
+import log_setup
+import chrome_procs
+from fetch_service import FetchServiceClient, create_local_pool
+from admission import AdmissionController, Rejected
+from state_backend import create_state_backend
+from fragment_cache import DataVersions, FragmentCache
+from circuit_breaker import CircuitBreaker, CircuitOpen
+from deadline import Deadline, DeadlineExceeded
+from profiling import Profiler
+from backup import BackupScheduler, backup_database
+from memdiag import KEY_TYPES, MemoryDiagnostics
+from scheduler import QUEUE_FULL_MSG, QueueFull
+
+log_setup.setup_logging()
+log = logging.getLogger("app")
 
 # Flask init
 app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = config.SQLALCHEMY_DATABASE_URI
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.secret_key = config.SECRET_KEY
+log_setup.init_app(app)
+static_assets.init_app(app)
 
 db = SQLAlchemy(app)
 
+profiler = Profiler(config.PROFILE_DIR)
+profiler.init_app(app, skip_endpoints=("static", "admin_profiling", "admin_profile_download"))
+
 
 def ensure_database():
     db.create_all()
+    _ensure_data_version_table()
     _ensure_email_nullable()
+    _ensure_customer_search_index()
+    _ensure_customer_status_column()
+    _ensure_query_indexes()
+    _ensure_wal_mode()
+    _ensure_customer_status_fresh()
+
+
+_data_version_checked = False
+
+
+def _ensure_data_version_table():
+    # bảng phiên bản của cache fragment /admin (xem fragment_cache.py)
+    global _data_version_checked
+    if _data_version_checked:
+        return
+    with db.engine.begin() as conn:
+        data_versions.ensure(conn)
+    _data_version_checked = True
+
+
+_query_indexes_checked = False
+
+
+def _ensure_query_indexes():
+    # create_all() không thêm index mới cho bảng đã tồn tại; mỗi process chỉ cần kiểm tra một lần
+    global _query_indexes_checked
+    if _query_indexes_checked:
+        return
+    with db.engine.begin() as conn:
+        conn.execute(
+            text(
+                "CREATE INDEX IF NOT EXISTS ix_activity_log_customer_created "
+                "ON activity_log (customer_id, created_at)"
+            )
+        )
+        # /api/fetch tra cứu theo lower(phone)/lower(email) → index biểu thức
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_customer_phone_lower ON customer (lower(phone))"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_customer_email_lower ON customer (lower(email))"))
+        # export nhật ký theo khoảng ngày
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_activity_log_created ON activity_log (created_at)"))
+        # lọc /admin theo trạng thái, trong mỗi trạng thái sắp theo ngày hết hạn
+        conn.execute(
+            text("CREATE INDEX IF NOT EXISTS ix_customer_status_expiry ON customer (status, expiry_date)")
+        )
+    _query_indexes_checked = True
+
+
+_status_column_checked = False
+
+
+def _ensure_customer_status_column():
+    # create_all() không thêm cột mới cho bảng đã tồn tại; dòng cũ nhận 'active'
+    # rồi được _ensure_customer_status_fresh() quét lại ngay sau đó
+    global _status_column_checked
+    if _status_column_checked:
+        return
+    columns = {column["name"] for column in sa_inspect(db.engine).get_columns("customer")}
+    if "status" not in columns:
+        with db.engine.begin() as conn:
+            conn.execute(text("ALTER TABLE customer ADD COLUMN status VARCHAR(16) NOT NULL DEFAULT 'active'"))
+        log.info("Đã thêm cột customer.status")
+    _status_column_checked = True
+
+
+_wal_checked = False
+
+
+def _ensure_wal_mode():
+    # WAL: export dài (đọc liên tục) không chặn các lệnh ghi nhật ký/khách hàng.
+    # Chế độ này lưu trong tệp DB nên chỉ cần đặt một lần.
+    global _wal_checked
+    if _wal_checked:
+        return
+    _wal_checked = True
+    if not config.SQLITE_WAL or db.engine.dialect.name != "sqlite":
+        return
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(text("PRAGMA journal_mode=WAL"))
+    except Exception:
+        log.warning("Không bật được WAL cho SQLite", exc_info=True)
 
 
 def _ensure_email_nullable():
@@ -74,10 +194,128 @@ def _ensure_email_nullable():
         conn.execute(text("DROP TABLE customers_old"))
 
 
+# Chỉ mục full-text (FTS5 trigram) cho ô tìm kiếm admin. Trigram cho phép tìm
+# chuỗi con/tiền tố không phân biệt hoa thường mà không phải quét toàn bảng.
+_customer_fts_ready: bool | None = None
+CUSTOMER_FTS_MIN_TERM = 3
+
+
+def _ensure_customer_search_index():
+    global _customer_fts_ready
+    if _customer_fts_ready is not None:
+        return _customer_fts_ready
+    if db.engine.dialect.name != "sqlite":
+        _customer_fts_ready = False
+        return False
+
+    try:
+        with db.engine.begin() as conn:
+            exists = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'customer_fts'")
+            ).first()
+            if not exists:
+                conn.execute(
+                    text(
+                        """
+                        CREATE VIRTUAL TABLE customer_fts USING fts5(
+                            email, phone, notes,
+                            content='customer', content_rowid='id',
+                            tokenize='trigram'
+                        )
+                        """
+                    )
+                )
+            conn.execute(
+                text(
+                    """
+                    CREATE TRIGGER IF NOT EXISTS customer_fts_ai AFTER INSERT ON customer BEGIN
+                        INSERT INTO customer_fts(rowid, email, phone, notes)
+                        VALUES (new.id, new.email, new.phone, new.notes);
+                    END
+                    """
+                )
+            )
+            conn.execute(
+                text(
+                    """
+                    CREATE TRIGGER IF NOT EXISTS customer_fts_ad AFTER DELETE ON customer BEGIN
+                        INSERT INTO customer_fts(customer_fts, rowid, email, phone, notes)
+                        VALUES ('delete', old.id, old.email, old.phone, old.notes);
+                    END
+                    """
+                )
+            )
+            conn.execute(
+                text(
+                    """
+                    CREATE TRIGGER IF NOT EXISTS customer_fts_au AFTER UPDATE OF email, phone, notes ON customer BEGIN
+                        INSERT INTO customer_fts(customer_fts, rowid, email, phone, notes)
+                        VALUES ('delete', old.id, old.email, old.phone, old.notes);
+                        INSERT INTO customer_fts(rowid, email, phone, notes)
+                        VALUES (new.id, new.email, new.phone, new.notes);
+                    END
+                    """
+                )
+            )
+            if not exists:
+                # Nạp dữ liệu có sẵn vào chỉ mục lần đầu
+                conn.execute(text("INSERT INTO customer_fts(customer_fts) VALUES ('rebuild')"))
+    except Exception as exc:
+        # SQLite biên dịch thiếu FTS5/trigram → quay về LIKE
+        log.warning("Không tạo được chỉ mục FTS, dùng LIKE", extra={"error": str(exc)})
+        _customer_fts_ready = False
+        return False
+
+    _customer_fts_ready = True
+    return True
+
+
+def _fts_match_expression(search: str):
+    """Cả chuỗi tìm kiếm thành một cụm trigram: khớp chuỗi con liền mạch, như LIKE '%...%'."""
+    if len(search) < CUSTOMER_FTS_MIN_TERM:
+        return None
+    return '"' + search.replace('"', '""') + '"'
+
+
+def _apply_customer_search(query, search: str, *, use_fts: bool = True):
+    """Lọc `query` theo email/SĐT/ghi chú (chuỗi con, không phân biệt hoa thường).
+
+    Dùng chỉ mục FTS khi có thể (kết quả xếp theo độ liên quan bm25); chuỗi
+    ngắn hơn 3 ký tự không tạo được trigram nên vẫn đi đường LIKE.
+    """
+    match_expr = _fts_match_expression(search) if use_fts and _customer_fts_ready else None
+    if match_expr:
+        fts_hits = (
+            text("SELECT rowid AS customer_id, rank FROM customer_fts WHERE customer_fts MATCH :match")
+            .bindparams(match=match_expr)
+            .columns(customer_id=db.Integer, rank=db.Float)
+            .subquery("fts_hits")
+        )
+        return query.join(fts_hits, fts_hits.c.customer_id == Customer.id).order_by(fts_hits.c.rank)
+
+    like_term = f"%{search.lower()}%"
+    return query.filter(
+        or_(
+            func.lower(Customer.email).like(like_term),
+            func.lower(Customer.phone).like(like_term),
+            func.lower(Customer.notes).like(like_term),
+        )
+    )
+
+
+# Regex/định dạng dùng lại ở nhiều request: biên dịch một lần khi import
+EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+_WHITESPACE_RE = re.compile(r"\s+")
+_EMAIL_LIST_SPLIT_RE = re.compile(r"[\s,;]+")
+_RESULT_CODE_RE = re.compile(r"(\d{3,6})")
+_RESULT_TIME_RE = re.compile(r"\w{3},\s\d{1,2}\s\w{3}\s\d{4}\s[\d:]+(?:\s\w+)?")
+TIMESTAMP_FORMATS = ("%a, %d %b %Y %H:%M:%S", "%a, %d %b %Y %H:%M:%S %Z", "%d/%m/%Y %H:%M:%S", "%Y-%m-%d %H:%M:%S")
+
+
 def _parse_timestamp_candidates(ts_raw: str):
     if not ts_raw:
         return "", ""
-    for fmt in ("%a, %d %b %Y %H:%M:%S", "%a, %d %b %Y %H:%M:%S %Z", "%d/%m/%Y %H:%M:%S", "%Y-%m-%d %H:%M:%S"):
+    for fmt in TIMESTAMP_FORMATS:
         try:
             dt = datetime.strptime(ts_raw, fmt)
             return ts_raw, dt.isoformat()
@@ -87,16 +325,26 @@ def _parse_timestamp_candidates(ts_raw: str):
 
 # === DATABASE MODEL ===
 class Customer(db.Model):
+    __table_args__ = (db.Index("ix_customer_status_expiry", "status", "expiry_date"),)
+
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(255), unique=True, nullable=True)
     phone = db.Column(db.String(50))
     expiry_date = db.Column(db.Date)
+    # active/expiring/expired theo ngày giờ Việt Nam: tính lại mỗi khi ghi
+    # expiry_date và mỗi ngày một lần (_sweep_customer_status)
+    status = db.Column(db.String(16), nullable=False, default="active", server_default="active")
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(
         db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow
     )
 
+    @validates("expiry_date")
+    def _sync_status(self, _key, value):
+        self.status = _evaluate_status(value)
+        return value
+
     @property
     def expiry_display(self):
         if not self.expiry_date:
@@ -105,6 +353,11 @@ class Customer(db.Model):
 
 
 class ActivityLog(db.Model):
+    __table_args__ = (
+        db.Index("ix_activity_log_customer_created", "customer_id", "created_at"),
+        db.Index("ix_activity_log_created", "created_at"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     customer_id = db.Column(db.Integer, index=True)
     requester_email = db.Column(db.String(255))
@@ -123,6 +376,25 @@ class ActivityLog(db.Model):
         return mapping.get(self.kind, self.kind or "Khác")
 
 
+class LookupResult(db.Model):
+    """Kết quả lookup thành công: dự phòng khi Tukitech chậm và để admin xem lại."""
+
+    __table_args__ = (
+        db.Index("ix_lookup_result_email_kind_fetched", "target_email", "kind", "fetched_at"),
+        db.Index("ix_lookup_result_fetched", "fetched_at"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    target_email = db.Column(db.String(255), nullable=False)
+    kind = db.Column(db.String(50), nullable=False)
+    code = db.Column(db.String(64))
+    verify_link = db.Column(db.Text)
+    content = db.Column(db.Text)
+    received_at_raw = db.Column(db.String(100))
+    received_at = db.Column(db.String(64))
+    fetched_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+
 def _parse_date(value: str):
     if not value:
         return None
@@ -132,18 +404,94 @@ def _parse_date(value: str):
         return None
 
 
+EXPIRING_DAYS = 3
+
+
 def _evaluate_status(expiry_date: date, today: date | None = None):
-    today = today or date.today()
+    today = today or _local_today()
     if not expiry_date:
         return "active"
     delta = (expiry_date - today).days
     if delta < 0:
         return "expired"
-    if delta <= 3:
+    if delta <= EXPIRING_DAYS:
         return "expiring"
     return "active"
 
 
+def _status_expression(today: date):
+    """Cùng quy tắc với _evaluate_status, dạng biểu thức SQL trên cột expiry_date."""
+    expiry = Customer.__table__.c.expiry_date
+    return case(
+        (expiry.is_(None), "active"),
+        (expiry < today, "expired"),
+        (expiry <= today + timedelta(days=EXPIRING_DAYS), "expiring"),
+        else_="active",
+    )
+
+
+_status_swept_on: date | None = None
+_status_sweep_lock = threading.Lock()
+
+
+def _sweep_customer_status(today: date | None = None) -> int:
+    """Cập nhật cột status theo ngày `today`; chỉ ghi những dòng đổi trạng thái.
+
+    Giữ nguyên updated_at: đổi trạng thái do qua ngày không phải là gia hạn.
+    """
+    global _status_swept_on
+    today = today or _local_today()
+    table = Customer.__table__
+    expected = _status_expression(today)
+    with _status_sweep_lock:
+        with db.engine.begin() as conn:
+            changed = conn.execute(
+                update(table).where(table.c.status != expected).values(status=expected, updated_at=table.c.updated_at)
+            ).rowcount
+            if changed:
+                data_versions.bump(conn, "customers")
+        _status_swept_on = today
+    if changed:
+        log.info("Đã cập nhật trạng thái khách hàng", extra={"day": today.isoformat(), "changed": changed})
+    return changed
+
+
+def _ensure_customer_status_fresh():
+    # luồng nền quét đúng lúc sang ngày; kiểm tra ở đây cho process chưa có luồng
+    # đó (CLI, process vừa khởi động) hoặc request tới ngay sau nửa đêm
+    if _status_swept_on != _local_today():
+        _sweep_customer_status()
+
+
+def _seconds_until_local_midnight(now: datetime | None = None) -> float:
+    now = now or datetime.now(LOCAL_TZ)
+    tomorrow = datetime.combine(now.date() + timedelta(days=1), datetime.min.time(), tzinfo=LOCAL_TZ)
+    return (tomorrow - now).total_seconds()
+
+
+_status_sweeper_started = False
+
+
+def _start_status_sweeper():
+    """Luồng nền quét trạng thái ngay sau 00:00 giờ Việt Nam mỗi ngày."""
+    global _status_sweeper_started
+    with _status_sweep_lock:
+        if _status_sweeper_started or not config.STATUS_SWEEP_DAILY:
+            return
+        _status_sweeper_started = True
+
+    def loop():
+        while True:
+            time.sleep(_seconds_until_local_midnight() + 1)
+            try:
+                with app.app_context():
+                    _sweep_customer_status()
+            except Exception:
+                log.exception("Quét trạng thái khách hàng lỗi")
+
+    threading.Thread(target=loop, name="status-sweep", daemon=True).start()
+
+
 def _status_meta(status: str):
     mapping = {
         "active": {"label": "Còn hạn", "badge": "status-pill-active", "row": "status-row-active"},
@@ -153,6 +501,134 @@ def _status_meta(status: str):
     return mapping.get(status, mapping["active"])
 
 
+class CustomerRow:
+    """Bản ghi chỉ đọc cho dashboard/export, không gắn với session ORM."""
+
+    __slots__ = (
+        "id", "email", "phone", "notes", "expiry_display", "expiry_value",
+        "status", "status_label", "status_badge", "row_class",
+        "created_at", "updated_at", "days_remaining",
+        "phone_email_count", "has_multiple_emails",
+    )
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            setattr(self, name, values.get(name))
+
+
+def _memo_format(fmt: str, empty: str = ""):
+    """strftime có nhớ: mỗi giá trị khác nhau chỉ format một lần trong một lượt."""
+    cache: dict = {}
+
+    def format_value(value):
+        if value is None:
+            return empty
+        text_value = cache.get(value)
+        if text_value is None:
+            text_value = cache[value] = value.strftime(fmt)
+        return text_value
+
+    return format_value
+
+
+CUSTOMER_ROW_COLUMNS = (
+    Customer.id,
+    Customer.email,
+    Customer.phone,
+    Customer.expiry_date,
+    Customer.status,
+    Customer.notes,
+    Customer.created_at,
+    Customer.updated_at,
+)
+CUSTOMER_STATUSES = ("active", "expiring", "expired")
+
+
+def _customer_rows(search: str = "", status_filter: str = "all"):
+    """Truy vấn chỉ lấy cột (Row tuple), không tạo đối tượng Customer/identity map."""
+    query = db.session.query(*CUSTOMER_ROW_COLUMNS)
+    if status_filter in CUSTOMER_STATUSES:
+        query = query.filter(Customer.status == status_filter)
+    if search:
+        query = _apply_customer_search(query, search)
+    return query.order_by(Customer.expiry_date.is_(None), Customer.expiry_date, Customer.email)
+
+
+def _customer_status_counts(search: str = "") -> dict[str, int]:
+    counts = dict.fromkeys(CUSTOMER_STATUSES, 0)
+    query = db.session.query(Customer.status, func.count(Customer.id))
+    if search:
+        query = _apply_customer_search(query, search)
+    for status, count in query.group_by(Customer.status).order_by(None):
+        counts[status] = counts.get(status, 0) + count
+    return counts
+
+
+def _phone_email_counts() -> dict[str, int]:
+    counts: dict[str, int] = {}
+    rows = (
+        db.session.query(Customer.phone, func.count(Customer.id))
+        .filter(Customer.email.isnot(None), Customer.email != "")
+        .group_by(Customer.phone)
+    )
+    for phone_value, count in rows:
+        normalized_phone = _normalize_phone(phone_value)
+        if normalized_phone:
+            counts[normalized_phone] = count
+    return counts
+
+
+def _build_customer_views(rows, *, today: date, phone_email_counts: dict[str, int]):
+    """Dựng danh sách SĐT/email cho dashboard từ Row; trả về (customers, emails).
+
+    Một CustomerRow dùng chung cho cả hai bảng; ngày giờ được format qua bộ nhớ
+    đệm nên ngày hết hạn lặp lại nhiều lần chỉ strftime một lần.
+    """
+    fmt_expiry = _memo_format("%d/%m/%Y", "Không thiết lập")
+    fmt_expiry_value = _memo_format("%Y-%m-%d")
+    fmt_stamp = _memo_format("%d/%m/%Y %H:%M")
+    status_cache: dict = {}
+
+    customers_view = []
+    emails_view = []
+
+    for cid, email, phone, expiry_date, status, notes, created_at, updated_at in rows:
+        cached = status_cache.get((status, expiry_date))
+        if cached is None:
+            days_remaining = (expiry_date - today).days if expiry_date else None
+            cached = status_cache[status, expiry_date] = (_status_meta(status), days_remaining)
+        meta, days_remaining = cached
+
+        normalized_phone = _normalize_phone(phone)
+        if not email and not normalized_phone:
+            continue
+
+        email_usage_count = phone_email_counts.get(normalized_phone, 0)
+        row = CustomerRow(
+            id=cid,
+            email=email or "",
+            phone=phone or "",
+            notes=notes or "",
+            expiry_display=fmt_expiry(expiry_date),
+            expiry_value=fmt_expiry_value(expiry_date),
+            status=status,
+            status_label=meta["label"],
+            status_badge=meta["badge"],
+            row_class=meta["row"],
+            created_at=fmt_stamp(created_at),
+            updated_at=fmt_stamp(updated_at),
+            days_remaining=days_remaining,
+            phone_email_count=email_usage_count,
+            has_multiple_emails=email_usage_count > 1,
+        )
+        if email:
+            emails_view.append(row)
+        if normalized_phone:
+            customers_view.append(row)
+
+    return customers_view, emails_view
+
+
 def _safe_next(target: str | None):
     if not target:
         return url_for("admin")
@@ -166,7 +642,7 @@ def _normalize_email(value: str):
 
 
 def _normalize_phone(value: str):
-    return re.sub(r"\s+", "", (value or "").strip())
+    return _WHITESPACE_RE.sub("", (value or "").strip())
 
 
 def _log_activity(customer_id: int | None, *, requester_email: str, target_email: str, kind: str, success: bool, message: str):
@@ -180,10 +656,73 @@ def _log_activity(customer_id: int | None, *, requester_email: str, target_email
             message=message or "",
         )
         db.session.add(entry)
+        data_versions.bump(db.session, "activity")
         db.session.commit()
     except Exception:
         db.session.rollback()
-        print("[ActivityLog] Không thể lưu nhật ký", flush=True)
+        log.exception("Không thể lưu nhật ký hoạt động", extra={"customer_id": customer_id, "kind": kind})
+        return
+    _notify_activity()
+
+
+# Đánh thức các luồng SSE khi có nhật ký mới trong cùng process; các process
+# khác được phát hiện qua polling định kỳ.
+_activity_changed = threading.Condition()
+ACTIVITY_STREAM_POLL_SECONDS = 10
+# Mỗi stream giữ một luồng worker: đóng sau chừng này giây để trình duyệt nối
+# lại (retry), và giới hạn số stream mỗi process để không lấn /api/fetch
+ACTIVITY_STREAM_MAX_SECONDS = 50
+_activity_stream_slots = threading.BoundedSemaphore(config.ACTIVITY_STREAM_MAX_CLIENTS)
+
+
+def _notify_activity():
+    with _activity_changed:
+        _activity_changed.notify_all()
+
+
+def _activity_feed(since_id: int | None = None, limit: int = 100):
+    """Nhật ký mới nhất (mới → cũ) kèm SĐT khách hàng trong một truy vấn.
+
+    Với `since_id`, chỉ trả các bản ghi có id lớn hơn, tối đa `limit` bản ghi
+    liền sau con trỏ để client gọi tiếp không bị hụt.
+    """
+    query = db.session.query(ActivityLog, Customer.phone).outerjoin(
+        Customer, Customer.id == ActivityLog.customer_id
+    )
+    if since_id is not None:
+        rows = query.filter(ActivityLog.id > since_id).order_by(ActivityLog.id).limit(limit).all()
+        rows.reverse()
+    else:
+        rows = query.order_by(ActivityLog.created_at.desc(), ActivityLog.id.desc()).limit(limit).all()
+
+    return [
+        {
+            "id": log.id,
+            "phone": phone or "—",
+            "requester": log.requester_email or "—",
+            "target": log.target_email or "—",
+            "kind": log.kind_label,
+            "success": log.success,
+            "message": log.message or ("Thành công" if log.success else "Thất bại"),
+            "created_at": _format_local_time(log.created_at),
+        }
+        for log, phone in rows
+    ]
+
+
+LOCAL_TZ = timezone(timedelta(hours=7))
+
+
+def _local_today() -> date:
+    # hạn dùng tính theo ngày Việt Nam, không theo múi giờ của server
+    return datetime.now(LOCAL_TZ).date()
+
+
+def _local_iso(value: datetime | None) -> str:
+    """created_at/updated_at lưu UTC (naive) → ISO 8601 theo giờ Việt Nam."""
+    if not value:
+        return ""
+    return value.replace(tzinfo=timezone.utc).astimezone(LOCAL_TZ).isoformat(timespec="seconds")
 
 
 def _format_local_time(value: datetime, tz_offset_hours: int = 7) -> str:
@@ -197,7 +736,51 @@ def _format_local_time(value: datetime, tz_offset_hours: int = 7) -> str:
         return value.strftime("%d/%m/%Y %H:%M")
 
 
-def _login_tv(password: str, code: str):
+def _call_with_deadline(func, deadline: Deadline, *, on_finish=None, **kwargs):
+    """Chạy backend tùy biến trong luồng riêng, bỏ chờ khi hết ngân sách.
+
+    Backend nhận tham số `deadline` thì được truyền Deadline để tự giới hạn các
+    bước chờ bên trong. `on_finish` được gọi khi backend thật sự chạy xong, kể cả
+    khi người gọi đã bỏ chờ vì hết deadline.
+    """
+    try:
+        if "deadline" in inspect.signature(func).parameters:
+            kwargs["deadline"] = deadline
+    except (TypeError, ValueError):
+        pass
+
+    outcome = {}
+
+    def run():
+        try:
+            try:
+                outcome["value"] = func(**kwargs)
+            except TypeError:
+                outcome["value"] = func(*kwargs.values())
+        except Exception as exc:  # pragma: no cover - bảo vệ backend tùy biến
+            outcome["error"] = exc
+        finally:
+            if on_finish is not None:
+                on_finish()
+
+    worker = threading.Thread(target=run, name="login-tv-backend", daemon=True)
+    with deadline.stage("backend"):
+        try:
+            worker.start()
+        except RuntimeError:
+            if on_finish is not None:
+                on_finish()
+            raise
+        worker.join(deadline.remaining())
+    if worker.is_alive():
+        raise DeadlineExceeded(deadline)
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome.get("value")
+
+
+def _login_tv(password: str, code: str, deadline: Deadline | None = None):
+    deadline = Deadline.coerce(deadline, config.FETCH_DEADLINES["login_tv"], label="login_tv")
     password = (password or "").strip()
     code = (code or "").strip()
 
@@ -221,11 +804,26 @@ def _login_tv(password: str, code: str):
     if not func:
         return {"success": False, "message": "Backend LOGINTV chưa cung cấp hàm đăng nhập TV."}
 
-    try:
+    # backend đăng nhập TV mở trình duyệt trong process này → nếu process tự giữ nhóm
+    # phiên Chrome thì xin chỗ ở lớp admin của nhóm. Chỗ chỉ được trả khi luồng
+    # backend chạy xong, kể cả khi request đã bỏ chờ vì hết deadline.
+    scheduler = getattr(_worker, "scheduler", None)
+    on_finish = None
+    if scheduler is not None:
         try:
-            response = func(password=password, code=code)
-        except TypeError:
-            response = func(password, code)
+            scheduler.acquire("admin", "login_tv", deadline)
+        except QueueFull:
+            return {"success": False, "message": QUEUE_FULL_MSG, "error": "queue_full"}
+        except DeadlineExceeded:
+            return deadline.exceeded_result()
+
+        def on_finish():
+            scheduler.release("admin")
+
+    try:
+        response = _call_with_deadline(func, deadline, on_finish=on_finish, password=password, code=code)
+    except DeadlineExceeded:
+        return deadline.exceeded_result()
     except Exception as exc:  # pragma: no cover - bảo vệ backend tùy biến
         return {"success": False, "message": f"Lỗi khi đăng nhập TV: {exc}"}
 
@@ -247,17 +845,253 @@ def _login_tv(password: str, code: str):
     }
 
 # === WORKER (KEEP CHROME ALIVE) ===
+# Có FETCH_SERVICE_URL: mọi worker web dùng chung dịch vụ fetch (fetch_service.py).
+# Không có: process này tự giữ nhóm phiên Chrome như trước.
 _worker = None
+_worker_lock = threading.Lock()
 
 def ensure_worker():
     global _worker
     if _worker is None:
-        headless = getattr(config, "TUKI_HEADLESS", True)
-        print(f"⚙️  Khởi tạo phiên Tukitech ... (headless={headless})")
-        _worker = TukiPersistent(headless=headless)
+        with _worker_lock:
+            if _worker is None:
+                if config.FETCH_SERVICE_URL:
+                    _worker = FetchServiceClient(config.FETCH_SERVICE_URL, timeout=config.FETCH_SERVICE_TIMEOUT)
+                else:
+                    chrome_procs.start_reaper(config.TUKI_REAP_INTERVAL)
+                    pool = create_local_pool()
+                    atexit.register(pool.close)  # tắt app → quit Chrome, không để lại process
+                    pool.warm()
+                    _worker = pool
     return _worker
 
 
+def _scheduler_snapshot():
+    """Số liệu hàng đợi ưu tiên của nhóm phiên (None khi chưa có worker hoặc dịch vụ không trả lời)."""
+    worker = _worker
+    if worker is None:
+        return None
+    try:
+        return worker.stats().get("scheduler")
+    except Exception:
+        return None
+
+
+# === SHARED STATE ===
+state_backend = create_state_backend(config.STATE_BACKEND)
+data_versions = DataVersions()
+fragment_cache = FragmentCache(
+    config.ADMIN_FRAGMENT_CACHE_SIZE, max_bytes=int(config.ADMIN_FRAGMENT_CACHE_MB * 1024 * 1024)
+)
+
+
+# === MEMORY DIAGNOSTICS ===
+def _identity_map_sizes() -> dict:
+    # mọi Session còn sống (mỗi luồng một scoped session), không chỉ của request hiện tại
+    from sqlalchemy.orm import session as orm_session
+
+    sessions = list(getattr(orm_session, "_sessions", {}).values())
+    return {"sessions": len(sessions), "objects": sum(len(s.identity_map) for s in sessions)}
+
+
+memory_diagnostics = MemoryDiagnostics(config.MEMDIAG_SAMPLE_SECONDS, config.MEMDIAG_HISTORY)
+memory_diagnostics.register("admin_fragment_cache", lambda: fragment_cache.snapshot())
+memory_diagnostics.register("state_backend", lambda: {"backend": state_backend.name, "keys": state_backend.count("")})
+memory_diagnostics.register("admission", lambda: admission.snapshot()["tracked_keys"])
+memory_diagnostics.register("static_assets", static_assets.cache_stats)
+memory_diagnostics.register("sqlalchemy_identity_map", _identity_map_sizes)
+if config.MEMDIAG_TRACEMALLOC:
+    memory_diagnostics.start_tracing()
+
+
+# === ADMISSION CONTROL ===
+admission = AdmissionController(
+    phone_rate=config.FETCH_RATE_PHONE,
+    email_rate=config.FETCH_RATE_EMAIL,
+    ip_rate=config.FETCH_RATE_IP,
+    max_inflight=config.FETCH_MAX_INFLIGHT,
+    slot_wait=config.FETCH_SLOT_WAIT,
+    negative_ttl=config.FETCH_UNKNOWN_PHONE_TTL,
+    backend=state_backend,
+)
+
+
+tuki_breaker = CircuitBreaker(
+    failure_threshold=config.TUKI_BREAKER_FAILURES,
+    window=config.TUKI_BREAKER_WINDOW,
+    recovery_timeout=config.TUKI_BREAKER_RECOVERY,
+    slow_call_seconds=config.TUKI_BREAKER_SLOW,
+)
+BACKEND_UNAVAILABLE_MSG = "Hệ thống lấy mã đang gián đoạn, vui lòng thử lại sau ít phút."
+
+
+def _fetch_with_breaker(worker, *, email: str, kind: str, deadline: Deadline, priority: str = "customer", key: str = ""):
+    """Gọi worker.fetch qua circuit breaker; lỗi kỹ thuật/timeout được ghi nhận.
+
+    Hàng đợi ưu tiên nằm trong nhóm phiên (SessionPool, tại chỗ hoặc trong dịch vụ
+    fetch): admin (đăng nhập TV, tra cứu hỗ trợ) > khách (chia đều theo `key`, tức
+    SĐT) > làm mới nền. Lookup không tới được Tukitech vì hàng đợi (hàng đầy, hết
+    deadline khi còn chờ) không tính đúng/sai cho breaker; hàng đầy trả 503.
+    """
+    tuki_breaker.before_call()
+    started = time.monotonic()
+    try:
+        result = worker.fetch(email=email, kind=kind, deadline=deadline, priority=priority, key=key or email.lower())
+    except DeadlineExceeded:
+        tuki_breaker.record(False, time.monotonic() - started, error="DeadlineExceeded")
+        return deadline.exceeded_result(kind=kind)
+    except Exception as exc:
+        tuki_breaker.record(False, time.monotonic() - started, error=str(exc))
+        raise
+    error = result.get("error") if isinstance(result, dict) else None
+    if error == "queue_full":
+        tuki_breaker.cancel()
+        raise Rejected(503, "queue_full", QUEUE_FULL_MSG, 5)
+    if error == "DeadlineExceeded" and (result.get("deadline") or {}).get("stage") == "queue":
+        tuki_breaker.cancel()
+        return result
+    tuki_breaker.record(not error, time.monotonic() - started, error=(result.get("message") if error else ""))
+    return result
+
+
+# === LOOKUP HISTORY ===
+LOOKUP_CONTENT_MAX_CHARS = 4000
+LOOKUP_HISTORY_PURGE_EVERY = 500
+_lookup_writes = 0
+
+
+def _result_fields(result: dict) -> dict:
+    """Các trường hiển thị của một kết quả worker (dict)."""
+    return {
+        "code": (result.get("code") or result.get("result") or "").strip(),
+        "content": result.get("content") or "",
+        "verify_link": result.get("verify_link") or result.get("link") or "",
+        "received_at_raw": result.get("received_at_raw") or result.get("timestamp") or "",
+        "received_at": result.get("received_at") or result.get("timestamp_iso") or "",
+    }
+
+
+def _record_lookup_result(email: str, kind: str, *, code: str, content: str, verify_link: str,
+                          received_at_raw: str, received_at: str):
+    global _lookup_writes
+    if not (code or verify_link or content):
+        return
+    try:
+        db.session.add(
+            LookupResult(
+                target_email=email.strip().lower(),
+                kind=kind,
+                code=(code or "")[:64],
+                verify_link=verify_link or "",
+                content=(content or "")[:LOOKUP_CONTENT_MAX_CHARS],
+                received_at_raw=(received_at_raw or "")[:100],
+                received_at=(received_at or "")[:64],
+            )
+        )
+        data_versions.bump(db.session, "lookups")
+        db.session.commit()
+        _lookup_writes += 1
+        if _lookup_writes % LOOKUP_HISTORY_PURGE_EVERY == 0:
+            cutoff = datetime.utcnow() - timedelta(days=config.LOOKUP_HISTORY_DAYS)
+            LookupResult.query.filter(LookupResult.fetched_at < cutoff).delete(synchronize_session=False)
+            data_versions.bump(db.session, "lookups")
+            db.session.commit()
+    except Exception:
+        db.session.rollback()
+        log.exception("Không thể lưu lịch sử lookup", extra={"kind": kind, "email": email})
+
+
+def _latest_lookup_result(email: str, kind: str, max_age: float) -> LookupResult | None:
+    if max_age <= 0:
+        return None
+    cutoff = datetime.utcnow() - timedelta(seconds=max_age)
+    return (
+        LookupResult.query.filter(
+            LookupResult.target_email == email.strip().lower(),
+            LookupResult.kind == kind,
+            LookupResult.fetched_at >= cutoff,
+        )
+        .order_by(LookupResult.fetched_at.desc())
+        .first()
+    )
+
+
+def _latest_lookups_per_email(search: str = "", limit: int = 50) -> list[dict]:
+    """Kết quả mới nhất cho mỗi (email, loại), mới → cũ."""
+    latest = db.session.query(func.max(LookupResult.id).label("id")).group_by(
+        LookupResult.target_email, LookupResult.kind
+    )
+    if search:
+        latest = latest.filter(LookupResult.target_email.contains(search.lower()))
+    latest = latest.subquery()
+    rows = (
+        db.session.query(
+            LookupResult.target_email,
+            LookupResult.kind,
+            LookupResult.code,
+            LookupResult.verify_link,
+            LookupResult.received_at_raw,
+            LookupResult.fetched_at,
+        )
+        .join(latest, LookupResult.id == latest.c.id)
+        .order_by(LookupResult.id.desc())
+        .limit(limit)
+        .all()
+    )
+    return [
+        {
+            "email": row.target_email,
+            "kind": row.kind,
+            "code": row.code or "",
+            "verify_link": row.verify_link or "",
+            "received_at_raw": row.received_at_raw or "",
+            "fetched_at": _format_local_time(row.fetched_at),
+        }
+        for row in rows
+    ]
+
+
+def _refresh_lookup_in_background(email: str, kind: str):
+    """Làm mới kết quả sau khi đã trả bản cũ; lookup trùng hoặc breaker mở thì bỏ qua."""
+
+    def run():
+        deadline = Deadline(config.FETCH_DEADLINES.get(kind, 50), label=kind)
+        try:
+            with admission.job(f"{kind}:{email.lower()}", ttl=deadline.remaining() + 5), admission.slot():
+                result = _fetch_with_breaker(
+                    ensure_worker(), email=email, kind=kind, deadline=deadline, priority="background"
+                )
+        except (Rejected, CircuitOpen):
+            return
+        except Exception:
+            log.exception("Làm mới kết quả lookup lỗi", extra={"kind": kind, "email": email})
+            return
+        if isinstance(result, str):
+            result = {"success": True, "content": result}
+        ok = result.get("success") is not False
+        log.info("Làm mới kết quả lookup", extra={"kind": kind, "email": email, "success": ok})
+        if ok:
+            with app.app_context():
+                _record_lookup_result(email, kind, **_result_fields(result))
+
+    ctx = contextvars.copy_context()  # giữ request_id trong log của luồng nền
+    threading.Thread(target=ctx.run, args=(run,), name="lookup-refresh", daemon=True).start()
+
+
+def _client_ip():
+    if config.TRUST_PROXY_HEADERS and request.access_route:
+        return request.access_route[0]
+    return request.remote_addr or ""
+
+
+def _rejected_response(exc: Rejected):
+    response = jsonify({"success": False, "message": exc.message})
+    response.status_code = exc.status
+    if exc.retry_after:
+        response.headers["Retry-After"] = str(max(1, int(exc.retry_after + 0.999)))
+    return response
+
+
 # === ROUTES ===
 @app.route('/')
 def index():
@@ -277,151 +1111,87 @@ def admin():
 
     ensure_database()
 
-    today = date.today()
+    today = _local_today()
 
     search = (request.args.get('q') or '').strip()
     status_filter = request.args.get('status', 'all')
 
-    # Pre-compute how many emails are associated with each phone number so that the
-    # UI can highlight potential abuse cases (many emails mapped to one phone).
-    phone_email_counts: dict[str, int] = {}
-    email_usage_rows = (
-        db.session.query(Customer.phone, func.count(Customer.id))
-        .filter(Customer.email.isnot(None), Customer.email != "")
-        .group_by(Customer.phone)
-        .all()
-    )
-    for phone_value, count in email_usage_rows:
-        normalized_phone = _normalize_phone(phone_value)
-        if not normalized_phone:
-            continue
-        phone_email_counts[normalized_phone] = count
+    next_url = request.full_path.rstrip('?')
 
-    query = Customer.query
-    if search:
-        like_term = f"%{search.lower()}%"
-        query = query.filter(
-            or_(
-                func.lower(Customer.email).like(like_term),
-                func.lower(Customer.phone).like(like_term),
-                func.lower(Customer.notes).like(like_term),
-            )
+    # Các khối HTML nặng được cache theo phiên bản dữ liệu: admin_manage/admin_import
+    # tăng "customers", mỗi nhật ký mới tăng "activity". Trạng thái hạn phụ thuộc
+    # ngày hiện tại nên ngày cũng nằm trong khóa.
+    versions = data_versions.get_many(db.session, "customers", "activity", "lookups")
+    customers_version = versions["customers"]
+    stats_key = (customers_version, today, search)
+    table_key = (customers_version, today, search, status_filter, next_url)
+    stats_html = fragment_cache.get("stats", stats_key)
+    table_html = fragment_cache.get("customers", table_key)
+
+    if stats_html is None or table_html is None:
+        # Pre-compute how many emails are associated with each phone number so that the
+        # UI can highlight potential abuse cases (many emails mapped to one phone).
+        phone_email_counts = _phone_email_counts()
+
+        counts = _customer_status_counts(search)
+        customers_view, emails_view = _build_customer_views(
+            _customer_rows(search, status_filter),
+            today=today,
+            phone_email_counts=phone_email_counts,
         )
-
-    customers = query.order_by(Customer.expiry_date.is_(None), Customer.expiry_date, Customer.email).all()
-
-    total_customers = 0
-    counts = {"active": 0, "expiring": 0, "expired": 0}
-    customers_view = []
-    emails_view = []
-
-    for customer in customers:
-        status = _evaluate_status(customer.expiry_date, today)
-        counts[status] += 1
-        total_customers += 1
-
-        meta = _status_meta(status)
-        days_remaining = None
-        if customer.expiry_date:
-            days_remaining = (customer.expiry_date - today).days
-
-        normalized_phone = _normalize_phone(customer.phone)
-        email_usage_count = phone_email_counts.get(normalized_phone, 0)
-
-        if status_filter != 'all' and status != status_filter:
-            continue
-
-        if customer.email:
-            emails_view.append(
-                {
-                    "id": customer.id,
-                    "email": customer.email,
-                    "phone": customer.phone or "",
-                    "expiry_display": customer.expiry_display,
-                    "status_label": meta["label"],
-                    "status_badge": meta["badge"],
-                    "notes": customer.notes or "",
-                    "created_at": customer.created_at.strftime("%d/%m/%Y %H:%M"),
-                    "updated_at": customer.updated_at.strftime("%d/%m/%Y %H:%M") if customer.updated_at else "",
-                }
-            )
-
-        if not normalized_phone:
-            continue
-
-        customers_view.append(
-            {
-                "id": customer.id,
-                "email": customer.email or "",
-                "phone": customer.phone or "",
-                "expiry_display": customer.expiry_display,
-                "expiry_value": customer.expiry_date.strftime("%Y-%m-%d") if customer.expiry_date else "",
-                "status": status,
-                "status_label": meta["label"],
-                "status_badge": meta["badge"],
-                "row_class": meta["row"],
-                "notes": customer.notes or "",
-                "created_at": customer.created_at.strftime("%d/%m/%Y %H:%M"),
-                "updated_at": customer.updated_at.strftime("%d/%m/%Y %H:%M") if customer.updated_at else "",
-                "days_remaining": days_remaining,
-                "phone_email_count": email_usage_count,
-                "has_multiple_emails": email_usage_count > 1,
-            }
+        total_customers = sum(counts.values())
+
+        recent_threshold = datetime.utcnow() - timedelta(days=30)
+        recent_updates = Customer.query.filter(Customer.updated_at >= recent_threshold).count()
+        renewal_rate = 0
+        if total_customers:
+            renewal_rate = round((recent_updates / total_customers) * 100, 1)
+
+        stats = {
+            "total": total_customers,
+            "active": counts['active'],
+            "expiring": counts['expiring'],
+            "expired": counts['expired'],
+            "renewal_rate": renewal_rate,
+        }
+        stats_html = render_template('_admin_stats.html', stats=stats)
+        table_html = render_template(
+            '_admin_customers.html',
+            customers=customers_view,
+            emails=emails_view,
+            search=search,
+            status_filter=status_filter,
+            next_url=next_url,
         )
-
-    active_customers = counts['active']
-    expiring_customers = counts['expiring']
-    expired_customers = counts['expired']
-
-    recent_threshold = datetime.utcnow() - timedelta(days=30)
-    recent_updates = Customer.query.filter(Customer.updated_at >= recent_threshold).count()
-    renewal_rate = 0
-    if total_customers:
-        renewal_rate = round((recent_updates / total_customers) * 100, 1)
-
-    stats = {
-        "total": total_customers,
-        "active": active_customers,
-        "expiring": expiring_customers,
-        "expired": expired_customers,
-        "renewal_rate": renewal_rate,
-    }
+        fragment_cache.put("stats", stats_key, stats_html)
+        fragment_cache.put("customers", table_key, table_html)
 
     # Lấy nhật ký hoạt động gần đây (tối đa 100 bản ghi)
-    recent_logs = (
-        ActivityLog.query.order_by(ActivityLog.created_at.desc()).limit(100).all()
+    activity_html = fragment_cache.get_or_render(
+        "activity",
+        (versions["activity"], customers_version),
+        lambda: render_template('_admin_activity.html', recent_activities=_activity_feed(limit=100)),
+    )
+    lookups_html = fragment_cache.get_or_render(
+        "lookups",
+        (versions["lookups"], search),
+        lambda: render_template('_admin_lookups.html', lookups=_latest_lookups_per_email(search), search=search),
     )
-    log_customer_ids = [log.customer_id for log in recent_logs if log.customer_id]
-    phone_map = {}
-    if log_customer_ids:
-        related_customers = Customer.query.filter(Customer.id.in_(log_customer_ids)).all()
-        phone_map = {c.id: c.phone for c in related_customers}
-
-    recent_activities = [
-        {
-            "id": log.id,
-            "phone": phone_map.get(log.customer_id, "—"),
-            "requester": log.requester_email or "—",
-            "target": log.target_email or "—",
-            "kind": log.kind_label,
-            "success": log.success,
-            "message": log.message or ("Thành công" if log.success else "Thất bại"),
-            "created_at": _format_local_time(log.created_at),
-
-        }
-        for log in recent_logs
-    ]
-
-    next_url = request.full_path.rstrip('?')
 
     return render_template(
         'admin.html',
-        customers=customers_view,
-        emails=emails_view,
-        stats=stats,
+        fragments={
+            "stats": Markup(stats_html),
+            "customers": Markup(table_html),
+            "activity": Markup(activity_html),
+            "lookups": Markup(lookups_html),
+        },
         search=search,
         status_filter=status_filter,
-        recent_activities=recent_activities,
+        backend_status=tuki_breaker.snapshot(),
+        chrome=chrome_procs.gauge(),
+        profiling=profiler.snapshot(),
+        profiling_endpoints=sorted({rule.endpoint for rule in app.url_map.iter_rules()} - {"static"}),
         next_url=next_url,
     )
 
@@ -435,41 +1205,222 @@ def api_login_tv():
     password = (payload.get('password') or '').strip()
     code = (payload.get('code') or '').strip()
 
-    result = _login_tv(password=password, code=code)
+    result = _login_tv(password=password, code=code, deadline=Deadline(config.FETCH_DEADLINES["login_tv"], label="login_tv"))
     success = bool(result.get("success"))
     message = result.get("message") or ("Đăng nhập thành công." if success else "Mã sai, vui lòng nhập lại.")
 
+    if result.get("error") == "DeadlineExceeded":
+        return jsonify({"success": False, "message": message, "error": "DeadlineExceeded", "deadline": result.get("deadline")}), 504
     return jsonify({"success": success, "message": message, "raw": result})
 
 
-@app.route('/admin/activity/<int:customer_id>')
-def admin_activity(customer_id: int):
+@app.route('/admin/activity/feed')
+def admin_activity_feed():
     if not session.get('is_admin'):
         return jsonify({"success": False, "message": "Chưa đăng nhập."}), 403
 
     ensure_database()
 
-    logs = (
-        ActivityLog.query.filter(ActivityLog.customer_id == customer_id)
-        .order_by(ActivityLog.created_at.desc())
-        .limit(100)
+    since_id = _parse_cursor(request.args.get('since'))
+    entries = _activity_feed(since_id=since_id)
+    last_id = entries[0]["id"] if entries else since_id
+    return jsonify({"success": True, "entries": entries, "last_id": last_id})
+
+
+@app.route('/admin/activity/stream')
+def admin_activity_stream():
+    if not session.get('is_admin'):
+        return jsonify({"success": False, "message": "Chưa đăng nhập."}), 403
+
+    if not _activity_stream_slots.acquire(blocking=False):
+        # EventSource dừng hẳn khi nhận mã khác 200 → app.js chuyển sang polling /admin/activity/feed
+        response = jsonify({"success": False, "message": "Quá nhiều trang admin đang mở luồng nhật ký."})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(ACTIVITY_STREAM_MAX_SECONDS)
+        return response
+
+    try:
+        ensure_database()
+        # EventSource tự gửi Last-Event-ID khi kết nối lại
+        since_id = _parse_cursor(request.headers.get('Last-Event-ID')) or _parse_cursor(request.args.get('since'))
+        if since_id is None:
+            since_id = db.session.query(func.max(ActivityLog.id)).scalar() or 0
+        db.session.close()
+    except BaseException:
+        _activity_stream_slots.release()
+        raise
+
+
+    def generate(last_id: int):
+        # Đóng stream định kỳ để không giữ luồng worker mãi; trình duyệt tự nối lại
+        stream_deadline = time.monotonic() + ACTIVITY_STREAM_MAX_SECONDS
+        yield "retry: 3000\n\n"
+        while time.monotonic() < stream_deadline:
+            entries = _activity_feed(since_id=last_id)
+            db.session.close()
+            if entries:
+                last_id = entries[0]["id"]
+                data = json.dumps(entries, ensure_ascii=False)
+                yield f"id: {last_id}\nevent: activity\ndata: {data}\n\n"
+                continue
+            with _activity_changed:
+                woke = _activity_changed.wait(timeout=ACTIVITY_STREAM_POLL_SECONDS)
+            if not woke:
+                yield ": ping\n\n"
+
+    response = Response(stream_with_context(generate(since_id)), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.call_on_close(_activity_stream_slots.release)  # cả khi client ngắt giữa chừng
+    return response
+
+
+ACTIVITY_PAGE_SIZE = 20
+ACTIVITY_PAGE_MAX = 100
+
+
+def _parse_cursor(value):
+    try:
+        cursor = int(value)
+    except (TypeError, ValueError):
+        return None
+    return cursor if cursor > 0 else None
+
+
+@app.route('/admin/lookups')
+def admin_lookups():
+    if not session.get('is_admin'):
+        return jsonify({"success": False, "message": "Chưa đăng nhập."}), 403
+
+    ensure_database()
+    email = _normalize_email(request.args.get('email', ''))
+    if not email:
+        return jsonify({"success": True, "lookups": _latest_lookups_per_email(request.args.get('q', '').strip())})
+
+    rows = (
+        LookupResult.query.filter(LookupResult.target_email == email)
+        .order_by(LookupResult.fetched_at.desc())
+        .limit(20)
         .all()
     )
-    payload = [
+    return jsonify(
         {
-            "id": log.id,
-            "requester_email": log.requester_email,
-            "target_email": log.target_email,
-            "kind": log.kind_label,
-            "raw_kind": log.kind,
-            "success": log.success,
-            "message": log.message,
-            "created_at": _format_local_time(log.created_at),
+            "success": True,
+            "email": email,
+            "history": [
+                {
+                    "kind": row.kind,
+                    "code": row.code or "",
+                    "verify_link": row.verify_link or "",
+                    "content": row.content or "",
+                    "received_at_raw": row.received_at_raw or "",
+                    "received_at": row.received_at or "",
+                    "fetched_at": _local_iso(row.fetched_at),
+                }
+                for row in rows
+            ],
         }
-        for log in logs
-    ]
+    )
+
+
+@app.route('/admin/activity/<int:customer_id>')
+def admin_activity(customer_id: int):
+    if not session.get('is_admin'):
+        return jsonify({"success": False, "message": "Chưa đăng nhập."}), 403
+
+    ensure_database()
+
+    before = _parse_cursor(request.args.get('before'))
+    after = _parse_cursor(request.args.get('after'))
+    try:
+        limit = int(request.args.get('limit') or ACTIVITY_PAGE_SIZE)
+    except (TypeError, ValueError):
+        limit = ACTIVITY_PAGE_SIZE
+    limit = max(1, min(limit, ACTIVITY_PAGE_MAX))
+
+    # Nhật ký chỉ được thêm mới nên bản ghi mới nhất đại diện cho cả lịch sử:
+    # nếu không đổi thì trả 304 mà không cần đọc trang dữ liệu.
+    newest = (
+        db.session.query(ActivityLog.id, ActivityLog.created_at)
+        .filter(ActivityLog.customer_id == customer_id)
+        .order_by(ActivityLog.created_at.desc(), ActivityLog.id.desc())
+        .first()
+    )
+    etag = f"act-{customer_id}-{newest.id if newest else 0}-{before or ''}-{after or ''}-{limit}"
+    last_modified = newest.created_at.replace(tzinfo=timezone.utc) if newest and newest.created_at else None
+
+    if request.if_none_match.contains(etag) or (
+        not request.if_none_match
+        and last_modified
+        and request.if_modified_since
+        and last_modified.replace(microsecond=0) <= request.if_modified_since
+    ):
+        response = app.response_class(status=304)
+    else:
+        query = ActivityLog.query.filter(ActivityLog.customer_id == customer_id)
+        for cursor_id, newer in ((before, False), (after, True)):
+            if not cursor_id:
+                continue
+            cursor = ActivityLog.query.get(cursor_id)
+            if not cursor or cursor.customer_id != customer_id:
+                return jsonify({"success": False, "message": "Con trỏ phân trang không hợp lệ."}), 400
+            if newer:
+                keyset = or_(
+                    ActivityLog.created_at > cursor.created_at,
+                    and_(ActivityLog.created_at == cursor.created_at, ActivityLog.id > cursor.id),
+                )
+            else:
+                keyset = or_(
+                    ActivityLog.created_at < cursor.created_at,
+                    and_(ActivityLog.created_at == cursor.created_at, ActivityLog.id < cursor.id),
+                )
+            query = query.filter(keyset)
+
+        if after and not before:
+            # Lấy các bản ghi ngay sau con trỏ rồi đảo lại để luôn trả mới → cũ
+            logs = query.order_by(ActivityLog.created_at, ActivityLog.id).limit(limit + 1).all()
+            has_more = len(logs) > limit
+            logs = list(reversed(logs[:limit]))
+        else:
+            logs = (
+                query.order_by(ActivityLog.created_at.desc(), ActivityLog.id.desc())
+                .limit(limit + 1)
+                .all()
+            )
+            has_more = len(logs) > limit
+            logs = logs[:limit]
+
+        payload = [
+            {
+                "id": log.id,
+                "requester_email": log.requester_email,
+                "target_email": log.target_email,
+                "kind": log.kind_label,
+                "raw_kind": log.kind,
+                "success": log.success,
+                "message": log.message,
+                "created_at": _format_local_time(log.created_at),
+            }
+            for log in logs
+        ]
+
+        response = jsonify(
+            {
+                "success": True,
+                "logs": payload,
+                "has_more": has_more,
+                "next_before": logs[-1].id if logs else None,
+                "next_after": logs[0].id if logs else None,
+            }
+        )
 
-    return jsonify({"success": True, "logs": payload})
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    # Trình duyệt luôn hỏi lại server, nhận 304 nếu lịch sử không đổi
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
 
 
 @app.route('/admin/manage', methods=['POST'])
@@ -494,9 +1445,8 @@ def admin_manage():
             flash('Số điện thoại không được để trống.', 'danger')
             return redirect(next_url)
 
-        email_pattern = r"^[^@\s]+@[^@\s]+\.[^@\s]+$"
         if email:
-            if not re.match(email_pattern, email):
+            if not EMAIL_RE.match(email):
                 flash('Email không hợp lệ.', 'danger')
                 return redirect(next_url)
 
@@ -507,7 +1457,9 @@ def admin_manage():
 
         customer = Customer(email=email or None, phone=phone, expiry_date=expiry, notes=notes)
         db.session.add(customer)
+        data_versions.bump(db.session, "customers")
         db.session.commit()
+        admission.unknown_phones.clear()
         flash('Thêm khách hàng thành công.', 'success')
         return redirect(next_url)
 
@@ -529,9 +1481,8 @@ def admin_manage():
         expiry = _parse_date(request.form.get('expiry'))
         notes = (request.form.get('notes') or '').strip()
 
-        email_pattern = r"^[^@\s]+@[^@\s]+\.[^@\s]+$"
         if email:
-            if not re.match(email_pattern, email):
+            if not EMAIL_RE.match(email):
                 flash('Email không hợp lệ.', 'danger')
                 return redirect(next_url)
 
@@ -548,7 +1499,9 @@ def admin_manage():
         customer.expiry_date = expiry
         customer.notes = notes
         try:
+            data_versions.bump(db.session, "customers")
             db.session.commit()
+            admission.unknown_phones.clear()
             flash('Cập nhật khách hàng thành công.', 'success')
         except IntegrityError:
             db.session.rollback()
@@ -568,6 +1521,7 @@ def admin_manage():
             return redirect(next_url)
 
         db.session.delete(customer)
+        data_versions.bump(db.session, "customers")
         db.session.commit()
         flash('Đã xóa khách hàng.', 'success')
         return redirect(next_url)
@@ -591,7 +1545,9 @@ def admin_manage():
         for customer in customers_to_delete:
             db.session.delete(customer)
 
+        data_versions.bump(db.session, "customers")
         db.session.commit()
+
         flash(f'Đã xóa {len(customers_to_delete)} email.', 'success')
         return redirect(next_url)
 
@@ -620,7 +1576,6 @@ def admin_import():
         flash('Tệp phải sử dụng mã hóa UTF-8.', 'danger')
         return redirect(next_url)
 
-    email_pattern = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
     added = 0
     skipped = 0
     invalid = 0
@@ -635,7 +1590,7 @@ def admin_import():
 
         seen.add(candidate)
 
-        if not email_pattern.match(candidate):
+        if not EMAIL_RE.match(candidate):
             invalid += 1
             continue
 
@@ -649,6 +1604,7 @@ def admin_import():
         added += 1
 
     if added:
+        data_versions.bump(db.session, "customers")
         db.session.commit()
     else:
         db.session.rollback()
@@ -667,6 +1623,390 @@ def admin_import():
     return redirect(next_url)
 
 
+# === EXPORT ===
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson; charset=utf-8",
+}
+EXPORT_FLUSH_BYTES = 64 * 1024
+
+CUSTOMER_EXPORT_FIELDS = (
+    "id", "email", "phone", "expiry_date", "status", "days_remaining",
+    "phone_email_count", "notes", "created_at", "updated_at",
+)
+ACTIVITY_EXPORT_FIELDS = (
+    "id", "created_at", "customer_id", "phone", "requester_email",
+    "target_email", "kind", "success", "message",
+)
+
+
+def _iter_customer_export(search: str, status_filter: str, today: date):
+    phone_email_counts = _phone_email_counts()
+    fmt_expiry = _memo_format("%Y-%m-%d")
+    rows = _customer_rows(search, status_filter).yield_per(config.EXPORT_BATCH_SIZE)
+    for cid, email, phone, expiry_date, status, notes, created_at, updated_at in rows:
+        yield (
+            cid,
+            email or "",
+            phone or "",
+            fmt_expiry(expiry_date),
+            status,
+            (expiry_date - today).days if expiry_date else None,
+            phone_email_counts.get(_normalize_phone(phone), 0),
+            notes or "",
+            _local_iso(created_at),
+            _local_iso(updated_at),
+        )
+
+
+def _iter_activity_export(start: datetime | None, end: datetime | None):
+    query = (
+        db.session.query(
+            ActivityLog.id,
+            ActivityLog.created_at,
+            ActivityLog.customer_id,
+            Customer.phone,
+            ActivityLog.requester_email,
+            ActivityLog.target_email,
+            ActivityLog.kind,
+            ActivityLog.success,
+            ActivityLog.message,
+        )
+        .outerjoin(Customer, Customer.id == ActivityLog.customer_id)
+    )
+    if start is not None:
+        query = query.filter(ActivityLog.created_at >= start)
+    if end is not None:
+        query = query.filter(ActivityLog.created_at < end)
+    for row in query.order_by(ActivityLog.id).yield_per(config.EXPORT_BATCH_SIZE):
+        log_id, created_at, customer_id, phone, requester, target, kind, success, message = row
+        yield (
+            log_id,
+            _local_iso(created_at),
+            customer_id,
+            phone or "",
+            requester or "",
+            target or "",
+            kind or "",
+            bool(success),
+            message or "",
+        )
+
+
+def _export_response(records, fields: tuple[str, ...], fmt: str, filename: str):
+    """Stream bản ghi ra CSV/NDJSON theo từng khối ~64KB, không giữ cả tệp trong RAM."""
+
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer) if fmt == "csv" else None
+        if writer:
+            buffer.write("\ufeff")  # BOM để Excel đọc đúng tiếng Việt
+            writer.writerow(fields)
+        for record in records:
+            if writer:
+                writer.writerow(record)
+            else:
+                buffer.write(json.dumps(dict(zip(fields, record)), ensure_ascii=False))
+                buffer.write("\n")
+            if buffer.tell() >= EXPORT_FLUSH_BYTES:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+
+    response = Response(stream_with_context(generate()), mimetype=EXPORT_FORMATS[fmt])
+    stamp = datetime.now(LOCAL_TZ).strftime("%Y%m%d-%H%M")
+    response.headers["Content-Disposition"] = f'attachment; filename="{filename}-{stamp}.{fmt}"'
+    response.headers["Cache-Control"] = "no-store"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
+def _export_format():
+    fmt = (request.args.get("format") or "csv").lower()
+    return fmt if fmt in EXPORT_FORMATS else None
+
+
+@app.route('/admin/export/customers')
+def admin_export_customers():
+    if not session.get('is_admin'):
+        return jsonify({"success": False, "message": "Chưa đăng nhập."}), 403
+    fmt = _export_format()
+    if not fmt:
+        return jsonify({"success": False, "message": "Định dạng không hỗ trợ (csv hoặc ndjson)."}), 400
+
+    ensure_database()
+    search = (request.args.get('q') or '').strip()
+    status_filter = request.args.get('status', 'all')
+    records = _iter_customer_export(search, status_filter, _local_today())
+    return _export_response(records, CUSTOMER_EXPORT_FIELDS, fmt, "customers")
+
+
+@app.route('/admin/export/activity')
+def admin_export_activity():
+    if not session.get('is_admin'):
+        return jsonify({"success": False, "message": "Chưa đăng nhập."}), 403
+    fmt = _export_format()
+    if not fmt:
+        return jsonify({"success": False, "message": "Định dạng không hỗ trợ (csv hoặc ndjson)."}), 400
+
+    # Khoảng ngày theo giờ Việt Nam, bao gồm cả ngày cuối
+    raw_from = (request.args.get('from') or '').strip()
+    raw_to = (request.args.get('to') or '').strip()
+    day_from = _parse_date(raw_from)
+    day_to = _parse_date(raw_to)
+    if (raw_from and not day_from) or (raw_to and not day_to):
+        return jsonify({"success": False, "message": "Ngày không hợp lệ (định dạng YYYY-MM-DD)."}), 400
+    if day_from and day_to and day_from > day_to:
+        return jsonify({"success": False, "message": "Ngày bắt đầu phải trước ngày kết thúc."}), 400
+
+    offset = LOCAL_TZ.utcoffset(None)
+    start = datetime(day_from.year, day_from.month, day_from.day) - offset if day_from else None
+    end = datetime(day_to.year, day_to.month, day_to.day) + timedelta(days=1) - offset if day_to else None
+
+    ensure_database()
+    records = _iter_activity_export(start, end)
+    return _export_response(records, ACTIVITY_EXPORT_FIELDS, fmt, "activity")
+
+
+# === BATCH LOOKUP (ADMIN) ===
+BATCH_KINDS = ("login_code", "verify_link")
+BATCH_REQUESTER = "admin-batch"
+
+
+def _parse_batch_items(data: dict):
+    """Nhận {"items": [{"email", "kind"}, ...]} hoặc {"emails": <chuỗi nhiều dòng | list>, "kind": ...}."""
+    items = data.get("items")
+    if items is None:
+        emails = data.get("emails") or []
+        if isinstance(emails, str):
+            emails = _EMAIL_LIST_SPLIT_RE.split(emails)
+        items = [{"email": email, "kind": data.get("kind", "login_code")} for email in emails]
+
+    parsed, seen = [], set()
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict):
+            continue
+        email = _normalize_email(item.get("email"))
+        kind = item.get("kind") or "login_code"
+        if not email or kind not in BATCH_KINDS or (email, kind) in seen:
+            continue
+        seen.add((email, kind))
+        parsed.append({"email": email, "kind": kind})
+    return parsed
+
+
+def _batch_lookup_one(worker, item: dict, customer_id: int | None, index: int) -> dict:
+    """Một lookup trong batch: không qua cổng SĐT nhưng vẫn qua breaker và ghi ActivityLog."""
+    email, kind = item["email"], item["kind"]
+    deadline = Deadline(config.FETCH_DEADLINES.get(kind, 50), label=kind)
+    outcome = {"index": index, "email": email, "kind": kind, "success": False}
+    try:
+        with admission.job(f"{kind}:{email}", ttl=deadline.remaining() + 5):
+            result = _fetch_with_breaker(
+                worker, email=email, kind=kind, deadline=deadline, priority="admin", key="batch"
+            )
+    except Rejected as exc:
+        result = {"success": False, "message": exc.message, "error": exc.reason}
+    except CircuitOpen:
+        result = {"success": False, "message": BACKEND_UNAVAILABLE_MSG, "error": "circuit_open"}
+    except Exception as exc:
+        log.exception("Lỗi lookup trong batch", extra={"kind": kind, "email": email})
+        result = {"success": False, "message": f"Lỗi: {exc}", "error": type(exc).__name__}
+
+    if isinstance(result, str):
+        result = {"success": True, "content": result}
+    ok = result.get("success") is not False
+    message = "Thành công" if ok else (result.get("message") or "Phản hồi không thành công từ worker")
+    fields = _result_fields(result)
+    outcome.update(
+        success=ok,
+        message=message,
+        error=result.get("error"),
+        duration_ms=round(deadline.elapsed() * 1000),
+        **fields,
+    )
+    with app.app_context():
+        if ok:
+            _record_lookup_result(email, kind, **fields)
+        _log_activity(
+            customer_id,
+            requester_email=BATCH_REQUESTER,
+            target_email=email,
+            kind=kind,
+            success=ok,
+            message=f"[batch] {message}",
+        )
+    return outcome
+
+
+@app.route('/admin/batch-lookup', methods=['POST'])
+def admin_batch_lookup():
+    if not session.get('is_admin'):
+        return jsonify({"success": False, "message": "Chưa đăng nhập."}), 403
+
+    items = _parse_batch_items(request.get_json(silent=True) or request.form.to_dict())
+    if not items:
+        return jsonify({"success": False, "message": "Danh sách email trống hoặc không hợp lệ."}), 400
+    if len(items) > config.BATCH_LOOKUP_MAX_ITEMS:
+        return jsonify(
+            {"success": False, "message": f"Tối đa {config.BATCH_LOOKUP_MAX_ITEMS} email mỗi lần."}
+        ), 400
+
+    ensure_database()
+    emails = {item["email"] for item in items}
+    customer_ids = dict(
+        db.session.query(func.lower(Customer.email), Customer.id)
+        .filter(func.lower(Customer.email).in_(emails))
+        .all()
+    )
+    db.session.close()
+
+    try:
+        worker = ensure_worker()
+    except Exception:
+        log.exception("Không khởi tạo được worker cho batch lookup")
+        return jsonify({"success": False, "message": BACKEND_UNAVAILABLE_MSG}), 503
+    capacity = getattr(worker, "capacity", 1) or 1
+    concurrency = max(1, min(len(items), config.BATCH_LOOKUP_CONCURRENCY, capacity))
+
+    def generate():
+        executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch-lookup")
+        try:
+            yield json.dumps(
+                {"event": "start", "total": len(items), "concurrency": concurrency, "items": items},
+                ensure_ascii=False,
+            ) + "\n"
+            # mỗi task một bản sao context để log trong luồng phụ giữ request_id
+            futures = [
+                executor.submit(
+                    contextvars.copy_context().run,
+                    _batch_lookup_one, worker, item, customer_ids.get(item["email"]), index,
+                )
+                for index, item in enumerate(items)
+            ]
+            done = 0
+            for future in as_completed(futures):
+                done += 1
+                yield json.dumps({"event": "result", "done": done, **future.result()}, ensure_ascii=False) + "\n"
+            yield json.dumps({"event": "end", "total": len(items)}) + "\n"
+        finally:
+            # admin đóng trang giữa chừng → bỏ các lookup chưa bắt đầu
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    response = Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+    response.headers["Cache-Control"] = "no-store"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
+@app.route('/admin/metrics')
+def admin_metrics():
+    if not session.get('is_admin'):
+        return jsonify({"success": False, "message": "Chưa đăng nhập."}), 403
+
+    return jsonify(
+        {
+            "success": True,
+            "admission": admission.snapshot(),
+            "tukitech_breaker": tuki_breaker.snapshot(),
+            "lookup_scheduler": _scheduler_snapshot(),
+            "admin_fragment_cache": fragment_cache.snapshot(),
+            "backup": backup_scheduler.snapshot(),
+            "chrome": chrome_procs.gauge(),
+        }
+    )
+
+
+@app.route('/admin/diagnostics/memory', methods=['GET', 'POST'])
+def admin_memory_diagnostics():
+    if not session.get('is_admin'):
+        return jsonify({"success": False, "message": "Chưa đăng nhập."}), 403
+
+    payload = request.get_json(silent=True) or request.values
+    try:
+        limit = min(100, max(1, int(payload.get('top') or 20)))
+    except (TypeError, ValueError):
+        limit = 20
+    key_type = payload.get('key') if payload.get('key') in KEY_TYPES else 'lineno'
+
+    if request.method == 'POST':
+        # start: bật tracemalloc (frames = độ sâu stack), stop: tắt,
+        # diff: so với snapshot trước rồi lấy snapshot hiện tại làm mốc
+        action = payload.get('action')
+        if action == 'start':
+            try:
+                frames = min(25, max(1, int(payload.get('frames') or 1)))
+            except (TypeError, ValueError):
+                frames = 1
+            memory_diagnostics.start_tracing(frames)
+            memory_diagnostics.snapshot_diff(limit=0)
+            return jsonify({"success": True, "message": "Đã bật tracemalloc.", "frames": frames})
+        if action == 'stop':
+            memory_diagnostics.stop_tracing()
+            return jsonify({"success": True, "message": "Đã tắt tracemalloc."})
+        if action == 'diff':
+            return jsonify({"success": True, **memory_diagnostics.snapshot_diff(limit=limit, key_type=key_type)})
+        return jsonify({"success": False, "message": "action phải là start, stop hoặc diff."}), 400
+
+    return jsonify(
+        {
+            "success": True,
+            "process": memory_diagnostics.process_memory(),
+            "browser": chrome_procs.gauge(),
+            "caches": memory_diagnostics.cache_sizes(),
+            "gc": {"objects": len(gc.get_objects()), "counts": gc.get_count(), "garbage": len(gc.garbage)},
+            "tracemalloc": memory_diagnostics.tracing(limit=limit, key_type=key_type),
+            "trend": memory_diagnostics.trend(),
+            "samples": list(memory_diagnostics.samples),
+        }
+    )
+
+
+@app.route('/admin/profiling', methods=['POST'])
+def admin_profiling():
+    if not session.get('is_admin'):
+        flash('Phiên đăng nhập đã hết hạn, vui lòng đăng nhập lại.', 'danger')
+        return redirect(url_for('admin'))
+
+    next_url = _safe_next(request.form.get('next'))
+    action = request.form.get('action')
+
+    if action == 'stop':
+        profiler.stop()
+        flash('Đã tắt profiling.', 'info')
+        return redirect(next_url)
+
+    def _as_number(name, cast):
+        try:
+            return cast(request.form.get(name) or 0)
+        except (TypeError, ValueError):
+            return 0
+
+    count = _as_number('count', int)
+    seconds = _as_number('seconds', float)
+    endpoint = (request.form.get('endpoint') or '').strip() or None
+    mode = request.form.get('mode') or 'cprofile'
+    profiler.start(db.engine, mode=mode, count=count, endpoint=endpoint, seconds=seconds)
+
+    target = endpoint or 'mọi endpoint'
+    scope = f'{count} request kế tiếp' if count else (f'{seconds:g} giây' if seconds else '1 request kế tiếp')
+    flash(f'Đã bật profiling ({mode}) cho {target}: {scope}.', 'success')
+    return redirect(next_url)
+
+
+@app.route('/admin/profiling/<path:filename>')
+def admin_profile_download(filename: str):
+    if not session.get('is_admin'):
+        return jsonify({"success": False, "message": "Chưa đăng nhập."}), 403
+
+    path = profiler.path_for(filename)
+    if not path:
+        return jsonify({"success": False, "message": "Không tìm thấy profile."}), 404
+    return send_file(path, as_attachment=True, download_name=filename)
+
+
 @app.route('/admin/logout', methods=['POST'])
 def admin_logout():
     session.pop('is_admin', None)
@@ -675,9 +2015,93 @@ def admin_logout():
 
 
 # === API ===
+def _server_time() -> tuple[str, str]:
+    """Giờ hiện tại của server (giờ địa phương): (chuỗi hiển thị, ISO)."""
+    server_now = datetime.now(timezone.utc).astimezone()
+    return server_now.strftime("%a, %d %b %Y %H:%M:%S %Z"), server_now.isoformat()
+
+
+def _lookup_fields(result, fallback_raw: str, fallback_iso: str) -> dict | None:
+    """Các trường trả về (và lưu lịch sử) của một lookup; None nếu worker báo thất bại."""
+    code = ""
+    content = ""
+    timestamp_raw = ""
+    timestamp_iso = ""
+    verify_link = ""
+
+    if isinstance(result, dict):
+        if result.get("success") is False:
+            return None
+        fields = _result_fields(result)
+        code = fields["code"]
+        content = fields["content"]
+        timestamp_raw = fields["received_at_raw"]
+        timestamp_iso = fields["received_at"]
+        verify_link = fields["verify_link"]
+
+    elif isinstance(result, str):
+        code_match = _RESULT_CODE_RE.search(result)
+        time_match = _RESULT_TIME_RE.search(result)
+        code = code_match.group(1) if code_match else ""
+        timestamp_raw = time_match.group(0) if time_match else ""
+        content = result
+
+    timestamp_raw, parsed_iso = _parse_timestamp_candidates(timestamp_raw)
+    if parsed_iso and not timestamp_iso:
+        timestamp_iso = parsed_iso
+
+    if not timestamp_raw and timestamp_iso:
+        timestamp_raw = timestamp_iso
+
+    if not timestamp_raw and not timestamp_iso:
+        timestamp_raw = fallback_raw
+        timestamp_iso = fallback_iso
+
+    return {
+        "code": code,
+        "content": content,
+        "verify_link": verify_link,
+        "received_at_raw": timestamp_raw,
+        "received_at": timestamp_iso,
+    }
+
+
+def _history_response(row: LookupResult, requester: Customer, target: Customer, server_raw: str, server_iso: str) -> dict:
+    """Trả lời từ một dòng lịch sử lookup, cùng dạng với kết quả lookup trực tiếp."""
+    return {
+        "success": True,
+        "code": row.code or "",
+        "content": row.content or "",
+        "verify_link": row.verify_link or "",
+        "received_at_raw": row.received_at_raw or row.received_at or "",
+        "received_at": row.received_at or "",
+        "server_time_raw": server_raw,
+        "server_time_iso": server_iso,
+        "requester_email": requester.email,
+        "target_email": target.email,
+    }
+
+
+def _stale_response(row: LookupResult, requester: Customer, target: Customer, server_raw: str, server_iso: str) -> dict:
+    age = max(0, int((datetime.utcnow() - row.fetched_at).total_seconds()))
+    payload = _history_response(row, requester, target, server_raw, server_iso)
+    payload.update(
+        stale=True,
+        message=(
+            f"Tukitech phản hồi chậm. Đây là kết quả lấy lúc {_format_local_time(row.fetched_at)} "
+            f"({age // 60} phút trước), có thể đã cũ; hệ thống đang làm mới."
+        ),
+        fetched_at=_local_iso(row.fetched_at),
+        age_seconds=age,
+    )
+    return payload
+
+
 @app.route('/api/fetch', methods=['POST'])
 def api_fetch():
     try:
+        admission.check_client(_client_ip())
+
         data = request.form if request.form else request.json
 
         # Support optional target_email; default to the same as requester
@@ -708,6 +2132,9 @@ def api_fetch():
         if kind not in ("login_code", "verify_link"):
             return jsonify({"success": False, "message": f"kind không hợp lệ: {kind}"}), 400
 
+        # Ngân sách cho cả request, truyền xuống tới từng bước chờ của trình duyệt
+        deadline = Deadline(config.FETCH_DEADLINES.get(kind, 50), label=kind)
+
         PHONE_NOT_ALLOWED_MSG = (
             "Số điện thoại hết hạn hoặc chưa được đăng kí, vui lòng liên hệ với seller để được gia hạn"
         )
@@ -715,26 +2142,34 @@ def api_fetch():
         if not phone:
             return jsonify({"success": False, "message": PHONE_NOT_ALLOWED_MSG}), 403
 
+        # SĐT vừa bị từ chối gần đây: trả lời ngay, không truy vấn/ghi log lại
+        if phone.lower() in admission.unknown_phones:
+            admission.reject(403, "unknown_phone_cached", PHONE_NOT_ALLOWED_MSG)
+
+        admission.check_phone(phone.lower())
+
         ensure_database()
 
         phone_holder = Customer.query.filter(func.lower(Customer.phone) == phone.lower()).first()
         if not phone_holder:
+            admission.unknown_phones.add(phone.lower())
             log_attempt(customer_id=None, success=False, message="Số điện thoại không hợp lệ")
             return jsonify({"success": False, "message": PHONE_NOT_ALLOWED_MSG}), 403
 
-        phone_status = _evaluate_status(phone_holder.expiry_date)
-        if phone_status == 'expired':
+        if phone_holder.status == 'expired':
             log_attempt(customer_id=phone_holder.id, success=False, message="Số điện thoại hết hạn")
             return jsonify({"success": False, "message": PHONE_NOT_ALLOWED_MSG}), 403
 
+        # hạn mức email chỉ tính khi SĐT hợp lệ: SĐT đoán bừa kèm email của khách không khóa được khách
+        admission.check_email(email)
+
         # Validate requester
         requester = Customer.query.filter(func.lower(Customer.email) == email).first()
         if not requester:
             log_attempt(customer_id=phone_holder.id, success=False, message="Email requester không hợp lệ")
             return jsonify({"success": False, "message": "Email không hợp lệ hoặc chưa được cấp quyền, vui lòng liên hệ admin."}), 403
 
-        status = _evaluate_status(requester.expiry_date)
-        if status == 'expired':
+        if requester.status == 'expired':
             log_attempt(customer_id=phone_holder.id, success=False, message="Gói requester hết hạn")
             return jsonify({"success": False, "message": "Gói Netflix của bạn đã hết hạn, vui lòng liên hệ admin để được gia hạn."}), 403
 
@@ -744,80 +2179,96 @@ def api_fetch():
             log_attempt(customer_id=phone_holder.id, success=False, message="Email đích không tồn tại")
             return jsonify({"success": False, "message": "Email đích không tồn tại trong hệ thống."}), 404
 
-        target_status = _evaluate_status(target.expiry_date)
-        if target_status == 'expired':
+        if target.status == 'expired':
             log_attempt(customer_id=phone_holder.id, success=False, message="Email đích hết hạn")
             return jsonify({"success": False, "message": "Email đích đã hết hạn, vui lòng liên hệ admin."}), 403
 
-        worker = ensure_worker()
-        print(f"[API] yêu cầu: kind={kind} email={fetch_email}")
-        result = worker.fetch(email=fetch_email, kind=kind)
-        print(f"[API] trả về: {result}")
-
-        # chuẩn bị thời gian dự phòng từ server (giờ địa phương của server)
-        server_now = datetime.now(timezone.utc).astimezone()
-        fallback_raw = server_now.strftime("%a, %d %b %Y %H:%M:%S %Z")
-        fallback_iso = server_now.isoformat()
-
-        code = ""
-        content = ""
-        timestamp_raw = ""
-        timestamp_iso = ""
-        verify_link = ""
-
-        if isinstance(result, dict):
-            if result.get("success") is False:
-                message = result.get("message") or "Phản hồi không thành công từ worker"
-                log_attempt(customer_id=phone_holder.id, success=False, message=message)
-                return jsonify({"success": False, "message": message}), 502
-
-            code = (result.get("code") or result.get("result") or "").strip()
-            content = result.get("content") or ""
-            timestamp_raw = result.get("received_at_raw") or result.get("timestamp") or ""
-            timestamp_iso = result.get("received_at") or result.get("timestamp_iso") or ""
-            verify_link = result.get("verify_link") or result.get("link") or ""
-
-        elif isinstance(result, str):
-            code_match = re.search(r"(\d{3,6})", result)
-            time_match = re.search(r"\w{3},\s\d{1,2}\s\w{3}\s\d{4}\s[\d:]+(?:\s\w+)?", result)
-            code = code_match.group(1) if code_match else ""
-            timestamp_raw = time_match.group(0) if time_match else ""
-            content = result
-
-        timestamp_raw, parsed_iso = _parse_timestamp_candidates(timestamp_raw)
-        if parsed_iso and not timestamp_iso:
-            timestamp_iso = parsed_iso
-
-        if not timestamp_raw and timestamp_iso:
-            timestamp_raw = timestamp_iso
-
-        if not timestamp_raw and not timestamp_iso:
-            timestamp_raw = fallback_raw
-            timestamp_iso = fallback_iso
+        # lookup trùng (cùng kind + email, vd. khách bấm hai lần) đang chạy ở bất kỳ node nào
+        # → chờ nó xong rồi dùng chung kết quả, không mở thêm trình duyệt và không báo lỗi
+        waited_from = datetime.utcnow()
+        try:
+            with admission.job(
+                f"{kind}:{fetch_email.lower()}", ttl=deadline.remaining() + 5, wait=deadline.remaining()
+            ) as owner:
+                if owner:
+                    with admission.slot():
+                        worker = ensure_worker()
+                        log.debug("Bắt đầu lookup", extra={"kind": kind, "email": fetch_email})
+                        result = _fetch_with_breaker(
+                            worker, email=fetch_email, kind=kind, deadline=deadline, key=phone.lower()
+                        )
+                        ok = isinstance(result, dict) and result.get("success") is not False
+                        log.info(
+                            "Kết quả lookup",
+                            extra={
+                                "kind": kind,
+                                "email": fetch_email,
+                                "success": ok,
+                                "error": result.get("error") if isinstance(result, dict) else None,
+                                "duration_ms": round(deadline.elapsed() * 1000),
+                                "sampled": ok,
+                            },
+                        )
+                        log.debug("Kết quả lookup (đầy đủ)", extra={"result": result})
+
+                    # chuẩn bị thời gian dự phòng từ server (giờ địa phương của server)
+                    fallback_raw, fallback_iso = _server_time()
+                    fields = _lookup_fields(result, fallback_raw, fallback_iso)
+                    if fields is not None:
+                        # ghi trước khi nhả job: request trùng đang chờ sẽ đọc đúng kết quả này
+                        _record_lookup_result(fetch_email, kind, **fields)
+        except CircuitOpen as exc:
+            log_attempt(customer_id=phone_holder.id, success=False, message="Tukitech đang tạm ngắt (circuit open)")
+            raise Rejected(503, "circuit_open", BACKEND_UNAVAILABLE_MSG, exc.retry_after)
+
+        if not owner:
+            fallback_raw, fallback_iso = _server_time()
+            waited = (datetime.utcnow() - waited_from).total_seconds()
+            shared = _latest_lookup_result(fetch_email, kind, waited + 1)
+            if shared is not None:
+                log_attempt(customer_id=phone_holder.id, success=True, message="Thành công (dùng chung lookup đang chạy)")
+                return jsonify(_history_response(shared, requester, target, fallback_raw, fallback_iso))
+            # lookup kia không ra kết quả: xử lý như khi chính request này hết thời gian
+            result = deadline.exceeded_result(kind=kind)
+            fields = None
+
+        if fields is None:
+            message = result.get("message") or "Phản hồi không thành công từ worker"
+            if result.get("error") == "DeadlineExceeded":
+                # stale-while-revalidate: trả kết quả gần nhất (đánh dấu cũ) và làm mới ở nền
+                stale = _latest_lookup_result(fetch_email, kind, config.LOOKUP_STALE_MAX_AGE)
+                if stale is not None:
+                    _refresh_lookup_in_background(fetch_email, kind)
+                    log_attempt(customer_id=phone_holder.id, success=True, message="Thành công (kết quả cũ, đang làm mới)")
+                    return jsonify(_stale_response(stale, requester, target, fallback_raw, fallback_iso))
+            log_attempt(customer_id=phone_holder.id, success=False, message=message)
+            if result.get("error") == "DeadlineExceeded":
+                return jsonify(
+                    {
+                        "success": False,
+                        "message": "Hệ thống phản hồi quá lâu, vui lòng thử lại.",
+                        "error": "DeadlineExceeded",
+                        "deadline": result.get("deadline"),
+                    }
+                ), 504
+            return jsonify({"success": False, "message": message}), 502
 
         response_payload = {
             "success": True,
-            "code": code,
-            "content": content,
-            "verify_link": verify_link,
-            "received_at_raw": timestamp_raw,
-            "received_at": timestamp_iso,
-            "timestamp_raw": timestamp_raw,
-            "timestamp_iso": timestamp_iso,
-            "timestamp": timestamp_raw,
+            **fields,
             "server_time_raw": fallback_raw,
             "server_time_iso": fallback_iso,
             "requester_email": requester.email,
             "target_email": target.email,
         }
-
         log_attempt(customer_id=phone_holder.id, success=True, message="Thành công")
 
         return jsonify(response_payload)
 
+    except Rejected as exc:
+        return _rejected_response(exc)
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        log.exception("Lỗi xử lý /api/fetch")
         return jsonify({"success": False, "message": f"Lỗi server: {e}"}), 500
 
 
@@ -826,18 +2277,82 @@ def api_fetch():
 # === INIT DB ===
 @app.cli.command("init-db")
 def init_db():
-    db.create_all()
+    ensure_database()
     print("✅ Database khởi tạo thành công")
 
 
+# === BACKUP ===
+def _run_backup(dest_dir: str | None = None, **overrides) -> dict:
+    with app.app_context():
+        url = db.engine.url
+    if url.get_backend_name() != "sqlite" or not url.database or url.database == ":memory:":
+        raise RuntimeError("Chỉ sao lưu được database SQLite dạng tệp.")
+    options = {
+        "pages": config.BACKUP_PAGES_PER_STEP,
+        "step_sleep": config.BACKUP_STEP_SLEEP_MS / 1000,
+        "keep": config.BACKUP_KEEP,
+        "compress": config.BACKUP_COMPRESS,
+        "probe": False,  # đo độ trễ tranh khóa ghi với request thật → chỉ bật khi chạy tay
+    }
+    options.update(overrides)
+    return backup_database(url.database, dest_dir or config.BACKUP_DIR, **options)
+
+
+backup_scheduler = BackupScheduler(_run_backup, config.BACKUP_DIR, config.BACKUP_INTERVAL_HOURS * 3600)
+
+
+@app.before_request
+def _start_background_jobs():
+    # chỉ process phục vụ request mới chạy việc nền; gọi lại không tốn gì
+    backup_scheduler.start()
+    memory_diagnostics.start()
+    _start_status_sweeper()
+
+
+@app.cli.command("backup-db")
+@click.option("--dest", default=None, help="Thư mục lưu bản sao (mặc định BACKUP_DIR).")
+@click.option("--keep", type=int, default=None, help="Số bản gần nhất giữ lại.")
+@click.option("--no-compress", is_flag=True, help="Không nén gzip.")
+@click.option("--probe", is_flag=True, help="Đo độ trễ lấy khóa ghi trước và trong khi sao lưu (thêm ~1s).")
+def backup_db(dest, keep, no_compress, probe):
+    overrides = {}
+    if keep is not None:
+        overrides["keep"] = max(1, keep)
+    if no_compress:
+        overrides["compress"] = False
+    if probe:
+        overrides["probe"] = True
+    report = _run_backup(dest, **overrides)
+    mib = 1024 * 1024
+    print(f"✅ Đã sao lưu: {report['path']}")
+    print(
+        f"   {report['raw_bytes'] / mib:.1f} MiB → {report['bytes'] / mib:.1f} MiB, "
+        f"chép {report['copy_seconds']:.2f}s ({report['steps']} bước, {report['restarts']} lần chép lại, "
+        f"chế độ {report['mode']}), tổng {report['total_seconds']:.2f}s"
+    )
+    latency = report.get("write_latency") or {}
+    before, during = latency.get("baseline", {}), latency.get("during", {})
+    if before.get("samples") and during.get("samples"):
+        print(
+            f"   Độ trễ lấy khóa ghi p50/p95/max: trước {before['p50_ms']}/{before['p95_ms']}/{before['max_ms']} ms, "
+            f"trong lúc sao lưu {during['p50_ms']}/{during['p95_ms']}/{during['max_ms']} ms"
+        )
+    if report["removed"]:
+        print(f"   Đã xóa {len(report['removed'])} bản cũ: {', '.join(report['removed'])}")
+
+
+import signal
 import sys
 
 if __name__ == '__main__':
     if '--init-db' in sys.argv:
         with app.app_context():
-            db.create_all()
+            ensure_database()
             print('✅ DB created/ready')
         # ❌ KHÔNG gọi ensure_worker() ở đây
     else:
-        ensure_worker()  # ✅ Chỉ warm-up khi chạy server thật
+        # SIGTERM → thoát bình thường để atexit đóng Chrome
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        if config.WARM_WORKER_ON_START:
+            ensure_worker()  # ✅ Chỉ warm-up khi chạy server thật
         app.run(host='0.0.0.0', port=5000, debug=False, use_reloader=False)
\ No newline at end of file
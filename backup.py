@@ -0,0 +1,303 @@
+"""Sao lưu data.db khi app đang chạy, bằng SQLite online backup API.
+
+Chép tệp DB trực tiếp có thể lấy đúng lúc một transaction mới ghi dở. Ở đây bản
+sao được chép theo từng nhóm `pages` trang, nghỉ `step_sleep` giây giữa hai bước,
+nên mỗi lần chỉ giữ khóa đọc trong một khoảng ngắn. Ở chế độ WAL thì khóa đọc
+không chặn lệnh ghi.
+
+Nếu có process khác ghi vào DB giữa hai bước, SQLite chép lại từ đầu. Sau
+`max_restarts` lần như vậy, phần còn lại được chép trong một bước. Ở chế độ WAL
+bước đó đọc một snapshot nhất quán và vẫn không chặn lệnh ghi.
+
+Bản sao được `PRAGMA quick_check`, nén gzip, rồi đổi tên nguyên tử thành
+`data-YYYYmmdd-HHMMSS.db.gz`. Chỉ giữ `keep` bản mới nhất.
+
+Khi bật `probe` (chỉ dùng cho báo cáo của lệnh `flask backup-db --probe`), một
+luồng đo độ trễ lấy khóa ghi (`BEGIN IMMEDIATE` → `ROLLBACK`) trên DB nguồn, trước
+và trong khi chép. Báo cáo ghi lại p50/p95/max của cả hai giai đoạn để thấy mức
+ảnh hưởng tới request. Luồng đo này tự tranh khóa ghi với request thật, nên sao
+lưu định kỳ không bật nó.
+"""
+
+from __future__ import annotations
+
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import statistics
+import threading
+import time
+
+log = logging.getLogger("backup")
+
+BACKUP_PREFIX = "data-"
+_SUFFIXES = (".db.gz", ".db")
+_LOCK_NAME = ".backup.lock"
+
+
+class _RestartLimit(Exception):
+    pass
+
+
+class _LatencyProbe:
+    """Đo thời gian lấy khóa ghi trên DB nguồn, `interval` giây một lần."""
+
+    def __init__(self, path: str, interval: float = 0.01):
+        self.path = path
+        self.interval = interval
+        self.samples: dict[str, list[float]] = {"baseline": [], "during": []}
+        self.phase = "baseline"
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="backup-probe", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _run(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            while not self._stop.is_set():
+                start = time.perf_counter()
+                try:
+                    conn.execute("BEGIN IMMEDIATE")
+                    conn.execute("ROLLBACK")
+                except sqlite3.Error:
+                    pass
+                self.samples[self.phase].append((time.perf_counter() - start) * 1000)
+                self._stop.wait(self.interval)
+        finally:
+            conn.close()
+
+    def report(self) -> dict:
+        def summary(values: list[float]) -> dict:
+            if not values:
+                return {"samples": 0}
+            ordered = sorted(values)
+            return {
+                "samples": len(ordered),
+                "p50_ms": round(statistics.median(ordered), 2),
+                "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 2),
+                "max_ms": round(ordered[-1], 2),
+            }
+
+        return {phase: summary(values) for phase, values in self.samples.items()}
+
+
+def list_backups(dest_dir: str) -> list[str]:
+    """Các bản sao lưu trong `dest_dir`, mới nhất trước (tên tệp chứa thời điểm)."""
+    try:
+        names = os.listdir(dest_dir)
+    except OSError:
+        return []
+    found = [n for n in names if n.startswith(BACKUP_PREFIX) and n.endswith(_SUFFIXES)]
+    return [os.path.join(dest_dir, n) for n in sorted(found, reverse=True)]
+
+
+def rotate_backups(dest_dir: str, keep: int) -> list[str]:
+    removed = []
+    for path in list_backups(dest_dir)[max(1, keep):]:
+        try:
+            os.remove(path)
+            removed.append(os.path.basename(path))
+        except OSError:
+            log.warning("Không xóa được bản sao lưu cũ", extra={"path": path}, exc_info=True)
+    return removed
+
+
+def _try_lock(handle) -> bool:
+    try:
+        import fcntl
+
+        fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except ImportError:
+        import msvcrt
+
+        try:
+            msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+    except OSError:
+        return False
+
+
+def _copy(src: sqlite3.Connection, dst: sqlite3.Connection, pages: int, step_sleep: float, max_restarts: int) -> dict:
+    stats = {"steps": 0, "restarts": 0, "pages": 0, "mode": "stepped"}
+    last_remaining = None
+
+    def progress(_status, remaining, total):
+        nonlocal last_remaining
+        stats["steps"] += 1
+        stats["pages"] = total
+        if last_remaining is not None and remaining > last_remaining:
+            stats["restarts"] += 1
+            if stats["restarts"] > max_restarts:
+                raise _RestartLimit()
+        last_remaining = remaining
+
+    try:
+        src.backup(dst, pages=max(1, pages), progress=progress, sleep=step_sleep)
+    except _RestartLimit:
+        log.warning("DB bị ghi liên tục trong lúc sao lưu, chép phần còn lại trong một bước",
+                    extra={"restarts": stats["restarts"]})
+        stats["mode"] = "single"
+        src.backup(dst, pages=-1)
+        stats["steps"] += 1
+    return stats
+
+
+def backup_database(
+    src_path: str,
+    dest_dir: str,
+    *,
+    pages: int = 256,
+    step_sleep: float = 0.005,
+    keep: int = 14,
+    compress: bool = True,
+    max_restarts: int = 3,
+    probe: bool = False,
+    probe_baseline: float = 1.0,
+) -> dict:
+    """Sao lưu `src_path` vào `dest_dir`, trả về báo cáo (dict, serialize được bằng JSON)."""
+    os.makedirs(dest_dir, exist_ok=True)
+    name = BACKUP_PREFIX + time.strftime("%Y%m%d-%H%M%S") + (".db.gz" if compress else ".db")
+    final_path = os.path.join(dest_dir, name)
+    raw_tmp = os.path.join(dest_dir, f".{name}.raw.tmp")
+
+    latency = _LatencyProbe(src_path) if probe else None
+    if latency:
+        latency.start()
+        time.sleep(probe_baseline)
+        latency.phase = "during"
+
+    started = time.perf_counter()
+    try:
+        src = sqlite3.connect(src_path, timeout=30)
+        dst = sqlite3.connect(raw_tmp)
+        try:
+            stats = _copy(src, dst, pages, step_sleep, max_restarts)
+            copy_seconds = time.perf_counter() - started
+            if latency:
+                latency.stop()
+            check = dst.execute("PRAGMA quick_check").fetchone()[0]
+        finally:
+            src.close()
+            dst.close()
+            if latency:
+                latency.stop()
+        if check != "ok":
+            raise RuntimeError(f"Bản sao lưu không toàn vẹn: {check}")
+
+        raw_bytes = os.path.getsize(raw_tmp)
+        if compress:
+            packed_tmp = raw_tmp + ".gz"
+            with open(raw_tmp, "rb") as fin, gzip.open(packed_tmp, "wb", compresslevel=6) as fout:
+                shutil.copyfileobj(fin, fout, 1024 * 1024)
+            os.remove(raw_tmp)
+            os.replace(packed_tmp, final_path)
+        else:
+            os.replace(raw_tmp, final_path)
+    except BaseException:
+        for leftover in (raw_tmp, raw_tmp + ".gz"):
+            try:
+                os.remove(leftover)
+            except OSError:
+                pass
+        raise
+
+    report = {
+        "path": final_path,
+        "finished_at": time.time(),
+        "copy_seconds": round(copy_seconds, 3),
+        "total_seconds": round(time.perf_counter() - started, 3),
+        "raw_bytes": raw_bytes,
+        "bytes": os.path.getsize(final_path),
+        **stats,
+        "removed": rotate_backups(dest_dir, keep),
+    }
+    if latency:
+        report["write_latency"] = latency.report()
+    log.info("Đã sao lưu database", extra={k: v for k, v in report.items() if k != "write_latency"})
+    return report
+
+
+class BackupScheduler:
+    """Luồng nền sao lưu định kỳ.
+
+    Mỗi `check_every` giây, luồng xem bản sao lưu mới nhất trong `dest_dir`. Nếu
+    bản đó cũ hơn `interval` giây thì chạy `run()`. Trước khi chạy, luồng giữ
+    khóa tệp trong `dest_dir`, nên khi có nhiều process web chỉ một process sao
+    lưu.
+    """
+
+    def __init__(self, run, dest_dir: str, interval: float, check_every: float = 60):
+        self.run = run
+        self.dest_dir = dest_dir
+        self.interval = interval
+        self.check_every = min(check_every, interval)
+        self.last_report: dict | None = None
+        self.last_error: str | None = None
+        self._started = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def start(self):
+        with self._lock:
+            if self._started or self.interval <= 0:
+                return
+            self._started = True
+        threading.Thread(target=self._loop, name="db-backup", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def due(self) -> bool:
+        latest = list_backups(self.dest_dir)
+        if not latest:
+            return True
+        try:
+            return time.time() - os.path.getmtime(latest[0]) >= self.interval
+        except OSError:
+            return True
+
+    def run_once(self) -> dict | None:
+        """Sao lưu nếu đến hạn và không process nào khác đang sao lưu."""
+        if not self.due():
+            return None
+        os.makedirs(self.dest_dir, exist_ok=True)
+        with open(os.path.join(self.dest_dir, _LOCK_NAME), "a+") as handle:
+            if not _try_lock(handle):
+                return None
+            if not self.due():  # process khác vừa sao lưu xong
+                return None
+            try:
+                self.last_report = self.run()
+                self.last_error = None
+            except Exception as exc:
+                self.last_error = str(exc)
+                log.exception("Sao lưu định kỳ thất bại")
+                return None
+        return self.last_report
+
+    def _loop(self):
+        while not self._stop.wait(self.check_every):
+            self.run_once()
+
+    def snapshot(self) -> dict:
+        latest = list_backups(self.dest_dir)
+        return {
+            "interval_seconds": self.interval,
+            "running": self._started,
+            "latest": os.path.basename(latest[0]) if latest else None,
+            "count": len(latest),
+            "last_report": self.last_report,
+            "last_error": self.last_error,
+        }
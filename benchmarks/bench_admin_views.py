@@ -0,0 +1,172 @@
+"""So sánh cách dựng dữ liệu cho trang /admin: ORM đầy đủ (cũ) và projection chỉ đọc.
+
+Chạy:  python benchmarks/bench_admin_views.py [--sizes 10000,50000,100000] [--repeat 3]
+
+- "ORM": `Customer.query.all()` (đối tượng ORM + identity map), mỗi khách hai dict,
+  strftime gọi lại cho từng dòng — đúng như vòng lặp cũ trong route admin.
+- "projection": `_customer_rows()` trả Row tuple, một `CustomerRow` (__slots__)
+  dùng chung cho hai bảng, ngày giờ format một lần cho mỗi giá trị khác nhau.
+
+Đo thời gian (median) và bộ nhớ đỉnh (tracemalloc) của phần truy vấn + dựng view,
+không tính render template.
+"""
+
+import argparse
+import gc
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def _seed(db, rows: int, start: int = 0):
+    from sqlalchemy import text
+
+    rnd = random.Random(start or 7)
+    today = date.today()
+    now = datetime.utcnow()
+    batch = []
+    for i in range(start, start + rows):
+        stamp = now - timedelta(minutes=rnd.randint(0, 60 * 24 * 365))
+        batch.append(
+            {
+                "email": f"user{i:06d}@example.com" if rnd.random() > 0.05 else None,
+                "phone": f"09{rnd.randrange(10**7, 10**8)}" if rnd.random() > 0.02 else "",
+                "expiry_date": today + timedelta(days=rnd.randint(-60, 120)) if rnd.random() > 0.03 else None,
+                "notes": "ghi chú" if i % 3 else "",
+                "created_at": stamp,
+                "updated_at": stamp,
+            }
+        )
+    db.session.execute(
+        text(
+            "INSERT INTO customer (email, phone, expiry_date, notes, created_at, updated_at) "
+            "VALUES (:email, :phone, :expiry_date, :notes, :created_at, :updated_at)"
+        ),
+        batch,
+    )
+    db.session.commit()
+
+
+def _orm_views(webapp, today, phone_email_counts):
+    """Bản sao vòng lặp cũ của route admin (trước khi dùng projection)."""
+    Customer = webapp.Customer
+    customers = Customer.query.order_by(Customer.expiry_date.is_(None), Customer.expiry_date, Customer.email).all()
+    counts = {"active": 0, "expiring": 0, "expired": 0}
+    customers_view, emails_view = [], []
+    for customer in customers:
+        status = webapp._evaluate_status(customer.expiry_date, today)
+        counts[status] += 1
+        meta = webapp._status_meta(status)
+        days_remaining = (customer.expiry_date - today).days if customer.expiry_date else None
+        normalized_phone = webapp._normalize_phone(customer.phone)
+        usage = phone_email_counts.get(normalized_phone, 0)
+        if customer.email:
+            emails_view.append(
+                {
+                    "id": customer.id,
+                    "email": customer.email,
+                    "phone": customer.phone or "",
+                    "expiry_display": customer.expiry_display,
+                    "status_label": meta["label"],
+                    "status_badge": meta["badge"],
+                    "notes": customer.notes or "",
+                    "created_at": customer.created_at.strftime("%d/%m/%Y %H:%M"),
+                    "updated_at": customer.updated_at.strftime("%d/%m/%Y %H:%M") if customer.updated_at else "",
+                }
+            )
+        if not normalized_phone:
+            continue
+        customers_view.append(
+            {
+                "id": customer.id,
+                "email": customer.email or "",
+                "phone": customer.phone or "",
+                "expiry_display": customer.expiry_display,
+                "expiry_value": customer.expiry_date.strftime("%Y-%m-%d") if customer.expiry_date else "",
+                "status": status,
+                "status_label": meta["label"],
+                "status_badge": meta["badge"],
+                "row_class": meta["row"],
+                "notes": customer.notes or "",
+                "created_at": customer.created_at.strftime("%d/%m/%Y %H:%M"),
+                "updated_at": customer.updated_at.strftime("%d/%m/%Y %H:%M") if customer.updated_at else "",
+                "days_remaining": days_remaining,
+                "phone_email_count": usage,
+                "has_multiple_emails": usage > 1,
+            }
+        )
+    return counts, customers_view, emails_view
+
+
+def _projection_views(webapp, today, phone_email_counts):
+    customers_view, emails_view = webapp._build_customer_views(
+        webapp._customer_rows(), today=today, phone_email_counts=phone_email_counts
+    )
+    return webapp._customer_status_counts(), customers_view, emails_view
+
+
+def _measure(webapp, fn, repeat: int):
+    today = date.today()
+    phone_email_counts = webapp._phone_email_counts()
+    times = []
+    peak = 0
+    result = None
+    for i in range(repeat):
+        webapp.db.session.expunge_all()
+        gc.collect()
+        if i == 0:
+            tracemalloc.start()
+        start = time.perf_counter()
+        result = fn(webapp, today, phone_email_counts)
+        times.append((time.perf_counter() - start) * 1000)
+        if i == 0:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        rows = len(result[1]) + len(result[2])
+        result = None
+    # lượt đầu chạy dưới tracemalloc (chậm hơn) nên chỉ lấy thời gian các lượt sau
+    timed = times[1:] or times
+    return statistics.median(timed), peak / (1024 * 1024), rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10000,50000,100000")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    sizes = sorted(int(s) for s in args.sizes.split(",") if s.strip())
+
+    tmpdir = tempfile.mkdtemp(prefix="bench-admin-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    import app as webapp  # noqa: E402 — cần DATABASE_URL trước khi import
+
+    print(f"{'khách':>8} {'ORM ms':>9} {'proj ms':>9} {'x':>5} {'ORM MiB':>9} {'proj MiB':>9} {'x':>5}")
+    with webapp.app.app_context():
+        webapp.ensure_database()
+        seeded = 0
+        for size in sizes:
+            _seed(webapp.db, size - seeded, start=seeded)
+            webapp._sweep_customer_status()  # INSERT thô không đi qua model → tính status
+            seeded = size
+            orm_ms, orm_mib, orm_rows = _measure(webapp, _orm_views, args.repeat + 1)
+            proj_ms, proj_mib, proj_rows = _measure(webapp, _projection_views, args.repeat + 1)
+            assert orm_rows == proj_rows, (orm_rows, proj_rows)
+            print(
+                f"{size:>8} {orm_ms:>9.0f} {proj_ms:>9.0f} {orm_ms / proj_ms:>5.1f}"
+                f" {orm_mib:>9.1f} {proj_mib:>9.1f} {orm_mib / proj_mib:>5.1f}",
+                flush=True,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""So sánh Chrome cấu hình cũ ("full") và chính sách tài nguyên "lean".
+
+Chạy trên máy có Chrome:  python benchmarks/bench_chrome_profile.py [--loads 5] [--url ...]
+
+Mỗi chính sách mở một phiên Chrome headless mới, tải trang Tukitech `--loads` lần
+(tới khi thấy ô #username hoặc #email, như TukiPersistent) và ghi:
+- thời gian tới form (median), DOMContentLoaded theo Navigation Timing
+- số request và số byte đã tải (Resource Timing, transferSize)
+- RSS của chromedriver + mọi process Chrome con (đọc /proc) sau lượt tải cuối
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+NAV_JS = """
+const nav = performance.getEntriesByType('navigation')[0] || {};
+const res = performance.getEntriesByType('resource');
+return {
+  dcl: nav.domContentLoadedEventEnd || 0,
+  bytes: (nav.transferSize || 0) + res.reduce((s, r) => s + (r.transferSize || 0), 0),
+  requests: res.length + 1,
+};
+"""
+
+
+def _run(policy: str, url: str, loads: int, headless: bool) -> dict:
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from webdriver_manager.chrome import ChromeDriverManager
+
+    import proc_stats
+    import tuki_persistent as tp
+
+    opts = tp.build_chrome_options(headless, policy)
+    driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=opts)
+    try:
+        if policy == "lean":
+            tp.apply_request_blocking(driver)
+        driver.set_page_load_timeout(tp.PAGE_LOAD_TIMEOUT)
+        to_form, dcl, sizes, requests = [], [], [], []
+        for _ in range(loads):
+            driver.execute_cdp_cmd("Network.clearBrowserCache", {})
+            start = time.perf_counter()
+            driver.get(url)
+            WebDriverWait(driver, 30).until(
+                lambda d: d.find_elements(By.ID, "username") or d.find_elements(By.ID, "email")
+            )
+            to_form.append((time.perf_counter() - start) * 1000)
+            stats = driver.execute_script(NAV_JS)
+            dcl.append(stats["dcl"])
+            sizes.append(stats["bytes"])
+            requests.append(stats["requests"])
+        time.sleep(1)  # để các process renderer/utility ổn định trước khi đo RSS
+        rss = proc_stats.tree_rss(driver.service.process.pid)
+    finally:
+        driver.quit()
+    return {
+        "to_form_ms": statistics.median(to_form),
+        "dcl_ms": statistics.median(dcl),
+        "kib": statistics.median(sizes) / 1024,
+        "requests": statistics.median(requests),
+        "rss_mib": rss / (1024 * 1024),
+    }
+
+
+def main():
+    import config
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default=config.TUKI_URL)
+    parser.add_argument("--loads", type=int, default=5)
+    parser.add_argument("--headed", action="store_true", help="mở Chrome có giao diện")
+    args = parser.parse_args()
+
+    results = {policy: _run(policy, args.url, args.loads, not args.headed) for policy in ("full", "lean")}
+    print(f"{'':<8} {'tới form ms':>12} {'DCL ms':>9} {'KiB':>8} {'request':>8} {'RSS MiB':>9}")
+    for policy, r in results.items():
+        print(
+            f"{policy:<8} {r['to_form_ms']:>12.0f} {r['dcl_ms']:>9.0f} {r['kib']:>8.0f}"
+            f" {r['requests']:>8.0f} {r['rss_mib']:>9.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""So sánh tìm kiếm khách hàng trên trang admin: LIKE cũ và chỉ mục FTS5 trigram.
+
+Chạy:  python benchmarks/bench_customer_search.py [--rows 100000] [--repeat 20]
+
+Script tạo một DB SQLite tạm, sinh dữ liệu giả rồi đo thời gian truy vấn
+`q` cho vài kiểu từ khóa (tiền tố email, chuỗi con SĐT, chữ trong ghi chú).
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+NOTES = ["Gói 90k", "khách thân", "ưu tiên", "gia hạn tháng", "family", "đại lý", ""]
+
+
+def _seed(db, rows: int):
+    from sqlalchemy import text
+
+    rnd = random.Random(42)
+    today = date.today()
+    now = datetime.utcnow()
+    batch = []
+    for i in range(rows):
+        batch.append(
+            {
+                "email": f"user{i:06d}.{rnd.choice(['netflix', 'family', 'tv'])}@example.com",
+                "phone": f"849{rnd.randrange(10**7, 10**8)}",
+                "expiry_date": today + timedelta(days=rnd.randint(-30, 120)),
+                "notes": f"{rnd.choice(NOTES)} #{i % 997}",
+                "created_at": now,
+                "updated_at": now,
+            }
+        )
+    db.session.execute(
+        text(
+            "INSERT INTO customer (email, phone, expiry_date, notes, created_at, updated_at) "
+            "VALUES (:email, :phone, :expiry_date, :notes, :created_at, :updated_at)"
+        ),
+        batch,
+    )
+    db.session.commit()
+
+
+def _time_query(fn, repeat: int):
+    samples = []
+    count = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), max(samples), count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix="bench-search-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+
+    import app as webapp  # noqa: E402 — cần DATABASE_URL trước khi import
+    terms = ["user0421", "0421", "49123", "ưu tiên", "family", "#99"]
+
+    with webapp.app.app_context():
+        webapp.ensure_database()
+        print(f"Sinh {args.rows} khách hàng ...", flush=True)
+        _seed(webapp.db, args.rows)
+
+        print(f"{'từ khóa':<12} {'LIKE ms':>10} {'FTS ms':>10} {'x':>6} {'kết quả':>9}")
+        for term in terms:
+            def run(use_fts, term=term):
+                query = webapp._apply_customer_search(webapp.Customer.query, term, use_fts=use_fts)
+                return query.with_entities(webapp.Customer.id).count()
+
+            like_med, _, like_count = _time_query(lambda: run(False), args.repeat)
+            fts_med, _, fts_count = _time_query(lambda: run(True), args.repeat)
+            speedup = like_med / fts_med if fts_med else float("inf")
+            hits = f"{fts_count}" if fts_count == like_count else f"{fts_count}/{like_count}"
+            print(f"{term:<12} {like_med:>10.2f} {fts_med:>10.2f} {speedup:>6.1f} {hits:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Đo thời gian khởi động của các điểm vào (web, CLI, tầng tự động hóa).
+
+Chạy:  python benchmarks/bench_startup.py [--repeat 5] [--top 8]
+
+Mỗi điểm vào chạy trong một process Python mới với `-X importtime` và một
+DATABASE_URL tạm, ghi lại:
+- thời gian wall (median) từ lúc spawn tới khi process thoát
+- tổng thời gian import (µs, cộng các module cấp cao nhất) và các module nặng nhất
+- RSS đỉnh của process con (ru_maxrss)
+- selenium có bị import hay không (process admin/CLI không được kéo Chrome vào)
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# dòng cuối của mỗi process con: selenium đã bị import chưa + RSS đỉnh (KiB trên Linux)
+CHECK_SELENIUM = (
+    "import resource, sys; "
+    "print('STARTUP', 'selenium' in sys.modules, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)"
+)
+ENTRY_MODULES = {"app", "fetch_service", "tuki_persistent", "flask.cli", "site", "runpy"}
+
+ENTRY_POINTS = {
+    "import app": f"import app\n{CHECK_SELENIUM}",
+    "flask init-db": (
+        "import sys\nfrom flask.cli import main\n"
+        "sys.argv = ['flask', '--app', 'app', 'init-db']\n"
+        f"try:\n    main()\nexcept SystemExit:\n    pass\n{CHECK_SELENIUM}"
+    ),
+    "app.py --init-db": (
+        "import runpy, sys\nsys.argv = ['app.py', '--init-db']\n"
+        f"runpy.run_path('app.py', run_name='__main__')\n{CHECK_SELENIUM}"
+    ),
+    "import fetch_service": f"import fetch_service\n{CHECK_SELENIUM}",
+    "import tuki_persistent": f"import tuki_persistent\n{CHECK_SELENIUM}",
+}
+
+
+def _parse_importtime(stderr: str):
+    """Trả về (tổng µs của các module cấp cao nhất, [(µs cumulative, tên)]).
+
+    `top` gồm module cấp 1 và cấp 2 (import trực tiếp từ điểm vào), bỏ chính điểm vào.
+    """
+    total, top = 0, []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        # cấp 1 thụt một khoảng trắng, mỗi cấp sau thêm hai
+        depth = (len(name) - len(name.lstrip()) + 1) // 2
+        us, name = int(cumulative), name.strip()
+        if depth == 1:
+            total += us
+        if depth <= 2 and name not in ENTRY_MODULES:
+            top.append((us, name))
+    top.sort(reverse=True)
+    return total, top
+
+
+def _run(code: str, env: dict) -> dict:
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, env=env, capture_output=True, text=True
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+    if proc.returncode != 0:
+        raise RuntimeError(f"{code!r} lỗi:\n{proc.stderr[-2000:]}")
+    total_us, top = _parse_importtime(proc.stderr)
+    _, selenium, maxrss = proc.stdout.strip().splitlines()[-1].split()
+    return {
+        "wall_ms": wall_ms,
+        "import_us": total_us,
+        "top": top,
+        "maxrss_kib": int(maxrss),
+        "selenium": selenium == "True",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix="bench-startup-")
+    env = dict(os.environ)
+    env["DATABASE_URL"] = f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+    env["LOG_LEVEL"] = "WARNING"
+    env["WARM_WORKER_ON_START"] = "0"
+
+    print(f"{'điểm vào':<24} {'wall ms':>8} {'import ms':>10} {'RSS MiB':>8} {'selenium':>9}")
+    details = {}
+    for label, entry in ENTRY_POINTS.items():
+        runs = [_run(entry, env) for _ in range(args.repeat)]
+        wall = statistics.median(r["wall_ms"] for r in runs)
+        imports = statistics.median(r["import_us"] for r in runs) / 1000
+        rss = statistics.median(r["maxrss_kib"] for r in runs) / 1024
+        details[label] = runs[-1]["top"][: args.top]
+        print(
+            f"{label:<24} {wall:>8.0f} {imports:>10.0f} {rss:>8.0f} {str(runs[-1]['selenium']):>9}",
+            flush=True,
+        )
+
+    print("\nModule nặng nhất (ms, cumulative, lượt cuối):")
+    for label, top in details.items():
+        print(f"  {label}: " + ", ".join(f"{name} {us / 1000:.0f}" for us, name in top))
+
+
+if __name__ == "__main__":
+    main()
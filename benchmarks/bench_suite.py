@@ -0,0 +1,308 @@
+"""Bộ benchmark các đường nóng của app.py, chạy qua Flask test client với worker giả.
+
+Chạy:  python benchmarks/bench_suite.py [--sizes 1000,10000,100000] [--activity 1000000]
+                                        [--repeat 7] [--out kết_quả.json] [--compare lần_trước.json]
+
+Mỗi kích thước DB (số khách hàng, seed dần trên cùng một tệp SQLite tạm, thêm
+`--activity` dòng nhật ký một lần lúc đầu) đo:
+
+- /api/fetch: lookup hợp lệ (worker giả trả ngay), SĐT không tồn tại, email chưa cấp quyền
+- /admin: không lọc, tìm kiếm, lọc trạng thái — "cold" (phiên bản dữ liệu tăng
+  trước mỗi lượt nên render lại) và "warm" (trúng cache khối HTML)
+- /admin/import với tệp `--import-lines` email mới (xóa lại sau mỗi lượt, không tính giờ)
+- bulk_delete `--delete-count` khách hàng (tạo trước mỗi lượt, không tính giờ)
+- helper: `_parse_timestamp_candidates`, `_evaluate_status` (µs mỗi lần gọi)
+
+Kết quả (median / p95 / min, ms) ghi ra JSON kèm commit git, phiên bản Python/SQLite
+để so sánh giữa các lần chạy; `--compare` in tỉ lệ so với một tệp kết quả cũ.
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+BENCH_EMAIL = "bench-requester@example.com"
+BENCH_PHONE = "0999000111"
+
+
+class FakeWorker:
+    """Giả TukiPersistent: trả kết quả thành công ngay, không mở Chrome."""
+
+    capacity = 4
+
+    def fetch(self, email, kind="login_code", deadline=None):
+        return {
+            "success": True,
+            "message": "OK",
+            "kind": kind,
+            "code": "1234",
+            "content": "Nội dung: 1234\nThời gian nhận: 01/02/2025 10:11:12",
+            "received_at_raw": "01/02/2025 10:11:12",
+            "received_at": "2025-02-01T10:11:12",
+        }
+
+
+def _stats(samples_ms: list[float]) -> dict:
+    ordered = sorted(samples_ms)
+    return {
+        "n": len(ordered),
+        "median_ms": round(statistics.median(ordered), 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+        "min_ms": round(ordered[0], 3),
+    }
+
+
+def _time(fn, repeat: int, *, setup=None, teardown=None, warmup: int = 1) -> dict:
+    samples = []
+    for i in range(warmup + repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        elapsed = (time.perf_counter() - start) * 1000
+        if teardown:
+            teardown()
+        if i >= warmup:
+            samples.append(elapsed)
+    return _stats(samples)
+
+
+def _seed_activity(db, rows: int, customer_ids: int):
+    from sqlalchemy import text
+
+    rnd = random.Random(11)
+    now = datetime.utcnow()
+    chunk = 50000
+    for start in range(0, rows, chunk):
+        batch = [
+            {
+                "customer_id": rnd.randint(1, max(1, customer_ids)),
+                "requester_email": f"user{rnd.randrange(customer_ids or 1):06d}@example.com",
+                "target_email": f"user{rnd.randrange(customer_ids or 1):06d}@example.com",
+                "kind": rnd.choice(("login_code", "verify_link")),
+                "success": rnd.random() > 0.2,
+                "message": "Thành công",
+                "created_at": now - timedelta(seconds=rnd.randint(0, 90 * 24 * 3600)),
+            }
+            for _ in range(min(chunk, rows - start))
+        ]
+        db.session.execute(
+            text(
+                "INSERT INTO activity_log (customer_id, requester_email, target_email, kind, success, message, created_at) "
+                "VALUES (:customer_id, :requester_email, :target_email, :kind, :success, :message, :created_at)"
+            ),
+            batch,
+        )
+        db.session.commit()
+
+
+def _bench_size(webapp, client, size: int, args) -> list[dict]:
+    from sqlalchemy import text
+
+    results = []
+
+    def record(case: str, stats: dict, **extra):
+        results.append({"customers": size, "case": case, **stats, **extra})
+        print(f"{size:>8} {case:<32} {stats['median_ms']:>10.2f} {stats['p95_ms']:>10.2f} {stats['min_ms']:>10.2f}", flush=True)
+
+    def post_fetch(payload, expect):
+        resp = client.post("/api/fetch", json=payload)
+        assert resp.status_code == expect, (payload, resp.status_code, resp.get_data(as_text=True)[:200])
+
+    ok = {"email": BENCH_EMAIL, "password": BENCH_PHONE, "kind": "login_code"}
+    record("api_fetch_ok", _time(lambda: post_fetch(ok, 200), args.repeat * 3))
+    unknown = {"email": BENCH_EMAIL, "password": "0123000000", "kind": "login_code"}
+    record("api_fetch_unknown_phone", _time(lambda: post_fetch(unknown, 403), args.repeat * 3))
+    stranger = {"email": "nobody@example.com", "password": BENCH_PHONE, "kind": "login_code"}
+    record("api_fetch_unknown_email", _time(lambda: post_fetch(stranger, 403), args.repeat * 3))
+
+    def get_admin(query):
+        resp = client.get("/admin" + query)
+        assert resp.status_code == 200, resp.status_code
+
+    def invalidate():
+        for name in ("customers", "activity", "lookups"):
+            webapp.data_versions.bump(webapp.db.session, name)
+        webapp.db.session.commit()
+
+    for label, query in (("", ""), ("_search", "?q=user0001"), ("_status_expired", "?status=expired")):
+        record(f"admin{label}_cold", _time(lambda q=query: get_admin(q), args.repeat, setup=invalidate))
+        record(f"admin{label}_warm", _time(lambda q=query: get_admin(q), args.repeat))
+
+    batch = [0]
+
+    def import_file():
+        batch[0] += 1
+        lines = "\n".join(f"import{batch[0]}-{i}@example.com" for i in range(args.import_lines))
+        resp = client.post(
+            "/admin/import",
+            data={"email_file": (io.BytesIO(lines.encode()), "emails.txt"), "next": "/admin"},
+            content_type="multipart/form-data",
+        )
+        assert resp.status_code == 302, resp.status_code
+
+    def drop_imported():
+        webapp.db.session.execute(text("DELETE FROM customer WHERE email LIKE 'import%'"))
+        webapp.db.session.commit()
+
+    record(
+        f"admin_import_{args.import_lines}",
+        _time(import_file, max(3, args.repeat // 2), teardown=drop_imported),
+    )
+
+    ids: list[int] = []
+
+    def create_victims():
+        webapp.db.session.execute(
+            text("INSERT INTO customer (email, phone, created_at, updated_at) VALUES (:e, '', :t, :t)"),
+            [{"e": f"victim-{i}@example.com", "t": datetime.utcnow()} for i in range(args.delete_count)],
+        )
+        webapp.db.session.commit()
+        ids[:] = [
+            row[0] for row in webapp.db.session.execute(text("SELECT id FROM customer WHERE email LIKE 'victim-%'"))
+        ]
+
+    def bulk_delete():
+        resp = client.post(
+            "/admin/manage",
+            data={"action": "bulk_delete", "customer_ids": [str(i) for i in ids], "next": "/admin"},
+        )
+        assert resp.status_code == 302, resp.status_code
+
+    record(f"bulk_delete_{args.delete_count}", _time(bulk_delete, max(3, args.repeat // 2), setup=create_victims))
+    webapp.db.session.remove()
+    return results
+
+
+def _bench_helpers(webapp, number: int) -> list[dict]:
+    today = date.today()
+    cases = {
+        "parse_timestamp_rfc": lambda: webapp._parse_timestamp_candidates("Mon, 01 Jan 2024 10:00:00"),
+        "parse_timestamp_vn": lambda: webapp._parse_timestamp_candidates("01/02/2025 10:11:12"),
+        "parse_timestamp_invalid": lambda: webapp._parse_timestamp_candidates("không phải ngày"),
+        "evaluate_status": lambda: webapp._evaluate_status(today + timedelta(days=3), today),
+        "evaluate_status_default_today": lambda: webapp._evaluate_status(today + timedelta(days=30)),
+    }
+    results = []
+    for case, fn in cases.items():
+        runs = [t / number * 1e6 for t in timeit.repeat(fn, number=number, repeat=5)]
+        results.append({"case": case, "median_us": round(statistics.median(runs), 3), "min_us": round(min(runs), 3)})
+        print(f"{'helper':>8} {case:<32} {statistics.median(runs):>9.2f}µs", flush=True)
+    return results
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _compare(current: dict, previous_path: str):
+    with open(previous_path, encoding="utf-8") as fh:
+        previous = json.load(fh)
+    old = {(r.get("customers"), r["case"]): r for r in previous.get("results", [])}
+    print(f"\nSo với {previous_path} (commit {previous.get('meta', {}).get('commit')}): median mới / cũ")
+    for r in current["results"]:
+        before = old.get((r.get("customers"), r["case"]))
+        if before and before.get("median_ms"):
+            print(f"{r['customers']:>8} {r['case']:<32} {r['median_ms'] / before['median_ms']:>6.2f}x")
+    old_helpers = {r["case"]: r for r in previous.get("helpers", [])}
+    for r in current["helpers"]:
+        before = old_helpers.get(r["case"])
+        if before and before.get("median_us"):
+            print(f"{'helper':>8} {r['case']:<32} {r['median_us'] / before['median_us']:>6.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--activity", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--import-lines", type=int, default=5000)
+    parser.add_argument("--delete-count", type=int, default=500)
+    parser.add_argument("--helper-calls", type=int, default=20000)
+    parser.add_argument("--out", default=None, help="tệp JSON kết quả (mặc định benchmarks/results/suite-<thời điểm>.json)")
+    parser.add_argument("--compare", default=None, help="tệp JSON của lần chạy trước")
+    args = parser.parse_args()
+    sizes = sorted(int(s) for s in args.sizes.split(",") if s.strip())
+
+    tmpdir = tempfile.mkdtemp(prefix="bench-suite-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    # benchmark gọi liên tục cùng SĐT/email/IP: tắt rate limit, không mở Chrome, không việc nền
+    for name in ("FETCH_RATE_PHONE", "FETCH_RATE_EMAIL", "FETCH_RATE_IP"):
+        os.environ[name] = "0/1"
+    os.environ["WARM_WORKER_ON_START"] = "false"
+    os.environ["MEMDIAG_SAMPLE_SECONDS"] = "0"
+    os.environ["BACKUP_INTERVAL_HOURS"] = "0"
+
+    import app as webapp  # noqa: E402 — cần biến môi trường trước khi import
+    from bench_admin_views import _seed
+    from fetch_service import SessionPool
+
+    # qua SessionPool như khi chạy thật để đo cả hàng đợi ưu tiên
+    webapp._worker = SessionPool(FakeWorker.capacity, FakeWorker)
+    client = webapp.app.test_client()
+    with client.session_transaction() as sess:
+        sess["is_admin"] = True
+
+    report = {
+        "meta": {
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+        "results": [],
+        "helpers": [],
+    }
+
+    print(f"{'khách':>8} {'case':<32} {'median ms':>10} {'p95 ms':>10} {'min ms':>10}")
+    with webapp.app.app_context():
+        webapp.ensure_database()
+        webapp.db.session.add(
+            webapp.Customer(email=BENCH_EMAIL, phone=BENCH_PHONE, expiry_date=date.today() + timedelta(days=60))
+        )
+        webapp.db.session.commit()
+        started = time.perf_counter()
+        _seed_activity(webapp.db, args.activity, sizes[-1] if sizes else 1)
+        print(f"(seed {args.activity} dòng nhật ký: {time.perf_counter() - started:.1f}s)", flush=True)
+
+        seeded = 0
+        for size in sizes:
+            _seed(webapp.db, size - seeded, start=seeded)
+            webapp._sweep_customer_status()  # INSERT thô không đi qua model → tính status
+            seeded = size
+            report["results"].extend(_bench_size(webapp, client, size, args))
+        report["helpers"] = _bench_helpers(webapp, args.helper_calls)
+
+    out = args.out or os.path.join(ROOT, "benchmarks", "results", f"suite-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as fh:
+        json.dump(report, fh, ensure_ascii=False, indent=2)
+    print(f"\nĐã ghi {out}")
+    if args.compare:
+        _compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Báo cáo dung lượng truyền tải và thời gian tải lại trang (trước/sau nén + cache).
+
+Chạy:  python benchmarks/bench_transfer_sizes.py [--rtt-ms 150] [--kbps 1600]
+
+Đo bằng Flask test client:
+- "trước": phản hồi không nén, tệp tĩnh không có ?v= (trình duyệt phải hỏi lại
+  server mỗi lần vào trang và nhận 304), JSON /api/fetch còn các trường thời gian
+  trùng lặp (timestamp, timestamp_raw, timestamp_iso).
+- "sau": gzip/brotli theo Accept-Encoding, tệp tĩnh fingerprint + immutable.
+
+Thời gian tải là ước lượng theo mô hình đơn giản: mỗi lượt request tuần tự tốn một
+RTT cộng thời gian truyền theo băng thông; không tính thời gian render.
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+class FakeWorker:
+    def fetch(self, email, kind="login_code", **_):
+        return {
+            "success": True,
+            "message": "OK",
+            "kind": kind,
+            "content": "Nội dung: 4821\nThời gian nhận: Mon, 06 Oct 2025 10:21:33",
+            "code": "4821",
+            "received_at_raw": "Mon, 06 Oct 2025 10:21:33",
+            "received_at": "2025-10-06T10:21:33",
+        }
+
+
+def _load_ms(requests_bytes, rtt_ms, kbps):
+    # tuần tự: HTML trước, sau đó CSS + JS song song (tính như 1 RTT chung)
+    if not requests_bytes:
+        return 0.0
+    html, *assets = requests_bytes
+    total = rtt_ms + html * 8 / kbps
+    if assets:
+        total += rtt_ms + sum(assets) * 8 / kbps
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rtt-ms", type=float, default=150.0)
+    parser.add_argument("--kbps", type=float, default=1600.0, help="băng thông tải xuống (kbit/s)")
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix="bench-transfer-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+
+    import app as webapp  # noqa: E402 — cần DATABASE_URL trước khi import
+
+    webapp._worker = FakeWorker()
+    client = webapp.app.test_client()
+    with webapp.app.app_context():
+        webapp.ensure_database()
+        webapp.db.session.add(webapp.Customer(email="khach@example.com", phone="84901234567"))
+        webapp.db.session.commit()
+
+    identity = {"Accept-Encoding": "identity"}
+    compressed = {"Accept-Encoding": "br, gzip"}
+
+    page = client.get("/", headers=identity)
+    asset_urls = re.findall(r'(?:href|src)="(/static/[^"]+)"', page.get_data(as_text=True))
+
+    rows = []
+
+    def add(name, before, after_response):
+        encoding = after_response.headers.get("Content-Encoding") or "identity"
+        rows.append((name, before, len(after_response.data), encoding))
+
+    # HTML
+    page_after = client.get("/", headers=compressed)
+    add("index.html", len(page.data), page_after)
+
+    # Tệp tĩnh
+    before_first = [len(page.data)]
+    after_first = [len(page_after.data)]
+    before_repeat = [len(page.data)]
+    after_repeat = [len(page_after.data)]
+    for url in asset_urls:
+        bare = url.split("?", 1)[0]
+        old = client.get(bare, headers=identity)
+        new = client.get(url, headers=compressed)
+        add(os.path.basename(bare), len(old.data), new)
+        before_first.append(len(old.data))
+        after_first.append(len(new.data))
+        # lần sau: trước đây phải hỏi lại (304, thân rỗng); giờ immutable nên không gửi request
+        reval = client.get(bare, headers={**identity, "If-None-Match": old.headers.get("ETag", "")})
+        before_repeat.append(len(reval.data))
+        old.close()
+
+    # JSON /api/fetch
+    payload = {"email": "khach@example.com", "password": "84901234567", "kind": "login_code"}
+    api_after = client.post("/api/fetch", json=payload, headers=compressed)
+    api_plain = client.post("/api/fetch", json=payload, headers=identity).get_json()
+    legacy = dict(api_plain)
+    legacy.update(
+        timestamp_raw=legacy["received_at_raw"],
+        timestamp_iso=legacy["received_at"],
+        timestamp=legacy["received_at_raw"],
+    )
+    add("/api/fetch JSON", len(json.dumps(legacy).encode()), api_after)
+
+    print("# Dung lượng truyền tải (byte)\n")
+    print("| tài nguyên | trước | sau | encoding | giảm |")
+    print("|---|---:|---:|---|---:|")
+    for name, before, after, encoding in rows:
+        saved = 100 * (1 - after / before) if before else 0
+        print(f"| {name} | {before} | {after} | {encoding} | {saved:.0f}% |")
+
+    print(f"\n# Thời gian tải ước lượng (RTT {args.rtt_ms:.0f} ms, {args.kbps:.0f} kbit/s)\n")
+    print("| lượt | trước | sau |")
+    print("|---|---:|---:|")
+    print(
+        f"| lần đầu | {_load_ms(before_first, args.rtt_ms, args.kbps):.0f} ms "
+        f"| {_load_ms(after_first, args.rtt_ms, args.kbps):.0f} ms |"
+    )
+    print(
+        f"| vào lại | {_load_ms(before_repeat, args.rtt_ms, args.kbps):.0f} ms "
+        f"({len(before_repeat)} request) | {_load_ms(after_repeat, args.rtt_ms, args.kbps):.0f} ms "
+        f"({len(after_repeat)} request) |"
+    )
+
+
+if __name__ == "__main__":
+    main()
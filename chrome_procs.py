@@ -0,0 +1,236 @@
+"""Theo dõi và dọn process Chrome/chromedriver do app mở.
+
+Mỗi phiên TukiPersistent chạy chromedriver với hai biến môi trường. Chrome và
+các process con của nó thừa hưởng cả hai:
+
+    TUKI_OWNER=<pid>:<starttime>   process Python sở hữu phiên
+    TUKI_SESSION=<id>              phiên cụ thể trong process đó
+
+Nhờ hai biến này, app nhận ra process của mình mà không đụng tới Chrome khác
+trên máy, kể cả khi process cha đã chết và process con bị chuyển sang init.
+
+Một process được coi là mồ côi khi:
+- process sở hữu không còn sống (pid đã chết, hoặc pid bị dùng lại với starttime khác), hoặc
+- process sở hữu chính là process này nhưng phiên đã bị hủy đăng ký. Trường hợp
+  này xảy ra khi driver bị bỏ mà `quit()` không đóng hết Chrome.
+
+Chỉ hoạt động trên Linux (/proc). Trên hệ điều hành khác, danh sách process luôn rỗng.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import signal
+import threading
+import time
+import uuid
+
+import proc_stats
+
+log = logging.getLogger("chrome_procs")
+
+OWNER_ENV = "TUKI_OWNER"
+SESSION_ENV = "TUKI_SESSION"
+
+_live_sessions: set[str] = set()
+_sessions_lock = threading.Lock()
+_owner_tag: str | None = None
+_last_reap: dict | None = None
+_reaper_started = False
+_gauge_cache: tuple[float, dict] | None = None
+_gauge_lock = threading.Lock()
+
+
+def owner_tag() -> str:
+    global _owner_tag
+    pid = os.getpid()
+    if _owner_tag is None or not _owner_tag.startswith(f"{pid}:"):  # sau fork pid đổi
+        _owner_tag = f"{pid}:{proc_stats.start_time(pid) or 0}"
+    return _owner_tag
+
+
+def register_session() -> tuple[str, dict[str, str]]:
+    """Đăng ký một phiên mới; trả về (session id, env cho chromedriver)."""
+    session_id = uuid.uuid4().hex[:12]
+    with _sessions_lock:
+        _live_sessions.add(session_id)
+    return session_id, {**os.environ, OWNER_ENV: owner_tag(), SESSION_ENV: session_id}
+
+
+def unregister_session(session_id: str | None):
+    if session_id:
+        with _sessions_lock:
+            _live_sessions.discard(session_id)
+
+
+def tagged_processes() -> list[dict]:
+    """Mọi process (chromedriver, Chrome và con của Chrome) mang thẻ của app."""
+    found = []
+    try:
+        pids = [int(name) for name in os.listdir("/proc") if name.isdigit()]
+    except OSError:
+        return found
+    for pid in pids:
+        env = proc_stats.environ(pid)
+        owner = env.get(OWNER_ENV)
+        if not owner:
+            continue
+        info = proc_stats.process_info(pid)
+        if info is None:
+            continue
+        info.update(owner=owner, session=env.get(SESSION_ENV, ""))
+        found.append(info)
+    return found
+
+
+def _owner_alive(owner: str) -> bool:
+    pid, _, started = owner.partition(":")
+    try:
+        pid = int(pid)
+    except ValueError:
+        return False
+    current = proc_stats.start_time(pid)
+    return current is not None and str(current) == started
+
+
+def find_orphans(procs: list[dict] | None = None) -> list[dict]:
+    procs = tagged_processes() if procs is None else procs
+    me = owner_tag()
+    with _sessions_lock:
+        live = set(_live_sessions)
+    alive_cache: dict[str, bool] = {}
+    orphans = []
+    for proc in procs:
+        owner = proc["owner"]
+        if owner == me:
+            if proc["session"] not in live:
+                orphans.append(proc)
+            continue
+        if owner not in alive_cache:
+            alive_cache[owner] = _owner_alive(owner)
+        if not alive_cache[owner]:
+            orphans.append(proc)
+    return orphans
+
+
+def kill_pids(pids: list[int], grace: float = 3.0) -> list[int]:
+    """SIGTERM rồi SIGKILL những process còn sống sau `grace` giây; trả về pid đã gửi tín hiệu."""
+    signalled = []
+    for pid in pids:
+        try:
+            os.kill(pid, signal.SIGTERM)
+            signalled.append(pid)
+        except OSError:
+            pass
+    deadline = time.monotonic() + grace
+    remaining = list(signalled)
+    while remaining and time.monotonic() < deadline:
+        time.sleep(0.1)
+        remaining = [pid for pid in remaining if proc_stats.process_info(pid) is not None and _not_zombie(pid)]
+    for pid in remaining:
+        try:
+            os.kill(pid, getattr(signal, "SIGKILL", signal.SIGTERM))
+        except OSError:
+            pass
+    return signalled
+
+
+def _not_zombie(pid: int) -> bool:
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as fh:
+            return fh.read().rpartition(b")")[2].split()[0] != b"Z"
+    except (OSError, IndexError):
+        return False
+
+
+def kill_session(session_id: str | None, grace: float = 3.0) -> list[int]:
+    """Dọn mọi process còn sót của một phiên (gọi sau `driver.quit()`)."""
+    if not session_id:
+        return []
+    me = owner_tag()
+    pids = [p["pid"] for p in tagged_processes() if p["owner"] == me and p["session"] == session_id]
+    if pids:
+        log.warning("Chrome còn sót sau quit(), buộc dừng", extra={"session": session_id, "pids": pids})
+    return kill_pids(pids, grace)
+
+
+def reap_orphans(grace: float = 3.0) -> dict:
+    global _last_reap
+    orphans = find_orphans()
+    killed = kill_pids([p["pid"] for p in orphans], grace) if orphans else []
+    _last_reap = {
+        "at": time.time(),
+        "killed": len(killed),
+        "rss_freed": sum(p["rss"] for p in orphans if p["pid"] in killed),
+    }
+    if killed:
+        log.warning("Đã dọn process Chrome mồ côi", extra=_last_reap)
+        _clear_gauge_cache()
+    return _last_reap
+
+
+def start_reaper(interval: float):
+    """Luồng nền dọn process mồ côi mỗi `interval` giây (0 = tắt); gọi nhiều lần chỉ chạy một luồng."""
+    global _reaper_started
+    with _sessions_lock:
+        if _reaper_started or interval <= 0:
+            return
+        _reaper_started = True
+
+    def loop():
+        while True:
+            try:
+                reap_orphans()
+            except Exception:
+                log.exception("Dọn process Chrome lỗi")
+            time.sleep(interval)
+
+    threading.Thread(target=loop, name="chrome-reaper", daemon=True).start()
+
+
+def gauge(max_age: float = 5.0) -> dict:
+    """Số process và tổng RSS theo từng process sở hữu, kèm số process mồ côi.
+
+    Quét /proc tốn vài chục ms khi máy nhiều process, nên kết quả được giữ lại
+    `max_age` giây: /admin, metrics và chẩn đoán bộ nhớ gọi liên tục vẫn chỉ quét
+    một lần. `max_age=0` buộc quét lại.
+    """
+    global _gauge_cache
+    with _gauge_lock:
+        cached = _gauge_cache
+        if cached is not None and time.monotonic() - cached[0] < max_age:
+            return {**cached[1], "last_reap": _last_reap}
+        result = _scan_gauge()
+        _gauge_cache = (time.monotonic(), result)
+        return result
+
+
+def _clear_gauge_cache():
+    global _gauge_cache
+    with _gauge_lock:
+        _gauge_cache = None
+
+
+def _scan_gauge() -> dict:
+    procs = tagged_processes()
+    orphan_pids = {p["pid"] for p in find_orphans(procs)}
+    owners: dict[str, dict] = {}
+    for proc in procs:
+        entry = owners.setdefault(proc["owner"], {"processes": 0, "rss": 0, "sessions": set()})
+        entry["processes"] += 1
+        entry["rss"] += proc["rss"]
+        entry["sessions"].add(proc["session"])
+    return {
+        "processes": len(procs),
+        "rss": sum(p["rss"] for p in procs),
+        "drivers": sum(1 for p in procs if p["name"].startswith("chromedriver")),
+        "orphans": len(orphan_pids),
+        "orphan_rss": sum(p["rss"] for p in procs if p["pid"] in orphan_pids),
+        "owners": [
+            {"owner": owner, "processes": e["processes"], "rss": e["rss"], "sessions": len(e["sessions"])}
+            for owner, e in sorted(owners.items())
+        ],
+        "last_reap": _last_reap,
+        "scanned_at": time.time(),
+    }
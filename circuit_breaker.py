@@ -0,0 +1,129 @@
+"""Circuit breaker cho backend Tukitech.
+
+- closed: cho mọi request đi qua, ghi nhận lỗi/timeout trong cửa sổ gần nhất.
+- open: đủ `failure_threshold` lỗi trong `window` giây → từ chối ngay, hẹn giờ
+  thử lại (probe) sau `recovery_timeout` giây.
+- half_open: tới giờ hẹn, đúng một request được đi qua làm probe. Thành công thì
+  đóng lại; thất bại thì mở tiếp với thời gian chờ gấp đôi (tối đa `max_recovery`).
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitOpen(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__("circuit open")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        *,
+        failure_threshold: int = 5,
+        window: float = 120.0,
+        recovery_timeout: float = 30.0,
+        max_recovery: float = 600.0,
+        slow_call_seconds: float = 60.0,
+    ):
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.window = window
+        self.recovery_timeout = recovery_timeout
+        self.max_recovery = max_recovery
+        self.slow_call_seconds = slow_call_seconds
+
+        self.state = CLOSED
+        self._failures: deque[float] = deque()
+        self._current_recovery = recovery_timeout
+        self._next_probe_at = 0.0
+        self._opened_at: float | None = None
+        self._probe_in_flight = False
+        self._last_error = ""
+        self._counters = {"calls": 0, "failures": 0, "slow": 0, "short_circuited": 0, "opened": 0}
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Gọi trước mỗi lookup; ném CircuitOpen nếu phải từ chối ngay."""
+        now = time.monotonic()
+        with self._lock:
+            if self.state == CLOSED:
+                self._counters["calls"] += 1
+                return
+            if self.state == OPEN and now >= self._next_probe_at and not self._probe_in_flight:
+                self.state = HALF_OPEN
+                self._probe_in_flight = True
+                self._counters["calls"] += 1
+                return
+            self._counters["short_circuited"] += 1
+            raise CircuitOpen(max(1.0, self._next_probe_at - now))
+
+    def record(self, ok: bool, duration: float, error: str = ""):
+        """Ghi kết quả của một lookup đã được `before_call` cho phép."""
+        now = time.monotonic()
+        slow = duration >= self.slow_call_seconds
+        failed = (not ok) or slow
+        with self._lock:
+            if slow:
+                self._counters["slow"] += 1
+            if failed:
+                self._counters["failures"] += 1
+                self._last_error = error or ("timeout" if slow else "failure")
+
+            if self.state == HALF_OPEN:
+                self._probe_in_flight = False
+                if failed:
+                    self._current_recovery = min(self._current_recovery * 2, self.max_recovery)
+                    self._open(now)
+                else:
+                    self._close()
+                return
+
+            if not failed:
+                return
+            self._failures.append(now)
+            while self._failures and now - self._failures[0] > self.window:
+                self._failures.popleft()
+            if self.state == CLOSED and len(self._failures) >= self.failure_threshold:
+                self._open(now)
+
+    def cancel(self):
+        """Lookup đã được `before_call` cho phép nhưng không tới được Tukitech (kẹt hàng đợi).
+
+        Không tính đúng/sai; nếu đó là probe half-open thì trả lượt để lookup sau probe lại.
+        """
+        with self._lock:
+            if self.state == HALF_OPEN and self._probe_in_flight:
+                self._probe_in_flight = False
+                self.state = OPEN
+
+    def _open(self, now: float):
+        if self.state != OPEN:
+            self._counters["opened"] += 1
+        self.state = OPEN
+        self._opened_at = self._opened_at or now
+        self._next_probe_at = now + self._current_recovery
+
+    def _close(self):
+        self.state = CLOSED
+        self._failures.clear()
+        self._opened_at = None
+        self._current_recovery = self.recovery_timeout
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "state": self.state,
+                "recent_failures": sum(1 for t in self._failures if now - t <= self.window),
+                "failure_threshold": self.failure_threshold,
+                "open_for": round(now - self._opened_at, 1) if self._opened_at else 0,
+                "next_probe_in": round(max(0.0, self._next_probe_at - now), 1) if self.state != CLOSED else 0,
+                "last_error": self._last_error,
+                "counters": dict(self._counters),
+            }
@@ -23,3 +23,131 @@ def _as_bool(value: str | None, default: bool = True) -> bool:
 
 # Bật headless khi chạy trên Ubuntu/SSH để Chrome không cần UI.
 TUKI_HEADLESS = _as_bool(os.getenv('TUKI_HEADLESS'), default=True)
+
+# lean: chặn ảnh/font/script bên thứ ba và tắt tính năng nền của Chrome; full: tải đủ như trình duyệt thường
+TUKI_RESOURCE_POLICY = os.getenv('TUKI_RESOURCE_POLICY', 'lean').strip().lower()
+# Mẫu URL chặn thêm (cách nhau bởi dấu phẩy), ví dụ "*widget.example.com*"
+TUKI_BLOCK_EXTRA = tuple(p.strip() for p in os.getenv('TUKI_BLOCK_EXTRA', '').split(',') if p.strip())
+
+# Giữ user-data-dir riêng cho từng phiên Chrome (TUKI_PROFILE_DIR/slot-N, có khóa tệp)
+# để cookie Tukitech còn sau khi khởi động lại → vào thẳng form tìm kiếm
+TUKI_PERSIST_PROFILE = _as_bool(os.getenv('TUKI_PERSIST_PROFILE'), default=False)
+TUKI_PROFILE_DIR = os.getenv('TUKI_PROFILE_DIR', os.path.join(BASE_DIR, 'chrome_sessions'))
+
+# Chu kỳ (giây) dọn process Chrome/chromedriver mồ côi do app mở (0 = tắt)
+TUKI_REAP_INTERVAL = max(0.0, float(os.getenv('TUKI_REAP_INTERVAL', '300')))
+
+# Mở sẵn phiên Chrome khi chạy `python app.py`; đặt false cho process chỉ phục vụ admin
+WARM_WORKER_ON_START = _as_bool(os.getenv('WARM_WORKER_ON_START'), default=True)
+
+# Dịch vụ fetch dùng chung: chạy `python fetch_service.py` một lần trên máy, rồi
+# đặt FETCH_SERVICE_URL để mọi worker web gọi qua localhost thay vì tự mở Chrome.
+FETCH_SERVICE_URL = os.getenv('FETCH_SERVICE_URL', '').strip()
+FETCH_SERVICE_HOST = os.getenv('FETCH_SERVICE_HOST', '127.0.0.1')
+FETCH_SERVICE_PORT = int(os.getenv('FETCH_SERVICE_PORT', '5055'))
+FETCH_SERVICE_TIMEOUT = float(os.getenv('FETCH_SERVICE_TIMEOUT', '150'))
+# Số phiên Chrome tối đa (trong dịch vụ fetch hoặc trong process web nếu không dùng dịch vụ)
+TUKI_POOL_SIZE = max(1, int(os.getenv('TUKI_POOL_SIZE', '1')))
+
+
+def _as_rate(value: str | None, default: tuple[float, int]) -> tuple[float, int]:
+    """'<số request mỗi phút>/<burst>', ví dụ '6/3'. Rate 0 = không giới hạn."""
+    if not value:
+        return default
+    try:
+        rate, _, burst = str(value).partition('/')
+        return float(rate), int(burst or max(1, int(float(rate))))
+    except ValueError:
+        return default
+
+
+# Giới hạn /api/fetch (token bucket theo SĐT, email requester, IP client)
+FETCH_RATE_PHONE = _as_rate(os.getenv('FETCH_RATE_PHONE'), (6, 3))
+FETCH_RATE_EMAIL = _as_rate(os.getenv('FETCH_RATE_EMAIL'), (6, 3))
+FETCH_RATE_IP = _as_rate(os.getenv('FETCH_RATE_IP'), (30, 10))
+# Số lookup trình duyệt chạy/chờ cùng lúc; vượt quá thì trả 503 ngay
+FETCH_MAX_INFLIGHT = max(1, int(os.getenv('FETCH_MAX_INFLIGHT', str(TUKI_POOL_SIZE * 3))))
+FETCH_SLOT_WAIT = float(os.getenv('FETCH_SLOT_WAIT', '0.5'))
+# Nhớ SĐT không tồn tại trong N giây để khỏi truy vấn DB/ghi log lặp lại
+FETCH_UNKNOWN_PHONE_TTL = float(os.getenv('FETCH_UNKNOWN_PHONE_TTL', '300'))
+# Đặt true khi chạy sau reverse proxy để lấy IP client từ X-Forwarded-For
+TRUST_PROXY_HEADERS = _as_bool(os.getenv('TRUST_PROXY_HEADERS'), default=False)
+
+# Nơi lưu rate limit / cache SĐT sai / lookup đang chạy, dùng chung khi chạy nhiều
+# worker hoặc nhiều node: memory | sqlite:///đường/dẫn/state.db | redis://host:6379/0
+STATE_BACKEND = os.getenv('STATE_BACKEND', 'memory').strip()
+
+# Tra cứu hàng loạt từ trang admin: số email tối đa mỗi lần và số lookup chạy song song
+# (không vượt số phiên Chrome hiện có)
+BATCH_LOOKUP_MAX_ITEMS = max(1, int(os.getenv('BATCH_LOOKUP_MAX_ITEMS', '50')))
+BATCH_LOOKUP_CONCURRENCY = max(1, int(os.getenv('BATCH_LOOKUP_CONCURRENCY', str(TUKI_POOL_SIZE))))
+
+# Hàng đợi ưu tiên trong nhóm phiên Chrome (chạy đồng thời tối đa TUKI_POOL_SIZE lookup):
+# trọng số từng lớp và số lookup chờ tối đa mỗi lớp (vượt quá thì trả 503 ngay)
+SCHEDULER_WEIGHTS = {
+    'admin': max(0.01, float(os.getenv('SCHEDULER_WEIGHT_ADMIN', '8'))),
+    'customer': max(0.01, float(os.getenv('SCHEDULER_WEIGHT_CUSTOMER', '4'))),
+    'background': max(0.01, float(os.getenv('SCHEDULER_WEIGHT_BACKGROUND', '1'))),
+}
+SCHEDULER_MAX_QUEUE = max(1, int(os.getenv('SCHEDULER_MAX_QUEUE', '50')))
+
+# Circuit breaker quanh Tukitech: mở khi có N lỗi/timeout trong WINDOW giây,
+# thử lại sau RECOVERY giây (gấp đôi sau mỗi lần thử thất bại). Lookup lâu hơn
+# SLOW giây cũng tính là lỗi.
+TUKI_BREAKER_FAILURES = int(os.getenv('TUKI_BREAKER_FAILURES', '5'))
+TUKI_BREAKER_WINDOW = float(os.getenv('TUKI_BREAKER_WINDOW', '120'))
+TUKI_BREAKER_RECOVERY = float(os.getenv('TUKI_BREAKER_RECOVERY', '30'))
+TUKI_BREAKER_SLOW = float(os.getenv('TUKI_BREAKER_SLOW', '60'))
+
+# Ngân sách thời gian (giây) cho toàn bộ một request theo loại, nên thấp hơn
+# timeout của reverse proxy (nginx mặc định 60 giây).
+FETCH_DEADLINES = {
+    'login_code': float(os.getenv('FETCH_DEADLINE_LOGIN_CODE', '50')),
+    'verify_link': float(os.getenv('FETCH_DEADLINE_VERIFY_LINK', '50')),
+    'login_tv': float(os.getenv('FETCH_DEADLINE_LOGIN_TV', '40')),
+}
+
+# Lịch sử lookup: khi Tukitech quá hạn, trả kết quả gần nhất không cũ hơn
+# LOOKUP_STALE_MAX_AGE giây (0 = tắt) kèm cờ "stale" và làm mới ở nền
+LOOKUP_STALE_MAX_AGE = max(0.0, float(os.getenv('LOOKUP_STALE_MAX_AGE', '600')))
+LOOKUP_HISTORY_DAYS = max(1, int(os.getenv('LOOKUP_HISTORY_DAYS', '30')))
+
+# Export CSV/NDJSON: số dòng đọc từ DB mỗi lượt (bộ nhớ không phụ thuộc tổng số dòng)
+EXPORT_BATCH_SIZE = max(100, int(os.getenv('EXPORT_BATCH_SIZE', '1000')))
+# SQLite ở chế độ WAL để đọc dài (export) không chặn ghi
+SQLITE_WAL = _as_bool(os.getenv('SQLITE_WAL'), default=True)
+
+# Sao lưu data.db (SQLite online backup): `flask --app app backup-db` hoặc tự động
+# mỗi BACKUP_INTERVAL_HOURS giờ (0 = tắt). Mỗi bước chép BACKUP_PAGES_PER_STEP trang
+# rồi nghỉ BACKUP_STEP_SLEEP_MS ms; giữ BACKUP_KEEP bản gần nhất.
+BACKUP_DIR = os.getenv('BACKUP_DIR', os.path.join(BASE_DIR, 'backups'))
+BACKUP_INTERVAL_HOURS = max(0.0, float(os.getenv('BACKUP_INTERVAL_HOURS', '0')))
+BACKUP_KEEP = max(1, int(os.getenv('BACKUP_KEEP', '14')))
+BACKUP_PAGES_PER_STEP = max(1, int(os.getenv('BACKUP_PAGES_PER_STEP', '256')))
+BACKUP_STEP_SLEEP_MS = max(0.0, float(os.getenv('BACKUP_STEP_SLEEP_MS', '5')))
+BACKUP_COMPRESS = _as_bool(os.getenv('BACKUP_COMPRESS'), default=True)
+
+# Số khối HTML của trang admin giữ trong bộ nhớ (theo bộ lọc/tìm kiếm + phiên bản dữ liệu)
+ADMIN_FRAGMENT_CACHE_SIZE = max(1, int(os.getenv('ADMIN_FRAGMENT_CACHE_SIZE', '64')))
+ADMIN_FRAGMENT_CACHE_MB = float(os.getenv('ADMIN_FRAGMENT_CACHE_MB', '64'))
+
+# Quét lại trạng thái hạn dùng của khách ngay sau 00:00 giờ Việt Nam mỗi ngày
+STATUS_SWEEP_DAILY = _as_bool(os.getenv('STATUS_SWEEP_DAILY'), default=True)
+
+# Số luồng SSE nhật ký hoạt động tối đa mỗi process (mỗi tab admin giữ một luồng worker);
+# vượt quá thì tab đó chuyển sang polling
+ACTIVITY_STREAM_MAX_CLIENTS = max(1, int(os.getenv('ACTIVITY_STREAM_MAX_CLIENTS', '4')))
+
+# Chẩn đoán bộ nhớ: lấy mẫu RSS/cache mỗi MEMDIAG_SAMPLE_SECONDS giây (0 = tắt),
+# giữ MEMDIAG_HISTORY mẫu gần nhất; MEMDIAG_TRACEMALLOC=true bật tracemalloc từ đầu
+MEMDIAG_SAMPLE_SECONDS = max(0.0, float(os.getenv('MEMDIAG_SAMPLE_SECONDS', '60')))
+MEMDIAG_HISTORY = max(1, int(os.getenv('MEMDIAG_HISTORY', '360')))
+MEMDIAG_TRACEMALLOC = _as_bool(os.getenv('MEMDIAG_TRACEMALLOC'), default=False)
+
+# Thư mục lưu profile tạo từ trang admin (profiling theo yêu cầu)
+PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(BASE_DIR, 'profiles'))
+
+# Logging: LOG_FORMAT=json|text; dòng log thành công lặp nhiều chỉ giữ lại theo tỉ lệ
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json').strip().lower()
+LOG_SUCCESS_SAMPLE_RATE = min(1.0, max(0.0, float(os.getenv('LOG_SUCCESS_SAMPLE_RATE', '1'))))
@@ -0,0 +1,95 @@
+"""Ngân sách thời gian (deadline) cho một request, truyền xuống từng bước chờ.
+
+    dl = Deadline(50, label="login_code")
+    with dl.stage("search_page"):
+        WebDriverWait(driver, dl.timeout(20)).until(...)
+
+Mỗi bước chờ chỉ dùng phần còn lại của ngân sách (`timeout(cap)`), thời gian của
+từng giai đoạn được ghi lại để báo cáo giai đoạn nào đã tiêu hết thời gian.
+"""
+
+from __future__ import annotations
+
+import time
+from contextlib import contextmanager
+
+
+class DeadlineExceeded(Exception):
+    def __init__(self, deadline: "Deadline"):
+        super().__init__(f"deadline exceeded at stage '{deadline.current_stage}'")
+        self.deadline = deadline
+
+
+class Deadline:
+    def __init__(self, seconds: float, *, label: str = ""):
+        self.budget = float(seconds)
+        self.label = label
+        self.started = time.monotonic()
+        self.expires_at = self.started + self.budget
+        self.current_stage = ""
+        self.stages: list[tuple[str, float]] = []
+
+    @classmethod
+    def coerce(cls, value, default: float, *, label: str = "") -> "Deadline":
+        """Nhận Deadline có sẵn, số giây còn lại, hoặc None (dùng `default`)."""
+        if isinstance(value, Deadline):
+            return value
+        if value is None:
+            return cls(default, label=label)
+        return cls(float(value), label=label)
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def check(self):
+        if self.expired:
+            raise DeadlineExceeded(self)
+
+    def timeout(self, cap: float | None = None, floor: float = 0.1) -> float:
+        """Thời gian chờ cho bước kế tiếp: min(cap, phần còn lại); hết hạn thì ném lỗi."""
+        self.check()
+        remaining = self.remaining()
+        value = remaining if cap is None else min(cap, remaining)
+        return max(floor, value)
+
+    @contextmanager
+    def stage(self, name: str):
+        previous = self.current_stage
+        self.current_stage = name
+        start = time.monotonic()
+        try:
+            yield self
+        finally:
+            self.stages.append((name, time.monotonic() - start))
+            if not self.expired:
+                self.current_stage = previous
+
+    def report(self) -> dict:
+        slowest = max(self.stages, key=lambda item: item[1])[0] if self.stages else ""
+        return {
+            "label": self.label,
+            "budget": round(self.budget, 2),
+            "elapsed": round(self.elapsed(), 2),
+            "stage": self.current_stage or slowest,
+            "slowest_stage": slowest,
+            "stages": [{"name": name, "seconds": round(seconds, 2)} for name, seconds in self.stages],
+        }
+
+    def exceeded_result(self, **extra) -> dict:
+        """Kết quả chuẩn khi hết ngân sách, cùng dạng với kết quả của worker."""
+        info = self.report()
+        result = {
+            "success": False,
+            "message": f"Quá thời gian xử lý ({info['budget']:g}s) ở bước '{info['stage']}'.",
+            "error": "DeadlineExceeded",
+            "deadline": info,
+        }
+        result.update(extra)
+        return result
@@ -0,0 +1,307 @@
+"""Dịch vụ fetch Tukitech dùng chung cho mọi worker web.
+
+Chạy một lần trên máy chủ:
+
+    python fetch_service.py
+
+Dịch vụ giữ `TUKI_POOL_SIZE` phiên Chrome (TukiPersistent) và nghe HTTP trên
+FETCH_SERVICE_HOST:FETCH_SERVICE_PORT (mặc định 127.0.0.1:5055). Các process web
+đặt `FETCH_SERVICE_URL=http://127.0.0.1:5055` để gọi qua `FetchServiceClient`;
+số trình duyệt khi đó không phụ thuộc số worker gunicorn và khởi động lại web
+không làm Chrome phải khởi động lại.
+
+Giao thức:
+    POST /fetch   {"email": "...", "kind": "login_code" | "verify_link",
+                   "deadline": <số giây còn lại, tùy chọn>,
+                   "priority": "admin" | "customer" | "background" (mặc định customer),
+                   "key": <khóa chia đều trong lớp, mặc định email>}
+                  → JSON kết quả y như TukiPersistent.fetch()
+    GET  /health  → {"success": true, "pool": {...}}
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import queue
+import signal
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable
+
+import chrome_procs
+import config
+from deadline import Deadline, DeadlineExceeded
+from log_setup import new_request_id, request_id_var, setup_logging
+from scheduler import QUEUE_FULL_MSG, LookupScheduler, QueueFull
+
+log = logging.getLogger("fetch_service")
+
+
+class SessionPool:
+    """Nhóm phiên trình duyệt; mỗi phiên chỉ phục vụ một lookup tại một thời điểm.
+
+    Phiên được tạo dần khi cần (tối đa `size`) và phiên vừa trả về được dùng lại
+    trước (LIFO) để các phiên ít dùng có thể nghỉ.
+
+    Lookup xếp hàng ưu tiên (`scheduler`, xem scheduler.py) trước khi lấy phiên.
+    Hàng đợi nằm cạnh các phiên Chrome, nên khi mọi process web gọi qua dịch vụ
+    fetch, thứ tự ưu tiên áp dụng chung cho tất cả.
+    """
+
+    def __init__(self, size: int, factory: Callable[[], Any], *, weights: dict[str, float] | None = None, max_queue: int = 50):
+        self.size = max(1, int(size))
+        self._factory = factory
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        self._created = 0
+        self._workers: list = []
+        self._lock = threading.Lock()
+        self.scheduler = LookupScheduler(self.size, weights or config.SCHEDULER_WEIGHTS, max_queue=max_queue)
+
+    @property
+    def capacity(self) -> int:
+        return self.size
+
+    def warm(self):
+        """Tạo sẵn một phiên để lookup đầu tiên không phải chờ mở Chrome."""
+        self._release(self._acquire())
+
+    def _acquire(self, timeout: float | None = None):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            create = self._created < self.size
+            if create:
+                self._created += 1
+        if create:
+            try:
+                worker = self._factory()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+            with self._lock:
+                self._workers.append(worker)
+            return worker
+        return self._idle.get(timeout=timeout)
+
+    def _release(self, worker):
+        self._idle.put(worker)
+
+    def fetch(
+        self,
+        email: str,
+        kind: str = "login_code",
+        deadline: Deadline | None = None,
+        priority: str = "customer",
+        key: str = "",
+    ):
+        """Xếp hàng theo lớp `priority` (chia đều theo `key` trong lớp) rồi chạy lookup.
+
+        Hàng đầy trả kết quả lỗi `queue_full`; hết deadline khi còn chờ trả kết quả
+        DeadlineExceeded ở giai đoạn "queue".
+        """
+        deadline = Deadline.coerce(deadline, config.FETCH_DEADLINES.get(kind, 60), label=kind)
+        try:
+            with self.scheduler.slot(priority, key or email.lower(), deadline):
+                with deadline.stage("wait_browser"):
+                    worker = self._acquire(timeout=deadline.remaining())
+                try:
+                    return worker.fetch(email=email, kind=kind, deadline=deadline)
+                finally:
+                    self._release(worker)
+        except QueueFull:
+            return {"success": False, "message": QUEUE_FULL_MSG, "kind": kind, "error": "queue_full"}
+        except (queue.Empty, DeadlineExceeded):
+            return deadline.exceeded_result(kind=kind)
+
+    def close(self):
+        """Đóng mọi phiên đã tạo (gọi khi tắt process để không để lại Chrome)."""
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            close = getattr(worker, "close", None)
+            if close is None:
+                continue
+            try:
+                close()
+            except Exception:
+                log.warning("Đóng phiên trình duyệt lỗi", exc_info=True)
+
+    def stats(self) -> dict:
+        idle = self._idle.qsize()
+        return {
+            "size": self.size,
+            "created": self._created,
+            "idle": idle,
+            "busy": self._created - idle,
+            "scheduler": self.scheduler.snapshot(),
+        }
+
+
+class FetchServiceClient:
+    """Phía worker web: cùng giao diện `fetch()` như TukiPersistent nhưng gọi dịch vụ."""
+
+    def __init__(self, base_url: str, timeout: float = 150.0):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self._http = None
+
+    @property
+    def capacity(self) -> int:
+        try:
+            return int(self.health().get("pool", {}).get("size") or 1)
+        except Exception:
+            return 1
+
+    def _session(self):
+        if self._http is None:
+            import requests
+
+            self._http = requests.Session()
+        return self._http
+
+    def health(self) -> dict:
+        resp = self._session().get(f"{self.base_url}/health", timeout=5)
+        return resp.json()
+
+    def stats(self) -> dict:
+        return self.health().get("pool") or {}
+
+    def fetch(
+        self,
+        email: str,
+        kind: str = "login_code",
+        deadline: Deadline | None = None,
+        priority: str = "customer",
+        key: str = "",
+    ):
+        import requests
+
+        deadline = Deadline.coerce(deadline, self.timeout, label=kind)
+        try:
+            with deadline.stage("fetch_service"):
+                resp = self._session().post(
+                    f"{self.base_url}/fetch",
+                    json={
+                        "email": email,
+                        "kind": kind,
+                        "deadline": deadline.remaining(),
+                        "priority": priority,
+                        "key": key,
+                    },
+                    headers={"X-Request-ID": request_id_var.get() or new_request_id()},
+                    # chừa chút thời gian để dịch vụ tự trả kết quả "hết hạn" có báo cáo
+                    timeout=deadline.timeout() + 2,
+                )
+            return resp.json()
+        except requests.Timeout:
+            return deadline.exceeded_result(kind=kind)
+        except (requests.RequestException, ValueError) as exc:
+            return {
+                "success": False,
+                "message": f"Không kết nối được dịch vụ fetch: {exc}",
+                "kind": kind,
+                "error": type(exc).__name__,
+            }
+
+
+def create_local_pool() -> SessionPool:
+    def factory():
+        from tuki_persistent import TukiPersistent
+
+        headless = getattr(config, "TUKI_HEADLESS", True)
+        log.info("Khởi tạo phiên Tukitech", extra={"headless": headless})
+        return TukiPersistent(headless=headless)
+
+    return SessionPool(
+        getattr(config, "TUKI_POOL_SIZE", 1),
+        factory,
+        weights=config.SCHEDULER_WEIGHTS,
+        max_queue=config.SCHEDULER_MAX_QUEUE,
+    )
+
+
+class _Handler(BaseHTTPRequestHandler):
+    pool: SessionPool = None  # gán trong serve()
+
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/health":
+            self._send_json(200, {"success": True, "pool": self.pool.stats()})
+            return
+        self._send_json(404, {"success": False, "message": "Not found"})
+
+    def do_POST(self):
+        request_id_var.set((self.headers.get("X-Request-ID") or "").strip()[:64] or new_request_id())
+        if self.path.rstrip("/") != "/fetch":
+            self._send_json(404, {"success": False, "message": "Not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            data = json.loads(self.rfile.read(length) or b"{}")
+        except (ValueError, json.JSONDecodeError):
+            self._send_json(400, {"success": False, "message": "JSON không hợp lệ"})
+            return
+
+        email = (data.get("email") or "").strip()
+        kind = data.get("kind") or "login_code"
+        if not email or kind not in ("login_code", "verify_link"):
+            self._send_json(400, {"success": False, "message": "Thiếu email hoặc kind không hợp lệ"})
+            return
+        priority = data.get("priority") or "customer"
+        if priority not in self.pool.scheduler.weights:
+            self._send_json(400, {"success": False, "message": "priority không hợp lệ"})
+            return
+        key = str(data.get("key") or "")[:128]
+
+        try:
+            remaining = float(data["deadline"]) if data.get("deadline") is not None else None
+        except (TypeError, ValueError):
+            remaining = None
+
+        try:
+            result = self.pool.fetch(email=email, kind=kind, deadline=remaining, priority=priority, key=key)
+        except Exception as exc:
+            result = {"success": False, "message": f"Lỗi: {exc}", "kind": kind, "error": type(exc).__name__}
+        self._send_json(200, result if isinstance(result, dict) else {"success": True, "content": str(result)})
+
+    def log_message(self, fmt, *args):  # chuyển log mặc định của http.server sang logging
+        log.info(fmt % args, extra={"client": self.address_string(), "sampled": True})
+
+
+def serve(host: str | None = None, port: int | None = None):
+    setup_logging()
+    host = host or config.FETCH_SERVICE_HOST
+    port = port or config.FETCH_SERVICE_PORT
+    chrome_procs.start_reaper(config.TUKI_REAP_INTERVAL)
+    pool = create_local_pool()
+    pool.warm()
+    # SIGTERM (systemd, docker stop) → thoát qua finally để đóng Chrome
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    handler = type("FetchHandler", (_Handler,), {"pool": pool})
+    server = ThreadingHTTPServer((host, port), handler)
+    log.info("Dịch vụ fetch đang nghe", extra={"url": f"http://{host}:{port}", "pool": pool.size})
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        pool.close()
+
+
+if __name__ == "__main__":
+    serve()
@@ -0,0 +1,108 @@
+"""Cache HTML đã render cho các khối của trang /admin.
+
+Khóa cache gồm phiên bản dữ liệu (DataVersions) nên không cần xóa tay: mỗi lần
+ghi khách hàng/nhật ký chỉ cần `bump()`, khóa cũ không còn được hỏi tới và tự
+rơi khỏi LRU. HTML thì mỗi process giữ bản riêng.
+
+Phiên bản nằm trong một bảng của chính DB dữ liệu và được tăng trong cùng
+transaction với lệnh ghi. Nhờ vậy mọi process (nhiều worker gunicorn) thấy phiên
+bản mới ngay khi dữ liệu mới được commit, bất kể STATE_BACKEND là gì.
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import Callable
+
+from sqlalchemy import bindparam, text
+
+
+class DataVersions:
+    """`conn` là Session hoặc Connection của SQLAlchemy đang dùng cho lệnh ghi/đọc."""
+
+    def __init__(self, table: str = "data_version"):
+        self.table = table
+
+    def ensure(self, conn):
+        conn.execute(
+            text(f"CREATE TABLE IF NOT EXISTS {self.table} (name VARCHAR(32) PRIMARY KEY, version INTEGER NOT NULL)")
+        )
+
+    def get_many(self, conn, *names: str) -> dict[str, int]:
+        rows = conn.execute(
+            text(f"SELECT name, version FROM {self.table} WHERE name IN :names").bindparams(
+                bindparam("names", expanding=True)
+            ),
+            {"names": list(names)},
+        )
+        found = dict(rows.all())
+        return {name: found.get(name, 0) for name in names}
+
+    def get(self, conn, name: str) -> int:
+        return self.get_many(conn, name)[name]
+
+    def bump(self, conn, name: str):
+        """Tăng phiên bản trong transaction của `conn`; có hiệu lực khi transaction commit."""
+        conn.execute(
+            text(
+                f"INSERT INTO {self.table} (name, version) VALUES (:name, 1) "
+                "ON CONFLICT(name) DO UPDATE SET version = version + 1"
+            ),
+            {"name": name},
+        )
+
+
+class FragmentCache:
+    """LRU trong process: (tên khối, khóa) → HTML, giới hạn theo số khối và tổng dung lượng."""
+
+    def __init__(self, max_entries: int = 64, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max_bytes
+        self._items: OrderedDict[tuple, str] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, name: str, key: tuple) -> str | None:
+        with self._lock:
+            html = self._items.get((name, key))
+            if html is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end((name, key))
+            self.hits += 1
+            return html
+
+    def put(self, name: str, key: tuple, html: str):
+        size = len(html)
+        if size > self.max_bytes:
+            return  # một khối lớn hơn cả ngân sách: render lại mỗi lần thay vì đẩy hết cache
+        with self._lock:
+            previous = self._items.pop((name, key), None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            self._items[(name, key)] = html
+            self._bytes += size
+            while len(self._items) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def get_or_render(self, name: str, key: tuple, render: Callable[[], str]) -> str:
+        html = self.get(name, key)
+        if html is None:
+            html = render()
+            self.put(name, key, html)
+        return html
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._items),
+                "max_entries": self.max_entries,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
@@ -0,0 +1,141 @@
+"""Logging có cấu trúc (JSON), không chặn luồng xử lý request.
+
+- Bản ghi log được đẩy vào hàng đợi (QueueHandler); một luồng nền
+  (QueueListener) mới ghi ra stdout, nên terminal/journald chậm không giữ
+  chân request.
+- Mỗi request web có `request_id` (nhận từ header X-Request-ID hoặc tự sinh),
+  gắn vào mọi dòng log và được chuyển tiếp sang dịch vụ fetch, để nối request
+  web với lượt tìm trên trình duyệt.
+- Dòng log thành công lặp nhiều (`extra={"sampled": True}`) được lấy mẫu theo
+  LOG_SUCCESS_SAMPLE_RATE.
+"""
+
+from __future__ import annotations
+
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import uuid
+from datetime import datetime, timezone
+
+import config
+
+request_id_var: contextvars.ContextVar[str] = contextvars.ContextVar("request_id", default="")
+
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id", "sampled"}
+_listener: logging.handlers.QueueListener | None = None
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+class _ContextFilter(logging.Filter):
+    """Gắn request_id và bỏ bớt các dòng được đánh dấu lấy mẫu."""
+
+    def __init__(self, sample_rate: float):
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, "sampled", False) and self.sample_rate < 1.0:
+            if random.random() >= self.sample_rate:
+                return False
+        if not getattr(record, "request_id", ""):
+            record.request_id = request_id_var.get()
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Giữ traceback ở trường riêng thay vì trộn vào message như mặc định
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "request_id", ""):
+            payload["request_id"] = record.request_id
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and not key.startswith("_"):
+                payload[key] = value
+        if record.exc_text:
+            payload["exc"] = record.exc_text
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class _TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        rid = getattr(record, "request_id", "")
+        return f"[{rid}] {line}" if rid else line
+
+
+def setup_logging():
+    """Cấu hình root logger một lần cho process (web hoặc dịch vụ fetch)."""
+    global _listener
+    if _listener is not None:
+        return
+
+    stream = logging.StreamHandler(sys.stdout)
+    if config.LOG_FORMAT == "text":
+        stream.setFormatter(_TextFormatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    else:
+        stream.setFormatter(JsonFormatter())
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue)
+    # filter chạy ở luồng gọi log để còn đọc được contextvar request_id
+    queue_handler.addFilter(_ContextFilter(config.LOG_SUCCESS_SAMPLE_RATE))
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(config.LOG_LEVEL)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=False)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def init_app(app):
+    from flask import g, request
+
+    @app.before_request
+    def _assign_request_id():
+        rid = (request.headers.get("X-Request-ID") or "").strip()[:64] or new_request_id()
+        g.request_id = rid
+        g._request_id_token = request_id_var.set(rid)
+
+    @app.after_request
+    def _expose_request_id(response):
+        rid = g.get("request_id")
+        if rid:
+            response.headers["X-Request-ID"] = rid
+        return response
+
+    @app.teardown_request
+    def _clear_request_id(_exc=None):
+        token = g.pop("_request_id_token", None)
+        if token is not None:
+            try:
+                request_id_var.reset(token)
+            except ValueError:  # teardown chạy ở context khác (stream)
+                pass
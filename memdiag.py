@@ -0,0 +1,190 @@
+"""Chẩn đoán bộ nhớ cho process chạy lâu ngày.
+
+- Mỗi `interval` giây, một luồng nền lấy một mẫu và giữ `history` mẫu gần nhất
+  trong ring buffer. Mỗi mẫu gồm RSS của process, RSS của process con, bộ nhớ
+  tracemalloc đang giữ, số đối tượng gc và kích thước từng cache. Rò rỉ chậm
+  sẽ hiện ra thành xu hướng tăng dần.
+- Mỗi cache trong process đăng ký một hàm báo kích thước qua `register(name, fn)`.
+- Với tracemalloc, admin bật/tắt theo yêu cầu (tốn thêm CPU và bộ nhớ khi bật).
+  Có thể xem top nơi cấp phát, và so một snapshot với snapshot trước để thấy
+  phần tăng thêm.
+"""
+
+from __future__ import annotations
+
+import gc
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+from typing import Any, Callable
+
+import proc_stats
+
+log = logging.getLogger("memdiag")
+
+KEY_TYPES = ("lineno", "filename", "traceback")
+
+
+def _stat_dict(stat) -> dict:
+    frame = stat.traceback[0]
+    return {"where": f"{frame.filename}:{frame.lineno}", "size": stat.size, "count": stat.count}
+
+
+def _diff_dict(stat) -> dict:
+    frame = stat.traceback[0]
+    return {
+        "where": f"{frame.filename}:{frame.lineno}",
+        "size": stat.size,
+        "size_diff": stat.size_diff,
+        "count": stat.count,
+        "count_diff": stat.count_diff,
+    }
+
+
+class MemoryDiagnostics:
+    def __init__(self, interval: float = 60, history: int = 360):
+        self.interval = interval
+        self.samples: deque[dict] = deque(maxlen=max(1, history))
+        self._providers: dict[str, Callable[[], Any]] = {}
+        self._snapshot: tracemalloc.Snapshot | None = None
+        self._snapshot_at: float | None = None
+        self._lock = threading.Lock()
+        self._started = False
+
+    # ---------- cache ----------
+    def register(self, name: str, fn: Callable[[], Any]):
+        """`fn()` trả số phần tử hoặc dict (nên có "entries"/"bytes")."""
+        self._providers[name] = fn
+
+    def cache_sizes(self) -> dict:
+        sizes = {}
+        for name, fn in self._providers.items():
+            try:
+                sizes[name] = fn()
+            except Exception as exc:  # một cache lỗi không làm hỏng cả báo cáo
+                sizes[name] = {"error": str(exc)}
+        return sizes
+
+    # ---------- RSS ----------
+    @staticmethod
+    def process_memory() -> dict:
+        pid = os.getpid()
+        tree = proc_stats.children_map()
+        me = proc_stats.process_info(pid) or {"rss": 0}
+        children = [info for info in map(proc_stats.process_info, proc_stats.descendants(pid, tree)) if info]
+        return {
+            "pid": pid,
+            "rss": me["rss"],
+            "children_rss": sum(child["rss"] for child in children),
+            "children": sorted(
+                ({"pid": c["pid"], "name": c["name"], "rss": c["rss"]} for c in children),
+                key=lambda c: c["rss"],
+                reverse=True,
+            ),
+        }
+
+    # ---------- tracemalloc ----------
+    def start_tracing(self, frames: int = 1):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(max(1, frames))
+            log.info("Bật tracemalloc", extra={"frames": frames})
+
+    def stop_tracing(self):
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+            log.info("Tắt tracemalloc")
+        with self._lock:
+            self._snapshot = None
+            self._snapshot_at = None
+
+    def tracing(self, *, limit: int = 20, key_type: str = "lineno") -> dict:
+        """Trạng thái tracemalloc và top nơi cấp phát; chưa bật thì chỉ trả trạng thái."""
+        if not tracemalloc.is_tracing():
+            return {"enabled": False}
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = self._filtered(tracemalloc.take_snapshot())
+        return {
+            "enabled": True,
+            "current": current,
+            "peak": peak,
+            "overhead": tracemalloc.get_tracemalloc_memory(),
+            "top": [_stat_dict(s) for s in snapshot.statistics(key_type)[:limit]],
+            "baseline_at": self._snapshot_at,
+        }
+
+    def snapshot_diff(self, *, limit: int = 20, key_type: str = "lineno") -> dict:
+        """So với snapshot trước (nếu có), rồi lấy snapshot hiện tại làm mốc cho lần sau."""
+        if not tracemalloc.is_tracing():
+            return {"enabled": False}
+        snapshot = self._filtered(tracemalloc.take_snapshot())
+        now = time.time()
+        with self._lock:
+            previous, previous_at = self._snapshot, self._snapshot_at
+            self._snapshot, self._snapshot_at = snapshot, now
+        if previous is None:
+            return {"enabled": True, "baseline_at": now, "diff": []}
+        stats = snapshot.compare_to(previous, key_type)
+        return {
+            "enabled": True,
+            "since": previous_at,
+            "seconds": round(now - previous_at, 1),
+            "total_diff": sum(s.size_diff for s in stats),
+            "diff": [_diff_dict(s) for s in stats[:limit]],
+        }
+
+    @staticmethod
+    def _filtered(snapshot: tracemalloc.Snapshot) -> tracemalloc.Snapshot:
+        return snapshot.filter_traces(
+            (
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+            )
+        )
+
+    # ---------- lấy mẫu ----------
+    def sample(self) -> dict:
+        mem = self.process_memory()
+        entry = {
+            "at": time.time(),
+            "rss": mem["rss"],
+            "children_rss": mem["children_rss"],
+            "children": len(mem["children"]),
+            "gc_objects": len(gc.get_objects()),
+            "traced": tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None,
+            "caches": self.cache_sizes(),
+        }
+        self.samples.append(entry)
+        return entry
+
+    def start(self):
+        with self._lock:
+            if self._started or self.interval <= 0:
+                return
+            self._started = True
+
+        def loop():
+            while True:
+                try:
+                    self.sample()
+                except Exception:
+                    log.exception("Lấy mẫu bộ nhớ lỗi")
+                time.sleep(self.interval)
+
+        threading.Thread(target=loop, name="memdiag-sampler", daemon=True).start()
+
+    def trend(self) -> dict:
+        """Mức tăng RSS giữa mẫu đầu và mẫu cuối trong ring buffer."""
+        if len(self.samples) < 2:
+            return {}
+        first, last = self.samples[0], self.samples[-1]
+        hours = max((last["at"] - first["at"]) / 3600, 1e-9)
+        return {
+            "hours": round(hours, 2),
+            "rss_delta": last["rss"] - first["rss"],
+            "rss_per_hour": int((last["rss"] - first["rss"]) / hours),
+            "children_rss_delta": last["children_rss"] - first["children_rss"],
+        }
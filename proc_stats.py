@@ -0,0 +1,84 @@
+"""Đọc RSS / cây process từ /proc (Linux), không cần psutil.
+
+Trên hệ điều hành không có /proc các hàm trả về rỗng / 0.
+"""
+
+from __future__ import annotations
+
+import os
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def _stat_fields(pid: int) -> list[str] | None:
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as fh:
+            raw = fh.read().decode("utf-8", "replace")
+    except OSError:
+        return None
+    # comm nằm trong ngoặc và có thể chứa khoảng trắng → tách sau dấu ')' cuối
+    head, _, rest = raw.rpartition(")")
+    return [head.partition("(")[2]] + rest.split()
+
+
+def process_info(pid: int) -> dict | None:
+    fields = _stat_fields(pid)
+    if fields is None:
+        return None
+    # rest: state(1) ppid(2) ... rss là trường 24 của stat → vị trí 22 trong `rest`
+    return {"pid": pid, "name": fields[0], "ppid": int(fields[2]), "rss": int(fields[22]) * _PAGE_SIZE}
+
+
+def start_time(pid: int) -> int | None:
+    """Thời điểm bắt đầu (clock tick từ lúc boot): phân biệt process khi pid bị tái sử dụng."""
+    fields = _stat_fields(pid)
+    # starttime là trường 22 của stat → vị trí 20 trong danh sách
+    return int(fields[20]) if fields else None
+
+
+def environ(pid: int) -> dict[str, str]:
+    """Biến môi trường lúc process khởi động (chỉ đọc được process cùng user)."""
+    try:
+        with open(f"/proc/{pid}/environ", "rb") as fh:
+            raw = fh.read()
+    except OSError:
+        return {}
+    env = {}
+    for item in raw.split(b"\0"):
+        key, sep, value = item.partition(b"=")
+        if sep:
+            env[key.decode("utf-8", "replace")] = value.decode("utf-8", "replace")
+    return env
+
+
+def children_map() -> dict[int, list[int]]:
+    tree: dict[int, list[int]] = {}
+    try:
+        pids = [int(name) for name in os.listdir("/proc") if name.isdigit()]
+    except OSError:
+        return tree
+    for pid in pids:
+        info = process_info(pid)
+        if info:
+            tree.setdefault(info["ppid"], []).append(pid)
+    return tree
+
+
+def descendants(pid: int, tree: dict[int, list[int]] | None = None) -> list[int]:
+    tree = children_map() if tree is None else tree
+    found, stack = [], list(tree.get(pid, []))
+    while stack:
+        child = stack.pop()
+        found.append(child)
+        stack.extend(tree.get(child, []))
+    return found
+
+
+def tree_rss(pid: int, tree: dict[int, list[int]] | None = None) -> int:
+    """RSS (byte) của `pid` cộng mọi process con cháu."""
+    total = 0
+    for member in [pid, *descendants(pid, tree)]:
+        info = process_info(member)
+        if info:
+            total += info["rss"]
+    return total
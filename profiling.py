@@ -0,0 +1,258 @@
+"""Profiling theo yêu cầu cho các request đang chạy thật.
+
+Admin bật từ /admin: profile N request kế tiếp, hoặc một endpoint trong một
+khoảng thời gian. Hai chế độ:
+
+- ``cprofile``: deterministic, lưu ``.prof`` (mở bằng snakeviz / ``python -m pstats``).
+- ``sample``: lấy mẫu stack mỗi vài ms, lưu ``.folded`` (định dạng collapsed
+  stack, đưa thẳng vào flamegraph.pl hoặc speedscope.app).
+
+Mỗi profile kèm một tệp ``.json`` ghi số câu SQL và thời gian từng câu (bắt qua
+event của SQLAlchemy). Khi tắt, hook chỉ kiểm tra một cờ bool và listener SQL
+được gỡ khỏi engine nên không tốn chi phí.
+"""
+
+from __future__ import annotations
+
+import cProfile
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+
+from flask import Flask, g, has_app_context, request
+from sqlalchemy import event
+
+MODES = ("cprofile", "sample")
+SAMPLE_INTERVAL = 0.002
+_SAFE_NAME = re.compile(r"^[\w.-]+$")
+
+
+class _StackSampler:
+    def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+            if self._stop.wait(self.interval):
+                break
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class _RequestProfile:
+    def __init__(self, mode: str, endpoint: str, path: str):
+        self.mode = mode
+        self.endpoint = endpoint
+        self.path = path
+        self.started_at = datetime.utcnow()
+        self.sql: list[dict] = []
+        self._t0 = time.perf_counter()
+        if mode == "sample":
+            self._impl = _StackSampler(threading.get_ident())
+            self._impl.start()
+        else:
+            self._impl = cProfile.Profile()
+            self._impl.enable()
+
+    def finish(self, directory: str, status: int) -> dict:
+        duration = time.perf_counter() - self._t0
+        if self.mode == "sample":
+            self._impl.stop()
+        else:
+            self._impl.disable()
+
+        stamp = self.started_at.strftime("%Y%m%d-%H%M%S-%f")
+        label = re.sub(r"[^\w]+", "_", self.endpoint or "unknown")
+        base = f"{stamp}-{label}"
+        os.makedirs(directory, exist_ok=True)
+        if self.mode == "sample":
+            profile_file = f"{base}.folded"
+            with open(os.path.join(directory, profile_file), "w", encoding="utf-8") as fh:
+                fh.write(self._impl.folded())
+        else:
+            profile_file = f"{base}.prof"
+            self._impl.dump_stats(os.path.join(directory, profile_file))
+
+        summary = {
+            "name": base,
+            "mode": self.mode,
+            "endpoint": self.endpoint,
+            "path": self.path,
+            "status": status,
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "duration_ms": round(duration * 1000, 2),
+            "sql_count": len(self.sql),
+            "sql_ms": round(sum(q["ms"] for q in self.sql), 2),
+            "profile_file": profile_file,
+            "sql_file": f"{base}.json",
+        }
+        with open(os.path.join(directory, summary["sql_file"]), "w", encoding="utf-8") as fh:
+            json.dump({**summary, "queries": self.sql}, fh, ensure_ascii=False, indent=2)
+        return summary
+
+
+class Profiler:
+    def __init__(self, directory: str, keep: int = 50):
+        self.directory = directory
+        self.armed = False
+        self.mode = "cprofile"
+        self.endpoint: str | None = None
+        self.remaining: int | None = None
+        self.until: float | None = None
+        self.recent: deque = deque(maxlen=keep)
+        self._engine = None
+        self._lock = threading.Lock()
+        # cProfile chỉ cho một profiler hoạt động mỗi lúc (Python 3.12+ ném ValueError)
+        self._cprofile_busy = False
+
+    # ---------- điều khiển ----------
+    def start(self, engine, *, mode: str = "cprofile", count: int | None = None,
+              endpoint: str | None = None, seconds: float | None = None):
+        with self._lock:
+            self.mode = mode if mode in MODES else "cprofile"
+            self.endpoint = endpoint or None
+            self.remaining = count if count and count > 0 else None
+            self.until = time.monotonic() + seconds if seconds and seconds > 0 else None
+            if self.remaining is None and self.until is None:
+                self.remaining = 1
+            if self._engine is None:
+                event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+                event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+                self._engine = engine
+            self.armed = True
+
+    def stop(self):
+        with self._lock:
+            self._disarm()
+
+    def _disarm(self):
+        self.armed = False
+        self.remaining = None
+        self.until = None
+        if self._engine is not None:
+            event.remove(self._engine, "before_cursor_execute", _before_cursor_execute)
+            event.remove(self._engine, "after_cursor_execute", _after_cursor_execute)
+            self._engine = None
+
+    def _claim(self, endpoint: str | None) -> str | None:
+        """Chế độ profile cho request này, hoặc None nếu không profile."""
+        with self._lock:
+            if not self.armed:
+                return None
+            if self.until is not None and time.monotonic() > self.until:
+                self._disarm()
+                return None
+            if self.endpoint and endpoint != self.endpoint:
+                return None
+            if self.mode == "cprofile":
+                if self._cprofile_busy:  # đang có request khác được profile: bỏ qua, không trừ lượt
+                    return None
+                self._cprofile_busy = True
+            if self.remaining is not None:
+                self.remaining -= 1
+                if self.remaining <= 0 and self.until is None:
+                    # request cuối: gỡ cờ nhưng giữ listener tới khi request này xong
+                    self.armed = False
+            return self.mode
+
+    def _finish(self, profile: _RequestProfile, status: int):
+        try:
+            summary = profile.finish(self.directory, status)
+        finally:
+            with self._lock:
+                if profile.mode == "cprofile":
+                    self._cprofile_busy = False
+                if not self.armed and self._engine is not None:
+                    self._disarm()
+        with self._lock:
+            self.recent.append(summary)
+
+    # ---------- hiển thị ----------
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "armed": self.armed,
+                "mode": self.mode,
+                "endpoint": self.endpoint,
+                "remaining": self.remaining,
+                "seconds_left": round(max(0.0, self.until - time.monotonic()), 1) if self.until else None,
+                "recent": list(reversed(self.recent)),
+            }
+
+    def path_for(self, filename: str) -> str | None:
+        if not _SAFE_NAME.match(filename or ""):
+            return None
+        path = os.path.join(self.directory, filename)
+        return path if os.path.isfile(path) else None
+
+    # ---------- tích hợp Flask ----------
+    def init_app(self, app: Flask, *, skip_endpoints=("static",)):
+        skip = set(skip_endpoints)
+
+        @app.before_request
+        def _profile_begin():
+            if not self.armed or request.endpoint in skip:
+                return
+            mode = self._claim(request.endpoint)
+            if mode is None:
+                return
+            try:
+                g._request_profile = _RequestProfile(mode, request.endpoint or "", request.path)
+            except ValueError:  # profiler khác (ngoài app) đang bật
+                with self._lock:
+                    if mode == "cprofile":
+                        self._cprofile_busy = False
+
+        @app.after_request
+        def _profile_end(response):
+            profile = g.pop("_request_profile", None)
+            if profile is not None:
+                self._finish(profile, response.status_code)
+            return response
+
+        @app.teardown_request
+        def _profile_abort(exc):
+            # after_request không chạy khi view ném lỗi: vẫn phải tắt profiler và trả chỗ
+            profile = g.pop("_request_profile", None)
+            if profile is not None:
+                self._finish(profile, 500)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("_profile_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("_profile_query_start")
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    if has_app_context():
+        profile = g.get("_request_profile")
+        if profile is not None:
+            profile.sql.append({"ms": round(elapsed * 1000, 3), "statement": " ".join(statement.split())[:500]})
@@ -0,0 +1,207 @@
+"""Hàng đợi ưu tiên trước worker Tukitech (số phiên trình duyệt có hạn).
+
+Mỗi lookup xin một chỗ qua `slot(cls, key, deadline)`. Còn chỗ trống và không
+ai đang chờ thì chạy ngay. Ngược lại, lookup xếp hàng, và mỗi khi có chỗ trống
+thì chọn người chờ tiếp theo theo hai tầng:
+
+1. Giữa các lớp (`admin`, `customer`, `background`): chia theo trọng số. Mỗi lần
+   được phục vụ, lớp đó tăng "thời gian ảo" thêm 1/weight, và lớp có thời gian ảo
+   nhỏ nhất được chọn. Lớp vừa có người chờ bắt đầu từ thời gian ảo hiện tại,
+   nên không tích điểm lúc rảnh. Admin ít khi dùng và có trọng số cao, nên gần
+   như luôn được chọn ngay. Lớp trọng số thấp vẫn có phần, không bị bỏ đói.
+2. Trong một lớp: chia đều theo khóa (SĐT với khách), cùng cách tính. Một SĐT
+   gửi liên tục chỉ được một lượt mỗi vòng, trong khi SĐT khác cũng đang chờ.
+
+Chờ quá deadline thì rút khỏi hàng và ném DeadlineExceeded (giai đoạn "queue").
+Hàng của một lớp đầy (`max_queue`) thì ném QueueFull ngay.
+
+Mỗi SessionPool (fetch_service.py) giữ một hàng đợi với `capacity` bằng số phiên
+Chrome. Process web gọi dịch vụ fetch thì gửi lớp và khóa trong payload /fetch,
+nên mọi process cùng xếp chung một hàng tại dịch vụ.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from deadline import Deadline, DeadlineExceeded
+
+
+QUEUE_FULL_MSG = "Hệ thống đang bận, vui lòng thử lại sau ít phút."
+
+
+class QueueFull(Exception):
+    def __init__(self, cls: str):
+        super().__init__(f"queue '{cls}' full")
+        self.cls = cls
+
+
+class _Waiter:
+    __slots__ = ("cls", "key", "enqueued", "event", "granted")
+
+    def __init__(self, cls: str, key: str):
+        self.cls = cls
+        self.key = key
+        self.enqueued = time.monotonic()
+        self.event = threading.Event()
+        self.granted = False
+
+
+def _percentile(ordered: list[float], fraction: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class LookupScheduler:
+    def __init__(self, capacity: int, weights: dict[str, float], *, max_queue: int = 50, history: int = 500):
+        self.capacity = max(1, int(capacity))
+        self.weights = {cls: max(0.001, float(w)) for cls, w in weights.items()}
+        self.max_queue = max(1, int(max_queue))
+        self._lock = threading.Lock()
+        self._running = 0
+        self._waiting = 0
+        # lớp → khóa → người chờ (FIFO); khóa hết người chờ thì bị xóa
+        self._queues: dict[str, dict[str, deque[_Waiter]]] = {cls: {} for cls in self.weights}
+        self._class_vtime = {cls: 0.0 for cls in self.weights}
+        self._class_clock = 0.0
+        self._key_vtime: dict[str, dict[str, float]] = {cls: {} for cls in self.weights}
+        self._key_clock = {cls: 0.0 for cls in self.weights}
+        self._stats = {
+            cls: {
+                "queued": 0,
+                "max_queued": 0,
+                "running": 0,
+                "served": 0,
+                "timeouts": 0,
+                "rejected": 0,
+                "waits": deque(maxlen=max(1, history)),
+            }
+            for cls in self.weights
+        }
+
+    @contextmanager
+    def slot(self, cls: str, key: str, deadline: Deadline):
+        self.acquire(cls, key, deadline)
+        try:
+            yield
+        finally:
+            self.release(cls)
+
+    def acquire(self, cls: str, key: str, deadline: Deadline):
+        """Chờ tới lượt; mỗi lần thành công phải có đúng một `release(cls)`.
+
+        Dùng trực tiếp (thay vì `slot`) khi chỗ phải được giữ lâu hơn lời gọi hiện
+        tại, ví dụ khi luồng nền còn chạy sau khi người gọi đã bỏ chờ.
+        """
+        key = key or ""
+        if cls not in self.weights:
+            raise ValueError(f"lớp không hợp lệ: {cls}")
+        stats = self._stats[cls]
+        with self._lock:
+            if self._running < self.capacity and not self._waiting:
+                self._grant_locked(cls, 0.0)
+                return
+            if stats["queued"] >= self.max_queue:
+                stats["rejected"] += 1
+                raise QueueFull(cls)
+            waiter = _Waiter(cls, key)
+            self._enqueue_locked(waiter)
+
+        with deadline.stage("queue"):
+            waiter.event.wait(deadline.remaining())
+        if waiter.granted:
+            return
+        with self._lock:
+            if waiter.granted:  # được cấp chỗ đúng lúc hết giờ
+                return
+            self._remove_locked(waiter)
+            stats["timeouts"] += 1
+        raise DeadlineExceeded(deadline)
+
+    def release(self, cls: str):
+        with self._lock:
+            self._running -= 1
+            self._stats[cls]["running"] -= 1
+            self._dispatch_locked()
+
+    # ---------- hàng đợi (gọi khi đang giữ _lock) ----------
+    def _enqueue_locked(self, waiter: _Waiter):
+        cls, key = waiter.cls, waiter.key
+        queues = self._queues[cls]
+        if not queues:  # lớp vừa có người chờ: không mang điểm từ lúc rảnh
+            self._class_vtime[cls] = max(self._class_vtime[cls], self._class_clock)
+        if key not in queues:
+            queues[key] = deque()
+            self._key_vtime[cls][key] = self._key_clock[cls]
+        queues[key].append(waiter)
+        self._waiting += 1
+        stats = self._stats[cls]
+        stats["queued"] += 1
+        stats["max_queued"] = max(stats["max_queued"], stats["queued"])
+
+    def _remove_locked(self, waiter: _Waiter):
+        queue = self._queues[waiter.cls].get(waiter.key)
+        if queue is None or waiter not in queue:
+            return
+        queue.remove(waiter)
+        if not queue:
+            del self._queues[waiter.cls][waiter.key]
+            del self._key_vtime[waiter.cls][waiter.key]
+        self._waiting -= 1
+        self._stats[waiter.cls]["queued"] -= 1
+
+    def _grant_locked(self, cls: str, waited: float):
+        self._running += 1
+        stats = self._stats[cls]
+        stats["running"] += 1
+        stats["served"] += 1
+        stats["waits"].append(waited)
+
+    def _dispatch_locked(self):
+        while self._running < self.capacity and self._waiting:
+            cls = min((c for c, q in self._queues.items() if q), key=self._class_vtime.__getitem__)
+            self._class_clock = self._class_vtime[cls]
+            self._class_vtime[cls] += 1 / self.weights[cls]
+
+            key_vtime = self._key_vtime[cls]
+            key = min(self._queues[cls], key=key_vtime.__getitem__)
+            self._key_clock[cls] = key_vtime[key]
+            key_vtime[key] += 1
+
+            waiter = self._queues[cls][key][0]
+            self._remove_locked(waiter)
+            waiter.granted = True
+            self._grant_locked(cls, time.monotonic() - waiter.enqueued)
+            waiter.event.set()
+
+    # ---------- số liệu ----------
+    def snapshot(self) -> dict:
+        with self._lock:
+            classes = {}
+            for cls, stats in self._stats.items():
+                waits = sorted(stats["waits"])
+                classes[cls] = {
+                    "weight": self.weights[cls],
+                    "queued": stats["queued"],
+                    "max_queued": stats["max_queued"],
+                    "keys_waiting": len(self._queues[cls]),
+                    "running": stats["running"],
+                    "served": stats["served"],
+                    "timeouts": stats["timeouts"],
+                    "rejected": stats["rejected"],
+                    "wait_ms": {
+                        "samples": len(waits),
+                        "p50": round(_percentile(waits, 0.5) * 1000, 1) if waits else None,
+                        "p95": round(_percentile(waits, 0.95) * 1000, 1) if waits else None,
+                        "max": round(waits[-1] * 1000, 1) if waits else None,
+                    },
+                }
+            return {
+                "capacity": self.capacity,
+                "running": self._running,
+                "waiting": self._waiting,
+                "max_queue": self.max_queue,
+                "classes": classes,
+            }
@@ -0,0 +1,359 @@
+"""Nơi lưu trạng thái dùng chung: rate limit, cache SĐT sai, lookup đang chạy.
+
+Chọn bằng STATE_BACKEND:
+
+    memory                      trong process (mặc định, chạy một node)
+    sqlite:///đường/dẫn/state.db tệp SQLite cục bộ, dùng chung giữa các worker/process
+                                trên cùng máy (hoặc ổ mạng có khóa tệp đúng)
+    redis://host:6379/0         Redis (cần `pip install redis`), dùng cho nhiều node
+
+Giá trị phải serialize được bằng JSON. Khóa hết hạn theo `ttl` (giây). Thời gian
+dùng `time.time()` để các process/node cùng một mốc.
+
+Đăng nhập admin (`session['is_admin']`) nằm trong cookie đã ký của Flask nên đã
+dùng chung được giữa các node, chỉ cần cùng SECRET_KEY.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable
+
+# update(): fn(giá trị hiện tại hoặc None) -> (giá trị mới hoặc None để xóa, kết quả trả về)
+UpdateFn = Callable[[Any], "tuple[Any, Any]"]
+
+
+class StateBackend(ABC):
+    name = "base"
+
+    @abstractmethod
+    def get(self, key: str, default=None): ...
+
+    @abstractmethod
+    def set(self, key: str, value, ttl: float | None = None): ...
+
+    @abstractmethod
+    def add(self, key: str, value, ttl: float | None = None) -> bool:
+        """Chỉ ghi khi khóa chưa tồn tại; trả về True nếu đã ghi."""
+
+    @abstractmethod
+    def delete(self, key: str): ...
+
+    @abstractmethod
+    def delete_if(self, key: str, predicate: Callable[[Any], bool]) -> bool:
+        """Xóa khóa nếu `predicate(giá trị hiện tại)` đúng; không bao giờ ghi lại khóa
+        (giữ nguyên giá trị và hạn của người khác). Trả về True nếu đã xóa."""
+
+    @abstractmethod
+    def update(self, key: str, fn: UpdateFn, ttl: float | None = None):
+        """Đọc-sửa-ghi nguyên tử trên một khóa; trả về kết quả thứ hai của `fn`.
+
+        Giá trị mới luôn được ghi với `ttl` truyền vào (None = không hết hạn).
+        """
+
+    @abstractmethod
+    def count(self, prefix: str) -> int: ...
+
+    @abstractmethod
+    def clear(self, prefix: str): ...
+
+
+class MemoryBackend(StateBackend):
+    """Dict trong process, tối đa `max_keys` khóa (bỏ khóa hết hạn rồi khóa cũ nhất)."""
+
+    name = "memory"
+
+    def __init__(self, max_keys: int = 50000):
+        self.max_keys = max_keys
+        self._items: OrderedDict[str, tuple[Any, float | None]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _live(self, key: str, now: float):
+        item = self._items.get(key)
+        if item is None:
+            return None
+        value, expires = item
+        if expires is not None and expires <= now:
+            del self._items[key]
+            return None
+        return item
+
+    def _store(self, key: str, value, ttl: float | None, now: float):
+        self._items[key] = (value, now + ttl if ttl else None)
+        self._items.move_to_end(key)
+        if len(self._items) > self.max_keys:
+            for stale in [k for k, (_, exp) in self._items.items() if exp is not None and exp <= now]:
+                del self._items[stale]
+            while len(self._items) > self.max_keys:
+                self._items.popitem(last=False)
+
+    def get(self, key: str, default=None):
+        with self._lock:
+            item = self._live(key, time.time())
+        return default if item is None else item[0]
+
+    def set(self, key: str, value, ttl: float | None = None):
+        with self._lock:
+            self._store(key, value, ttl, time.time())
+
+    def add(self, key: str, value, ttl: float | None = None) -> bool:
+        now = time.time()
+        with self._lock:
+            if self._live(key, now) is not None:
+                return False
+            self._store(key, value, ttl, now)
+            return True
+
+    def delete(self, key: str):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def delete_if(self, key: str, predicate: Callable[[Any], bool]) -> bool:
+        with self._lock:
+            item = self._live(key, time.time())
+            if item is None or not predicate(item[0]):
+                return False
+            del self._items[key]
+            return True
+
+    def update(self, key: str, fn: UpdateFn, ttl: float | None = None):
+        now = time.time()
+        with self._lock:
+            item = self._live(key, now)
+            new_value, result = fn(None if item is None else item[0])
+            if new_value is None:
+                self._items.pop(key, None)
+            else:
+                self._store(key, new_value, ttl, now)
+        return result
+
+    def count(self, prefix: str) -> int:
+        now = time.time()
+        with self._lock:
+            return sum(
+                1 for k, (_, exp) in self._items.items()
+                if k.startswith(prefix) and (exp is None or exp > now)
+            )
+
+    def clear(self, prefix: str):
+        with self._lock:
+            for key in [k for k in self._items if k.startswith(prefix)]:
+                del self._items[key]
+
+
+class SQLiteBackend(StateBackend):
+    """Bảng key/value trong một tệp SQLite riêng (WAL), mỗi luồng một kết nối."""
+
+    name = "sqlite"
+    PURGE_EVERY = 500
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._conn() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS state ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+            )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None: tự quản lý BEGIN IMMEDIATE cho update()
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _expiry(ttl: float | None, now: float):
+        return now + ttl if ttl else None
+
+    def _maybe_purge(self, conn: sqlite3.Connection, now: float):
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            conn.execute("DELETE FROM state WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+
+    def get(self, key: str, default=None):
+        row = self._conn().execute(
+            "SELECT value FROM state WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time()),
+        ).fetchone()
+        return default if row is None else json.loads(row[0])
+
+    def set(self, key: str, value, ttl: float | None = None):
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT INTO state (key, value, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at",
+            (key, json.dumps(value), self._expiry(ttl, now)),
+        )
+        self._maybe_purge(conn, now)
+
+    def add(self, key: str, value, ttl: float | None = None) -> bool:
+        now = time.time()
+        conn = self._conn()
+        cur = conn.execute(
+            "INSERT INTO state (key, value, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at "
+            "WHERE state.expires_at IS NOT NULL AND state.expires_at <= ?",
+            (key, json.dumps(value), self._expiry(ttl, now), now),
+        )
+        return cur.rowcount == 1
+
+    def delete(self, key: str):
+        self._conn().execute("DELETE FROM state WHERE key = ?", (key,))
+
+    def delete_if(self, key: str, predicate: Callable[[Any], bool]) -> bool:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT value FROM state WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (key, time.time()),
+            ).fetchone()
+            deleted = row is not None and predicate(json.loads(row[0]))
+            if deleted:
+                conn.execute("DELETE FROM state WHERE key = ?", (key,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return deleted
+
+    def update(self, key: str, fn: UpdateFn, ttl: float | None = None):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            row = conn.execute(
+                "SELECT value FROM state WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (key, now),
+            ).fetchone()
+            new_value, result = fn(None if row is None else json.loads(row[0]))
+            if new_value is None:
+                conn.execute("DELETE FROM state WHERE key = ?", (key,))
+            else:
+                conn.execute(
+                    "INSERT INTO state (key, value, expires_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at",
+                    (key, json.dumps(new_value), self._expiry(ttl, now)),
+                )
+            self._maybe_purge(conn, now)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+
+    def count(self, prefix: str) -> int:
+        row = self._conn().execute(
+            "SELECT COUNT(*) FROM state WHERE key >= ? AND key < ? AND (expires_at IS NULL OR expires_at > ?)",
+            (prefix, prefix + "\uffff", time.time()),
+        ).fetchone()
+        return int(row[0])
+
+    def clear(self, prefix: str):
+        self._conn().execute("DELETE FROM state WHERE key >= ? AND key < ?", (prefix, prefix + "\uffff"))
+
+
+class RedisBackend(StateBackend):
+    """Dùng client kiểu redis-py (redis.Redis, hoặc fakeredis.FakeRedis khi chạy thử cục bộ)."""
+
+    name = "redis"
+
+    def __init__(self, client, namespace: str = "netflix:"):
+        self.client = client
+        self.namespace = namespace
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisBackend":
+        import redis  # tùy chọn: chỉ cần khi STATE_BACKEND=redis://...
+
+        return cls(redis.Redis.from_url(url))
+
+    @staticmethod
+    def _px(ttl: float | None):
+        return max(1, int(ttl * 1000)) if ttl else None
+
+    def get(self, key: str, default=None):
+        raw = self.client.get(self.namespace + key)
+        return default if raw is None else json.loads(raw)
+
+    def set(self, key: str, value, ttl: float | None = None):
+        self.client.set(self.namespace + key, json.dumps(value), px=self._px(ttl))
+
+    def add(self, key: str, value, ttl: float | None = None) -> bool:
+        return bool(self.client.set(self.namespace + key, json.dumps(value), px=self._px(ttl), nx=True))
+
+    def delete(self, key: str):
+        self.client.delete(self.namespace + key)
+
+    def delete_if(self, key: str, predicate: Callable[[Any], bool]) -> bool:
+        from redis.exceptions import WatchError
+
+        full_key = self.namespace + key
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(full_key)
+                    raw = pipe.get(full_key)
+                    if raw is None or not predicate(json.loads(raw)):
+                        pipe.unwatch()
+                        return False
+                    pipe.multi()
+                    pipe.delete(full_key)
+                    pipe.execute()
+                    return True
+                except WatchError:
+                    continue
+
+    def update(self, key: str, fn: UpdateFn, ttl: float | None = None):
+        from redis.exceptions import WatchError
+
+        full_key = self.namespace + key
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(full_key)
+                    raw = pipe.get(full_key)
+                    new_value, result = fn(None if raw is None else json.loads(raw))
+                    pipe.multi()
+                    if new_value is None:
+                        pipe.delete(full_key)
+                    else:
+                        pipe.set(full_key, json.dumps(new_value), px=self._px(ttl))
+                    pipe.execute()
+                    return result
+                except WatchError:
+                    continue  # khóa bị node khác sửa giữa chừng → tính lại
+
+    def count(self, prefix: str) -> int:
+        return sum(1 for _ in self.client.scan_iter(match=self.namespace + prefix + "*", count=500))
+
+    def clear(self, prefix: str):
+        keys = list(self.client.scan_iter(match=self.namespace + prefix + "*", count=500))
+        if keys:
+            self.client.delete(*keys)
+
+
+def create_state_backend(url: str | None) -> StateBackend:
+    url = (url or "memory").strip()
+    if url == "memory":
+        return MemoryBackend()
+    if url.startswith("sqlite:///"):
+        return SQLiteBackend(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend.from_url(url)
+    raise ValueError(f"STATE_BACKEND không hỗ trợ: {url}")
@@ -66,8 +66,8 @@ document.addEventListener('DOMContentLoaded', () => {
   }
 
   function resolveDisplayTime(data) {
-    const raw = data?.received_at_raw || data?.timestamp_raw || data?.timestamp || null;
-    const iso = data?.received_at || data?.timestamp_iso || null;
+    const raw = data?.received_at_raw || null;
+    const iso = data?.received_at || null;
     const serverRaw = data?.server_time_raw || null;
 
     if (raw) return raw;
@@ -98,7 +98,7 @@ document.addEventListener('DOMContentLoaded', () => {
     resEl.innerHTML = `<div class="alert warn">⚠️ ${msg}</div>`;
   }
 
-  function showSuccessBlock({ code, link, time, content, kind }) {
+  function showSuccessBlock({ code, link, time, content, kind, staleNote = '' }) {
     const showCode = kind !== 'verify_link' && code;
     const showLink = kind !== 'login_code' && link;
     const showContent = content && (!showCode || !showLink);
@@ -112,10 +112,12 @@ document.addEventListener('DOMContentLoaded', () => {
     const linkHtml = linkVisible ? `<div class="result-line"><strong>${linkLabel}:</strong> <a href="${link}" target="_blank" rel="noopener noreferrer" class="result-link">${link}</a></div>` : '';
     const safeContent = content ? escapeHtml(content) : '';
     const contentHtml = contentVisible ? `<div class="result-line"><strong>Nội dung:</strong> <pre class="result-content">${safeContent}</pre></div>` : '';
+    const staleHtml = staleNote ? `<div class="small muted">⚠️ ${escapeHtml(staleNote)}</div>` : '';
     if (!resEl) return;
 
-    resEl.innerHTML = `<div class="alert success">
-        <div class="success-title">✅ Thành công</div>
+    resEl.innerHTML = `<div class="alert ${staleNote ? 'warn' : 'success'}">
+        <div class="success-title">${staleNote ? '🕘 Kết quả gần nhất' : '✅ Thành công'}</div>
+        ${staleHtml}
         ${codeHtml}
         ${linkHtml}
         ${contentHtml}
@@ -172,7 +174,7 @@ document.addEventListener('DOMContentLoaded', () => {
       }
 
       // Prefer explicit fields from backend
-      // possible keys: verify_link, code, content, received_at_raw, received_at, timestamp
+      // possible keys: verify_link, code, content, received_at_raw, received_at
       const rawContent = (data.content && String(data.content).trim()) || '';
       const codeRaw = (data.code && String(data.code).trim()) || '';
       const verifyLink = data.verify_link || data.link || extractFirstUrl(rawContent) || extractFirstUrl(codeRaw) || null;
@@ -184,6 +186,8 @@ document.addEventListener('DOMContentLoaded', () => {
         if (normalized) code = normalized;
       }
       const time = resolveDisplayTime(data);
+      // stale: Tukitech quá hạn, server trả kết quả đã lưu gần nhất và đang làm mới ở nền
+      const staleNote = data.stale ? (data.message || 'Kết quả có thể đã cũ.') : '';
 
       // If kind is verify_link but no explicit link found, try parse from message
       if (kind === 'verify_link' && !verifyLink) {
@@ -201,7 +205,7 @@ document.addEventListener('DOMContentLoaded', () => {
       if (kind === 'login_code') {
         displayLink = null;
         if (!displayCode && rawContent) {
-          return showSuccessBlock({ code: '', link: '', time, content: rawContent, kind });
+          return showSuccessBlock({ code: '', link: '', time, content: rawContent, kind, staleNote });
         }
         if (!displayCode) {
           return showWarn('Chưa có mã đăng nhập, vui lòng bấm lại.');
@@ -218,12 +222,12 @@ document.addEventListener('DOMContentLoaded', () => {
           ? 'Chưa có mã đăng nhập, vui lòng bấm lại.'
           : 'Chưa có mã hộ gia đình, hãy bấm lại.';
         if (rawContent) {
-          return showSuccessBlock({ code: '', link: '', time, content: rawContent, kind });
+          return showSuccessBlock({ code: '', link: '', time, content: rawContent, kind, staleNote });
         }
         return showWarn(fallbackMsg);
       }
 
-      showSuccessBlock({ code: displayCode, link: displayLink, time, content: rawContent, kind });
+      showSuccessBlock({ code: displayCode, link: displayLink, time, content: rawContent, kind, staleNote });
     } catch (err) {
       showError(`Lỗi khi gọi API: ${err}`);
     }
@@ -255,38 +259,139 @@ document.addEventListener('DOMContentLoaded', () => {
     }
   }
 
-  async function loadActivityLogs(customerId, phoneLabel){
-    if (!activityLogs || !activitySubtitle) return;
-    activityLogs.innerHTML = '<div class="alert info">Đang tải nhật ký...</div>';
-    activitySubtitle.textContent = `Số điện thoại: ${phoneLabel}`;
-    openModal();
+  // Nhật ký theo trang: tải 20 bản ghi đầu, cuộn tới cuối modal thì tải tiếp bản cũ hơn
+  const activityState = { customerId: null, nextBefore: null, hasMore: false, loading: false };
+
+  function renderActivityLog(log){
+    const statusTag = log.success ? '<span class="tag-success">Thành công</span>' : '<span class="tag-fail">Thất bại</span>';
+    const message = log.message ? log.message : '';
+    const requester = log.requester_email ? `Requester: ${log.requester_email}` : '';
+    const target = log.target_email ? `Target: ${log.target_email}` : '';
+    return `<div class="activity-item">
+        <div class="activity-top">
+          <div class="activity-kind">${log.kind}</div>
+          <div class="activity-time">${log.created_at}</div>
+        </div>
+        <div class="activity-message">${message}</div>
+        <div class="activity-meta">${statusTag}${requester ? ` • ${requester}` : ''}${target ? ` • ${target}` : ''}</div>
+      </div>`;
+  }
+
+  async function loadActivityPage(){
+    const customerId = activityState.customerId;
+    if (!activityLogs || !customerId || activityState.loading) return;
+    activityState.loading = true;
+    const firstPage = !activityState.nextBefore;
+    const params = new URLSearchParams();
+    if (!firstPage) params.set('before', activityState.nextBefore);
     try {
-      const resp = await fetch(`/admin/activity/${customerId}`);
+      const resp = await fetch(`/admin/activity/${customerId}?${params}`);
       const data = await resp.json();
+      if (customerId !== activityState.customerId) return;
       if (!data?.success){
         activityLogs.innerHTML = `<div class="alert danger">${data?.message || 'Không thể tải nhật ký.'}</div>`;
+        activityState.hasMore = false;
         return;
       }
-      if (!data.logs || data.logs.length === 0){
+      const logs = data.logs || [];
+      if (firstPage && logs.length === 0){
         activityLogs.innerHTML = '<div class="alert warn">Chưa có nhật ký hoạt động.</div>';
-        return;
+      } else {
+        const html = logs.map(renderActivityLog).join('');
+        if (firstPage) activityLogs.innerHTML = html;
+        else activityLogs.insertAdjacentHTML('beforeend', html);
       }
-      activityLogs.innerHTML = data.logs.map(log => {
-        const statusTag = log.success ? '<span class="tag-success">Thành công</span>' : '<span class="tag-fail">Thất bại</span>';
-        const message = log.message ? log.message : '';
-        const requester = log.requester_email ? `Requester: ${log.requester_email}` : '';
-        const target = log.target_email ? `Target: ${log.target_email}` : '';
-        return `<div class="activity-item">
-            <div class="activity-top">
-              <div class="activity-kind">${log.kind}</div>
-              <div class="activity-time">${log.created_at}</div>
-            </div>
-            <div class="activity-message">${message}</div>
-            <div class="activity-meta">${statusTag}${requester ? ` • ${requester}` : ''}${target ? ` • ${target}` : ''}</div>
-          </div>`;
-      }).join('');
+      activityState.hasMore = !!data.has_more;
+      activityState.nextBefore = data.next_before || activityState.nextBefore;
     } catch (err){
-      activityLogs.innerHTML = '<div class="alert danger">Lỗi khi tải nhật ký.</div>';
+      if (firstPage) activityLogs.innerHTML = '<div class="alert danger">Lỗi khi tải nhật ký.</div>';
+      activityState.hasMore = false;
+    } finally {
+      activityState.loading = false;
+    }
+  }
+
+  async function loadActivityLogs(customerId, phoneLabel){
+    if (!activityLogs || !activitySubtitle) return;
+    activityState.customerId = customerId;
+    activityState.nextBefore = null;
+    activityState.hasMore = false;
+    activityState.loading = false;
+    activityLogs.innerHTML = '<div class="alert info">Đang tải nhật ký...</div>';
+    activitySubtitle.textContent = `Số điện thoại: ${phoneLabel}`;
+    openModal();
+    await loadActivityPage();
+    // trang đầu chưa đủ cao để cuộn thì tải tiếp
+    while (activityState.customerId === customerId && activityState.hasMore
+      && activityScroller && activityScroller.scrollHeight <= activityScroller.clientHeight) {
+      await loadActivityPage();
+    }
+  }
+
+  const activityScroller = activityModal?.querySelector('.modal-body');
+  activityScroller?.addEventListener('scroll', () => {
+    if (!activityState.hasMore || activityState.loading) return;
+    const remaining = activityScroller.scrollHeight - activityScroller.scrollTop - activityScroller.clientHeight;
+    if (remaining < 120) loadActivityPage();
+  });
+
+  // === Nhật ký hoạt động trực tiếp (SSE, dự phòng polling) ===
+  const recentActivity = document.getElementById('recentActivity');
+  const RECENT_ACTIVITY_MAX = 100;
+
+  function renderRecentActivity(log){
+    const status = log.success
+      ? '<span class="tag-success">✅ Thành công</span>'
+      : '<span class="tag-fail">⚠️ Thất bại</span>';
+    return `<div class="activity-item">
+        <div class="activity-top">
+          <div class="activity-kind">${escapeHtml(String(log.kind || ''))}</div>
+          <div class="activity-time">${escapeHtml(String(log.created_at || ''))}</div>
+        </div>
+        <div class="activity-message">${status} — ${escapeHtml(String(log.message || ''))}</div>
+        <div class="activity-meta">
+          <span>📞 ${escapeHtml(String(log.phone || '—'))}</span>
+          <span>👤 Requester: ${escapeHtml(String(log.requester || '—'))}</span>
+          <span>🎯 Target: ${escapeHtml(String(log.target || '—'))}</span>
+        </div>
+      </div>`;
+  }
+
+  function prependRecentActivity(entries){
+    if (!recentActivity || !entries || entries.length === 0) return;
+    const lastId = Number(recentActivity.dataset.lastId || 0);
+    const fresh = entries.filter((log) => Number(log.id) > lastId);
+    if (fresh.length === 0) return;
+    recentActivity.querySelector('[data-activity-empty]')?.remove();
+    recentActivity.insertAdjacentHTML('afterbegin', fresh.map(renderRecentActivity).join(''));
+    recentActivity.dataset.lastId = String(fresh[0].id);
+    const items = recentActivity.querySelectorAll('.activity-item');
+    for (let i = RECENT_ACTIVITY_MAX; i < items.length; i++) items[i].remove();
+  }
+
+  function pollRecentActivity(){
+    setInterval(async () => {
+      try {
+        const resp = await fetch(`/admin/activity/feed?since=${encodeURIComponent(recentActivity.dataset.lastId || '0')}`);
+        const data = await resp.json();
+        if (data?.success) prependRecentActivity(data.entries);
+      } catch (e) {}
+    }, 10000);
+  }
+
+  if (recentActivity){
+    if (window.EventSource){
+      const since = recentActivity.dataset.lastId || '0';
+      const source = new EventSource(`/admin/activity/stream?since=${encodeURIComponent(since)}`);
+      source.addEventListener('activity', (evt) => {
+        try { prependRecentActivity(JSON.parse(evt.data)); } catch (e) {}
+      });
+      // server từ chối (503 khi quá nhiều stream) → EventSource không tự nối lại, chuyển sang polling
+      source.addEventListener('error', () => {
+        if (source.readyState === EventSource.CLOSED) pollRecentActivity();
+      });
+    } else {
+      pollRecentActivity();
     }
   }
 
@@ -407,4 +512,95 @@ document.addEventListener('DOMContentLoaded', () => {
       }
     });
   }
+
+  // === Tra cứu hàng loạt (admin) ===
+  const batchForm = document.getElementById('batchLookupForm');
+  if (batchForm) {
+    const batchStatus = document.getElementById('batchLookupStatus');
+    const batchResults = document.getElementById('batchLookupResults');
+    const batchBody = batchResults.querySelector('tbody');
+    const btnBatch = document.getElementById('btnBatchLookup');
+    const kindLabels = { login_code: 'Mã đăng nhập', verify_link: 'Link hộ gia đình' };
+
+    const setBatchStatus = (message, state = 'info') => {
+      batchStatus.innerHTML = `<div class="alert ${state}">${escapeHtml(message)}</div>`;
+    };
+
+    const renderBatchRow = (item) => {
+      const row = batchBody.querySelector(`tr[data-index="${item.index}"]`);
+      if (!row) return;
+      let result;
+      if (item.success) {
+        const value = item.code || item.verify_link || extractFirstUrl(item.content) || item.content || 'Thành công';
+        result = `<span class="status-pill status-pill-active">${escapeHtml(value)}</span>`;
+      } else {
+        result = `<span class="status-pill status-pill-expired">${escapeHtml(item.message || 'Thất bại')}</span>`;
+      }
+      row.children[2].innerHTML = result;
+      row.children[3].textContent = item.received_at_raw || `${(item.duration_ms / 1000).toFixed(1)}s`;
+    };
+
+    batchForm.addEventListener('submit', async (e) => {
+      e.preventDefault();
+      const emails = batchForm.querySelector('textarea[name="emails"]').value;
+      const kind = batchForm.querySelector('select[name="kind"]').value;
+      btnBatch?.setAttribute('disabled', 'disabled');
+      batchBody.innerHTML = '';
+      batchResults.hidden = true;
+      setBatchStatus('Đang gửi yêu cầu...');
+
+      try {
+        const resp = await fetch('/admin/batch-lookup', {
+          method: 'POST',
+          headers: { 'Content-Type': 'application/json' },
+          body: JSON.stringify({ emails, kind })
+        });
+        if (!resp.ok || !resp.body) {
+          const data = await resp.json().catch(() => ({}));
+          setBatchStatus(data?.message || 'Không thể tra cứu hàng loạt.', 'danger');
+          return;
+        }
+
+        // Kết quả là NDJSON: đọc dần từng dòng khi server gửi về
+        const reader = resp.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let total = 0;
+        const handle = (line) => {
+          if (!line.trim()) return;
+          const msg = JSON.parse(line);
+          if (msg.event === 'start') {
+            total = msg.total;
+            batchBody.innerHTML = msg.items.map((item, index) => `
+              <tr data-index="${index}">
+                <td>${escapeHtml(item.email)}</td>
+                <td>${escapeHtml(kindLabels[item.kind] || item.kind)}</td>
+                <td class="subtle">Đang chờ...</td>
+                <td></td>
+              </tr>`).join('');
+            batchResults.hidden = false;
+            setBatchStatus(`Đang tra cứu ${total} email (${msg.concurrency} song song)...`);
+          } else if (msg.event === 'result') {
+            renderBatchRow(msg);
+            setBatchStatus(`Đã xong ${msg.done}/${total}...`);
+          } else if (msg.event === 'end') {
+            setBatchStatus(`Hoàn tất ${msg.total} email.`, 'success');
+          }
+        };
+        while (true) {
+          const { value, done } = await reader.read();
+          if (done) break;
+          buffer += decoder.decode(value, { stream: true });
+          const lines = buffer.split('\n');
+          buffer = lines.pop();
+          lines.forEach(handle);
+        }
+        handle(buffer);
+      } catch (err) {
+        setBatchStatus('Lỗi khi tra cứu hàng loạt.', 'danger');
+      } finally {
+        btnBatch?.removeAttribute('disabled');
+      }
+    });
+  }
 });
@@ -0,0 +1,153 @@
+"""Nén phản hồi (gzip/brotli) và URL tĩnh có dấu vân tay nội dung.
+
+- `url_for('static', filename=...)` tự thêm `?v=<hash>` theo nội dung tệp, nên
+  tệp tĩnh được cache `immutable` một năm; sửa tệp là đổi URL.
+- HTML/JSON/CSS/JS lớn hơn `MIN_COMPRESS_SIZE` được nén theo Accept-Encoding.
+  Bản nén của tệp tĩnh được giữ trong bộ nhớ theo (tệp, hash, encoding).
+- Brotli chỉ dùng khi đã cài gói `brotli` (tùy chọn), nếu không thì gzip.
+"""
+
+from __future__ import annotations
+
+import gzip
+import hashlib
+import os
+import threading
+
+from flask import Flask, request
+
+try:  # tùy chọn: pip install brotli
+    import brotli
+except ImportError:  # pragma: no cover - phụ thuộc môi trường
+    brotli = None
+
+MIN_COMPRESS_SIZE = 512
+STATIC_MAX_AGE = 365 * 24 * 3600
+COMPRESSIBLE_TYPES = {
+    "text/html",
+    "text/css",
+    "text/plain",
+    "text/javascript",
+    "application/javascript",
+    "application/json",
+    "image/svg+xml",
+}
+
+_fingerprints: dict[str, tuple[float, str]] = {}
+_compressed_static: dict[tuple[str, str, str], bytes] = {}
+_lock = threading.Lock()
+
+
+def _available_encodings():
+    return ("br", "gzip") if brotli else ("gzip",)
+
+
+def _compress(data: bytes, encoding: str, *, static: bool = False) -> bytes:
+    if encoding == "br":
+        # tệp tĩnh chỉ nén một lần nên dùng mức cao nhất
+        return brotli.compress(data, quality=11 if static else 5)
+    return gzip.compress(data, compresslevel=9 if static else 6, mtime=0)
+
+
+def static_fingerprint(app: Flask, filename: str) -> str | None:
+    """Hash ngắn của nội dung tệp tĩnh, tính lại khi mtime thay đổi."""
+    path = os.path.join(app.static_folder or "", filename)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    cached = _fingerprints.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(path, "rb") as fh:
+        digest = hashlib.sha256(fh.read()).hexdigest()[:12]
+    with _lock:
+        _fingerprints[path] = (mtime, digest)
+    return digest
+
+
+def init_app(app: Flask):
+    @app.url_defaults
+    def _fingerprint_static_urls(endpoint, values):
+        if endpoint == "static" and "filename" in values and "v" not in values:
+            digest = static_fingerprint(app, values["filename"])
+            if digest:
+                values["v"] = digest
+
+    @app.after_request
+    def _cache_and_compress(response):
+        if request.endpoint == "static":
+            filename = (request.view_args or {}).get("filename", "")
+            digest = static_fingerprint(app, filename)
+            if digest and request.args.get("v") == digest:
+                response.cache_control.no_cache = None
+                response.cache_control.public = True
+                response.cache_control.max_age = STATIC_MAX_AGE
+                response.cache_control.immutable = True
+            else:
+                response.cache_control.no_cache = True
+            if response.status_code == 200 and digest:
+                _compress_static(app, response, filename, digest)
+            return response
+
+        _compress_dynamic(response)
+        return response
+
+
+def _pick_encoding(response):
+    if response.status_code != 200 or response.headers.get("Content-Encoding"):
+        return None
+    if response.mimetype not in COMPRESSIBLE_TYPES:
+        return None
+    response.vary.add("Accept-Encoding")
+    return request.accept_encodings.best_match(_available_encodings())
+
+
+def _compress_dynamic(response):
+    # Stream (SSE, export) phải đi thẳng tới client, không gom lại để nén
+    if response.is_streamed or response.direct_passthrough:
+        return
+    encoding = _pick_encoding(response)
+    if not encoding:
+        return
+    data = response.get_data()
+    if len(data) < MIN_COMPRESS_SIZE:
+        return
+    response.set_data(_compress(data, encoding))
+    response.headers["Content-Encoding"] = encoding
+
+
+def _compress_static(app: Flask, response, filename: str, digest: str):
+    encoding = _pick_encoding(response)
+    if not encoding:
+        return
+    key = (filename, digest, encoding)
+    body = _compressed_static.get(key)
+    if body is None:
+        with open(os.path.join(app.static_folder, filename), "rb") as fh:
+            raw = fh.read()
+        if len(raw) < MIN_COMPRESS_SIZE:
+            return
+        body = _compress(raw, encoding, static=True)
+        with _lock:
+            _compressed_static[key] = body
+    passthrough = response.response
+    if hasattr(passthrough, "close"):
+        passthrough.close()
+    response.direct_passthrough = False
+    response.set_data(body)
+    response.headers["Content-Encoding"] = encoding
+    response.headers.pop("Accept-Ranges", None)
+    response.set_etag(f"{digest}-{encoding}")
+    response.make_conditional(request)
+
+
+def cache_stats() -> dict:
+    """Kích thước cache trong process (cho trang chẩn đoán bộ nhớ)."""
+    with _lock:
+        compressed = list(_compressed_static.values())
+    return {
+        "fingerprints": len(_fingerprints),
+        "compressed_entries": len(compressed),
+        "compressed_bytes": sum(len(body) for body in compressed),
+    }
@@ -0,0 +1,80 @@
+"""Các backend trạng thái (memory, SQLite, Redis qua fakeredis) và JobRegistry.
+
+Chạy:  pip install -r requirements-dev.txt && python -m pytest -q
+"""
+
+import threading
+import time
+
+import pytest
+
+from admission import JobRegistry
+from state_backend import MemoryBackend, RedisBackend, SQLiteBackend
+
+TTL = 0.3
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryBackend()
+    if request.param == "sqlite":
+        return SQLiteBackend(str(tmp_path / "state.db"))
+    fakeredis = pytest.importorskip("fakeredis")
+    return RedisBackend(fakeredis.FakeRedis())
+
+
+def test_add_only_when_missing_or_expired(backend):
+    assert backend.add("k", 1, ttl=TTL)
+    assert not backend.add("k", 2, ttl=TTL)
+    assert backend.get("k") == 1
+    time.sleep(TTL + 0.1)
+    assert backend.add("k", 3, ttl=TTL)
+    assert backend.get("k") == 3
+
+
+def test_update_writes_and_deletes(backend):
+    assert backend.update("n", lambda v: ((v or 0) + 1, "first")) == "first"
+    backend.update("n", lambda v: (v + 1, None))
+    assert backend.get("n") == 2
+    backend.update("n", lambda v: (None, None))
+    assert backend.get("n") is None
+
+
+def test_delete_if_never_rewrites(backend):
+    backend.set("k", {"token": "a"}, ttl=TTL)
+    assert not backend.delete_if("k", lambda v: v["token"] == "b")
+    assert backend.get("k") == {"token": "a"}
+    time.sleep(TTL + 0.1)  # hạn ban đầu vẫn còn hiệu lực
+    assert backend.get("k") is None
+    assert not backend.delete_if("k", lambda v: True)
+
+
+def test_job_release_with_owner_token(backend):
+    jobs = JobRegistry(backend=backend)
+    token = jobs.claim("login_code:a@x.com", ttl=TTL)
+    assert token
+    assert jobs.claim("login_code:a@x.com", ttl=TTL) is None
+    assert jobs.release("login_code:a@x.com", token)
+    assert jobs.claim("login_code:a@x.com", ttl=TTL)
+
+
+def test_job_release_with_wrong_token_keeps_expiry(backend):
+    jobs = JobRegistry(backend=backend)
+    assert jobs.claim("login_code:a@x.com", ttl=TTL)
+    assert not jobs.release("login_code:a@x.com", "not-the-owner")
+    assert jobs.claim("login_code:a@x.com", ttl=TTL) is None
+    # người giữ chết mà không gỡ: khóa vẫn phải tự hết hạn
+    time.sleep(TTL + 0.1)
+    assert len(jobs) == 0
+    assert jobs.claim("login_code:a@x.com", ttl=TTL)
+
+
+def test_job_wait_returns_when_holder_releases(backend):
+    jobs = JobRegistry(backend=backend)
+    token = jobs.claim("login_code:a@x.com", ttl=5)
+    assert not jobs.wait("login_code:a@x.com", timeout=0.1, poll=0.02)
+    threading.Timer(0.1, jobs.release, args=("login_code:a@x.com", token)).start()
+    started = time.monotonic()
+    assert jobs.wait("login_code:a@x.com", timeout=2, poll=0.02)
+    assert time.monotonic() - started < 1
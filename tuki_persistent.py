@@ -1,5 +1,5 @@
 # tuki_persistent.py — persistent Selenium session for Tukitech
-import time, threading, traceback, re
+import os, time, threading, re, logging
 from datetime import datetime
 
 from selenium import webdriver
@@ -8,12 +8,15 @@ from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.support.ui import WebDriverWait, Select
 from selenium.webdriver.support import expected_conditions as EC
-from webdriver_manager.chrome import ChromeDriverManager
 
 # Yêu cầu trong config.py có:
 # TUKI_URL = 'https://tukitech.com/user_management/customer_login/'
 # USERNAME_TUKI = 'CTV0047'
 import config
+import chrome_procs
+from deadline import Deadline, DeadlineExceeded
+
+log = logging.getLogger("tuki")
 
 # Thời gian tối đa chờ phần tử kết quả xuất hiện
 RESULT_WAIT_MAX = 45
@@ -22,6 +25,151 @@ RESULT_POLL_MAX = 45
 RESULT_POLL_INTERVAL = 1.2
 IDLE_REFRESH_SECONDS = 300   # refresh nếu rảnh > 5 phút
 WAIT_SHORT, WAIT_MED, WAIT_LONG = 4, 10, 20
+PAGE_LOAD_TIMEOUT = 30
+# Ngân sách mặc định khi fetch() được gọi không kèm deadline
+DEFAULT_FETCH_DEADLINE = 60
+
+# Chính sách tài nguyên "lean": trang tìm kiếm chỉ cần HTML/CSS/JS của Tukitech.
+# Chặn ảnh/font/media và script đo lường bên thứ ba (Network.setBlockedURLs qua CDP).
+BLOCKED_URL_PATTERNS = (
+    # ảnh
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico",
+    # font
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    "*fonts.googleapis.com*", "*fonts.gstatic.com*",
+    # media
+    "*.mp4", "*.webm", "*.mp3",
+    # analytics / quảng cáo / chat widget
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*",
+    "*googlesyndication.com*", "*connect.facebook.net*", "*facebook.com/tr*",
+    "*hotjar.com*", "*clarity.ms*", "*tawk.to*", "*sp.zalo.me*",
+)
+LEAN_CHROME_ARGS = (
+    "--disable-background-networking",
+    "--disable-sync",
+    "--disable-default-apps",
+    "--disable-component-update",
+    "--disable-domain-reliability",
+    "--disable-client-side-phishing-detection",
+    "--disable-features=Translate,OptimizationHints,MediaRouter,AutofillServerCommunication,InterestFeedContentSuggestions",
+    "--no-first-run",
+    "--no-default-browser-check",
+    "--metrics-recording-only",
+    "--mute-audio",
+    "--blink-settings=imagesEnabled=false",
+)
+LEAN_CHROME_PREFS = {
+    "profile.managed_default_content_settings.images": 2,
+    "profile.default_content_setting_values.notifications": 2,
+    "credentials_enable_service": False,
+    "profile.password_manager_enabled": False,
+    "translate.enabled": False,
+}
+
+
+def build_chrome_options(headless: bool = True, policy: str = "lean", user_data_dir: str | None = None) -> Options:
+    """Options cho Chrome; `policy="full"` giữ cấu hình cũ (tải đủ tài nguyên)."""
+    opts = Options()
+    if user_data_dir:
+        opts.add_argument(f"--user-data-dir={user_data_dir}")
+    if headless:
+        opts.add_argument("--headless=new")
+    opts.add_argument("--no-sandbox")
+    opts.add_argument("--disable-gpu")
+    opts.add_argument("--disable-dev-shm-usage")
+    opts.add_argument("--disable-extensions")
+    opts.add_argument("--disable-blink-features=AutomationControlled")
+    opts.add_experimental_option("excludeSwitches", ["enable-automation"])
+    opts.add_experimental_option("useAutomationExtension", False)
+    opts.add_argument("--log-level=3")
+    opts.add_argument("--window-size=1280,900")
+    opts.add_argument("--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+                      "AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36")
+    if policy == "lean":
+        for arg in LEAN_CHROME_ARGS:
+            opts.add_argument(arg)
+        opts.add_experimental_option("prefs", dict(LEAN_CHROME_PREFS))
+        # mọi bước đều chờ phần tử cụ thể nên không cần đợi sự kiện load (ảnh, iframe...)
+        opts.page_load_strategy = "eager"
+    return opts
+
+
+class ProfileSlot:
+    """Thư mục user-data-dir của một phiên, giữ khóa tệp suốt vòng đời phiên.
+
+    Khóa (flock / msvcrt) tự nhả khi process chết, nên không có khóa "treo";
+    các tệp Singleton* Chrome để lại sau khi crash được dọn trước khi mở lại.
+    """
+
+    def __init__(self, path: str, handle):
+        self.path = path
+        self._handle = handle
+
+    @classmethod
+    def claim(cls, root: str, slots: int) -> "ProfileSlot | None":
+        os.makedirs(root, exist_ok=True)
+        for index in range(max(1, slots)):
+            path = os.path.join(root, f"slot-{index}")
+            handle = open(f"{path}.lock", "a+")
+            if _try_lock(handle):
+                os.makedirs(path, exist_ok=True)
+                for stale in ("SingletonLock", "SingletonSocket", "SingletonCookie"):
+                    try:
+                        os.remove(os.path.join(path, stale))
+                    except OSError:
+                        pass
+                return cls(path, handle)
+            handle.close()
+        return None
+
+    def release(self):
+        if self._handle is not None:
+            self._handle.close()  # đóng tệp là nhả khóa
+            self._handle = None
+
+
+def _try_lock(handle) -> bool:
+    try:
+        import fcntl
+
+        fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except ImportError:
+        import msvcrt
+
+        try:
+            msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+    except OSError:
+        return False
+
+
+def apply_request_blocking(driver, patterns=BLOCKED_URL_PATTERNS):
+    """Chặn URL theo mẫu bằng CDP; trình duyệt không hỗ trợ CDP thì bỏ qua."""
+    patterns = list(patterns) + list(getattr(config, "TUKI_BLOCK_EXTRA", ()))
+    try:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": patterns})
+    except Exception:
+        log.warning("Không bật được chặn request qua CDP", exc_info=True)
+
+
+# Biểu thức chính quy dùng mỗi lượt tra cứu: biên dịch một lần lúc import
+_CODE_LABEL_RES = (
+    re.compile(r"(?i)Nội dung\s*[:：]\s*([^\n\r]+)"),
+    re.compile(r"(?i)Mã\s*[:：]\s*([^\n\r]+)"),
+    re.compile(r"(?i)Code\s*[:：]\s*([^\n\r]+)"),
+)
+_NON_DIGIT_RE = re.compile(r"[^0-9]")
+_NEAR_CONTENT_RE = re.compile(r"(?i)Nội dung[^\n\r]*\n([^\n\r]+)")
+_DIGIT_SEQ_RE = re.compile(r"(?<!\d)(\d[\d\s-]{2,})(?!\d)")
+_RECEIVED_AT_RE = re.compile(r"(?i)Thời gian nhận:\s*([^\n\r]+)")
+_RECEIVED_AT_FORMATS = ("%a, %d %b %Y %H:%M:%S", "%d/%m/%Y %H:%M:%S", "%Y-%m-%d %H:%M:%S")
+_RESULT_READY_RE = re.compile(r"(?i)thời gian nhận|thành công|tìm kiếm hoàn tất|mã")
+_RESULT_DIGITS_RE = re.compile(r"\d{3,}")
+_RESULT_EMPTY_RE = re.compile(r"(?i)không tìm|không có dữ liệu|chưa có")
 
 
 def _parse_code_time_text(raw_text: str):
@@ -30,38 +178,33 @@ def _parse_code_time_text(raw_text: str):
         return "", "", ""
     t = raw_text.replace("\r", "")
     code, t_raw = "", ""
-    m1 = re.search(r"(?i)Nội dung\s*[:：]\s*([^\n\r]+)", t)
-    if m1: code = m1.group(1).strip()
-    if not code:
-        for pattern in (
-            r"(?i)Mã\s*[:：]\s*([^\n\r]+)",
-            r"(?i)Code\s*[:：]\s*([^\n\r]+)",
-        ):
-            m_alt = re.search(pattern, t)
-            if m_alt:
-                code = m_alt.group(1).strip()
+    for pattern in _CODE_LABEL_RES:
+        m_code = pattern.search(t)
+        if m_code:
+            code = m_code.group(1).strip()
+            if code:
                 break
     if code:
-        compact = re.sub(r"[^0-9]", "", code)
+        compact = _NON_DIGIT_RE.sub("", code)
         if 3 <= len(compact) <= 10:
             code = compact
     if not code:
-        near_nội_dung = re.search(r"(?i)Nội dung[^\n\r]*\n([^\n\r]+)", t)
+        near_nội_dung = _NEAR_CONTENT_RE.search(t)
         if near_nội_dung:
-            candidate = re.sub(r"[^0-9]", "", near_nội_dung.group(1))
+            candidate = _NON_DIGIT_RE.sub("", near_nội_dung.group(1))
             if 3 <= len(candidate) <= 10:
                 code = candidate
     if not code:
-        seq = re.search(r"(?<!\d)(\d[\d\s-]{2,})(?!\d)", t)
+        seq = _DIGIT_SEQ_RE.search(t)
         if seq:
-            candidate = re.sub(r"[^0-9]", "", seq.group(1))
+            candidate = _NON_DIGIT_RE.sub("", seq.group(1))
             if 3 <= len(candidate) <= 10:
                 code = candidate
-    m2 = re.search(r"(?i)Thời gian nhận:\s*([^\n\r]+)", t)
+    m2 = _RECEIVED_AT_RE.search(t)
     if m2: t_raw = m2.group(1).strip()
 
     t_iso = ""
-    for fmt in ("%a, %d %b %Y %H:%M:%S", "%d/%m/%Y %H:%M:%S", "%Y-%m-%d %H:%M:%S"):
+    for fmt in _RECEIVED_AT_FORMATS:
         try:
             t_iso = datetime.strptime(t_raw, fmt).isoformat(); break
         except Exception:
@@ -69,6 +212,21 @@ def _parse_code_time_text(raw_text: str):
     return code, t_raw, t_iso
 
 
+_driver_path = None
+_driver_path_lock = threading.Lock()
+
+
+def _chromedriver_path() -> str:
+    """Đường dẫn chromedriver; webdriver_manager chỉ được import/chạy một lần mỗi process."""
+    global _driver_path
+    with _driver_path_lock:
+        if _driver_path is None:
+            from webdriver_manager.chrome import ChromeDriverManager
+
+            _driver_path = ChromeDriverManager().install()
+        return _driver_path
+
+
 class TukiPersistent:
     """
     Giữ 1 phiên Chrome Selenium luôn mở tại trang tìm kiếm Tukitech.
@@ -76,75 +234,126 @@ class TukiPersistent:
     kind: 'login_code' | 'verify_link'
     """
 
-    def __init__(self, headless: bool = True):
+    def __init__(self, headless: bool = True, resource_policy: str | None = None, persist_profile: bool | None = None):
         self.headless = headless
+        self.resource_policy = resource_policy or getattr(config, "TUKI_RESOURCE_POLICY", "lean")
         self.driver = None
         self.wait = None
+        self.session_id = None
         self.lock = threading.Lock()
         self.last_active = 0
-        self._start_driver()
+        self.profile = None
+        if getattr(config, "TUKI_PERSIST_PROFILE", False) if persist_profile is None else persist_profile:
+            self.profile = ProfileSlot.claim(config.TUKI_PROFILE_DIR, getattr(config, "TUKI_POOL_SIZE", 1))
+            if self.profile is None:
+                log.warning("Mọi slot profile đang được dùng, phiên này chạy với profile tạm",
+                            extra={"profile_dir": config.TUKI_PROFILE_DIR})
+        try:
+            self._start_driver()
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self, timeout: float = 10):
+        """Đóng Chrome và nhả slot profile (để process khác dùng lại).
+
+        Chờ lookup đang chạy tối đa `timeout` giây; quá hạn (lúc tắt app) vẫn đóng.
+        """
+        locked = self.lock.acquire(timeout=timeout)
+        try:
+            self._discard_driver()
+            if self.profile is not None:
+                self.profile.release()
+                self.profile = None
+        finally:
+            if locked:
+                self.lock.release()
 
     # ---------- driver ----------
-    def _start_driver(self):
-        opts = Options()
-        if self.headless:
-            opts.add_argument("--headless=new")
-        opts.add_argument("--no-sandbox")
-        opts.add_argument("--disable-gpu")
-        opts.add_argument("--disable-dev-shm-usage")
-        opts.add_argument("--disable-extensions")
-        opts.add_argument("--disable-blink-features=AutomationControlled")
-        opts.add_experimental_option("excludeSwitches", ["enable-automation"])
-        opts.add_experimental_option("useAutomationExtension", False)
-        opts.add_argument("--log-level=3")
-        opts.add_argument("--window-size=1280,900")
-        opts.add_argument("--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                          "AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36")
-
-        service = Service(ChromeDriverManager().install())
-        self.driver = webdriver.Chrome(service=service, options=opts)
-        self.driver.set_page_load_timeout(30)
+    def _start_driver(self, deadline: Deadline | None = None):
+        opts = build_chrome_options(
+            self.headless, self.resource_policy, self.profile.path if self.profile else None
+        )
+
+        # chromedriver và mọi process Chrome con mang thẻ phiên để dọn được nếu quit() sót
+        self.session_id, env = chrome_procs.register_session()
+        service = Service(_chromedriver_path(), env=env)
+        try:
+            self.driver = webdriver.Chrome(service=service, options=opts)
+        except BaseException:
+            self._discard_driver()
+            raise
+        if self.resource_policy == "lean":
+            apply_request_blocking(self.driver)
+        self.driver.set_page_load_timeout(PAGE_LOAD_TIMEOUT)
         self.driver.implicitly_wait(2)
 
         self.wait = WebDriverWait(self.driver, WAIT_LONG)
-        self._go_search_page()
+        self._go_search_page(deadline)
         self.last_active = time.time()
 
-    def _restart(self):
-        try:
-            if self.driver: self.driver.quit()
-        except: pass
+    def _discard_driver(self):
+        """Quit driver hiện tại rồi buộc dừng mọi process còn sót của phiên đó."""
+        driver, session_id = self.driver, self.session_id
         self.driver = None
         self.wait = None
-        self._start_driver()
+        self.session_id = None
+        if driver is not None:
+            try:
+                driver.quit()
+            except Exception:
+                log.warning("driver.quit() lỗi, dọn process theo thẻ phiên", exc_info=True)
+        chrome_procs.kill_session(session_id)
+        chrome_procs.unregister_session(session_id)
+
+    def _restart(self, deadline: Deadline | None = None):
+        self._discard_driver()
+        self._start_driver(deadline)
 
-    def _ensure_driver(self):
+    def _ensure_driver(self, deadline: Deadline | None = None):
         if self.driver is None:
-            self._start_driver()
+            self._start_driver(deadline)
             return
         try:
             _ = self.driver.current_url
         except Exception:
-            self._restart()
+            self._restart(deadline)
+
+    # ---------- ngân sách thời gian ----------
+    def _wait(self, cap: float, deadline: Deadline | None = None):
+        """WebDriverWait tối đa `cap` giây nhưng không vượt phần còn lại của deadline."""
+        return WebDriverWait(self.driver, deadline.timeout(cap) if deadline else cap)
+
+    def _budget_page_load(self, deadline: Deadline | None = None):
+        if deadline:
+            self.driver.set_page_load_timeout(deadline.timeout(PAGE_LOAD_TIMEOUT, floor=1))
 
     # ---------- điều hướng tới form tìm kiếm (qua bước username nếu có) ----------
-    def _go_search_page(self):
+    def _go_search_page(self, deadline: Deadline | None = None):
         base = (getattr(config, "TUKI_URL", "") or "").strip()
         if not base:
             raise RuntimeError("Thiếu TUKI_URL trong config/.env")
+        self._budget_page_load(deadline)
         self.driver.get(base)
 
         # Chờ hoặc form username, hoặc input email
         try:
-            self.wait.until(lambda d: d.find_elements(By.ID, "username") or d.find_elements(By.ID, "email"))
+            self._wait(WAIT_LONG, deadline).until(lambda d: d.find_elements(By.ID, "username") or d.find_elements(By.ID, "email"))
+        except DeadlineExceeded:
+            raise
         except Exception:
+            self._budget_page_load(deadline)
             self.driver.refresh()
-            self.wait.until(lambda d: d.find_elements(By.ID, "username") or d.find_elements(By.ID, "email"))
-
-        # Nếu có bước username (CTV0047) → đi qua
-        if self._exists(By.ID, "username"):
+            self._wait(WAIT_LONG, deadline).until(lambda d: d.find_elements(By.ID, "username") or d.find_elements(By.ID, "email"))
+
+        # Nếu có bước username (CTV0047) → đi qua. Với profile lưu sẵn, cookie phiên
+        # còn hiệu lực thì trang vào thẳng form email và bước này được bỏ qua.
+        if not self._exists(By.ID, "username"):
+            log.info("Vào thẳng form tìm kiếm", extra={"profile": bool(self.profile)})
+        else:
+            log.info("Phiên Tukitech hết hạn/chưa có, đăng nhập lại", extra={"profile": bool(self.profile)})
             try:
-                u = self.wait.until(EC.presence_of_element_located((By.ID, "username")))
+                u = self._wait(WAIT_LONG, deadline).until(EC.presence_of_element_located((By.ID, "username")))
                 try: u.clear()
                 except: pass
                 u.send_keys(getattr(config, "USERNAME_TUKI", "") or "CTV0047")
@@ -154,12 +363,14 @@ class TukiPersistent:
                     (By.CSS_SELECTOR, "button.btn.btn-success.w-100"),
                     (By.XPATH, "//button[contains(., 'Tiếp tục')]"),
                     (By.XPATH, "//button[@type='submit']"),
-                ], timeout=WAIT_SHORT)
+                ], timeout=WAIT_SHORT, deadline=deadline)
+            except DeadlineExceeded:
+                raise
             except Exception:
                 pass  # bỏ qua nếu trang không yêu cầu
 
         # Chờ ô email xuất hiện
-        self.wait.until(EC.presence_of_element_located((By.ID, "email")))
+        self._wait(WAIT_LONG, deadline).until(EC.presence_of_element_located((By.ID, "email")))
 
     # ---------- utils ----------
     def _exists(self, by, sel):
@@ -168,11 +379,13 @@ class TukiPersistent:
         except:
             return False
 
-    def _try_click_any(self, candidates, timeout=WAIT_MED):
+    def _try_click_any(self, candidates, timeout=WAIT_MED, deadline: Deadline | None = None):
         for by, sel in candidates:
             try:
-                WebDriverWait(self.driver, timeout).until(EC.element_to_be_clickable((by, sel))).click()
+                self._wait(timeout, deadline).until(EC.element_to_be_clickable((by, sel))).click()
                 return True
+            except DeadlineExceeded:
+                raise
             except Exception:
                 continue
         return False
@@ -202,95 +415,121 @@ class TukiPersistent:
                 except: pass
 
     # ---------- hành động chính ----------
-    def fetch(self, email: str, kind: str = "login_code"):
-        """API chính backend gọi: điền email, chọn condition, ấn tìm kiếm và đọc kết quả."""
-        with self.lock:
-            try:
-                self._ensure_driver()
+    def fetch(self, email: str, kind: str = "login_code", deadline: Deadline | None = None):
+        """API chính backend gọi: điền email, chọn condition, ấn tìm kiếm và đọc kết quả.
+
+        `deadline` giới hạn tổng thời gian (kể cả thời gian chờ lock); mỗi bước chờ
+        chỉ dùng phần còn lại. Hết hạn → kết quả `error="DeadlineExceeded"` kèm
+        báo cáo thời gian từng bước.
+        """
+        deadline = Deadline.coerce(deadline, DEFAULT_FETCH_DEADLINE, label=kind)
+        with deadline.stage("wait_browser"):
+            if not self.lock.acquire(timeout=deadline.remaining()):
+                return deadline.exceeded_result(kind=kind)
+        try:
+            with deadline.stage("ensure_driver"):
+                self._ensure_driver(deadline)
 
-                # refresh nhẹ nếu để lâu
-                if time.time() - self.last_active > IDLE_REFRESH_SECONDS:
+            # refresh nhẹ nếu để lâu
+            if time.time() - self.last_active > IDLE_REFRESH_SECONDS:
+                with deadline.stage("refresh"):
                     try:
+                        self._budget_page_load(deadline)
                         self.driver.refresh()
-                        self.wait.until(EC.presence_of_element_located((By.ID, "email")))
+                        self._wait(WAIT_LONG, deadline).until(EC.presence_of_element_located((By.ID, "email")))
+                    except DeadlineExceeded:
+                        raise
                     except:
-                        self._restart()
+                        self._restart(deadline)
 
+            with deadline.stage("search_page"):
                 # đảm bảo ở form
                 if not self._exists(By.ID, "email"):
-                    self._go_search_page()
+                    self._go_search_page(deadline)
 
-                el = self.wait.until(EC.presence_of_element_located((By.ID, "email")))
+                el = self._wait(WAIT_LONG, deadline).until(EC.presence_of_element_located((By.ID, "email")))
                 try: el.clear()
                 except: pass
                 el.send_keys(email)
 
                 self._select_condition(kind)
 
+            with deadline.stage("submit"):
                 # bấm Tìm kiếm
                 if not self._try_click_any([
                     (By.XPATH, "//button[contains(., 'Tìm kiếm')]"),
                     (By.CSS_SELECTOR, "button[type='submit']"),
                     (By.XPATH, "//input[@type='submit' and (contains(@value,'Tìm') or contains(@value,'Search'))]")
-                ], timeout=WAIT_SHORT):
+                ], timeout=WAIT_SHORT, deadline=deadline):
                     raise RuntimeError("Không click được nút Tìm kiếm")
 
+            with deadline.stage("wait_result"):
                 # đọc kết quả
-                root = WebDriverWait(self.driver, RESULT_WAIT_MAX).until(
+                root = self._wait(RESULT_WAIT_MAX, deadline).until(
                     EC.presence_of_element_located((By.CSS_SELECTOR, "#results-content"))
                 )
 
                 # chờ thêm cho tới khi nội dung thực sự render ra (thường mất vài giây)
-                raw = self._wait_for_result_text(root)
+                raw = self._wait_for_result_text(root, deadline)
                 if not raw:
                     raw = (root.text or "").strip()
                 else:
                     raw = raw.strip()
 
-                # cảnh báo không tìm thấy
-                try:
-                    warn = root.find_element(By.CSS_SELECTOR, ".alert.alert-warning")
-                    msg = (warn.text or "").strip()
-                    self.last_active = time.time()
-                    return {"success": False, "message": msg, "kind": kind}
-                except: pass
-
-                code, t_raw, t_iso = _parse_code_time_text(raw)
-
-                self.last_active = time.time()
-                return {
-                    "success": True, "message": "OK", "kind": kind,
-                    "content": raw, "code": code,
-                    "received_at_raw": t_raw, "received_at": t_iso
-                }
-
-            except Exception as e:
-                traceback.print_exc()
-                self._restart()
-                return {"success": False, "message": f"Lỗi: {e}", "kind": kind}
+            # cảnh báo không tìm thấy
+            try:
+                warn = root.find_element(By.CSS_SELECTOR, ".alert.alert-warning")
+                msg = (warn.text or "").strip()
+                self.last_active = time.time()
+                return {"success": False, "message": msg, "kind": kind}
+            except: pass
+
+            code, t_raw, t_iso = _parse_code_time_text(raw)
+
+            self.last_active = time.time()
+            return {
+                "success": True, "message": "OK", "kind": kind,
+                "content": raw, "code": code,
+                "received_at_raw": t_raw, "received_at": t_iso
+            }
+
+        except Exception as e:
+            if isinstance(e, DeadlineExceeded) or deadline.expired:
+                # Hết ngân sách: trang có thể chỉ chậm, không cần mở lại Chrome;
+                # lần sau sẽ refresh trang trước khi tìm.
+                self.last_active = 0
+                log.warning("Lookup hết thời gian", extra={"kind": kind, "deadline": deadline.report()})
+                return deadline.exceeded_result(kind=kind)
+            log.exception("Lookup lỗi, bỏ phiên Chrome hiện tại", extra={"kind": kind})
+            # Bỏ driver lỗi; request kế tiếp mở lại trong ngân sách của chính nó
+            self._discard_driver()
+            return {"success": False, "message": f"Lỗi: {e}", "kind": kind, "error": type(e).__name__}
+        finally:
+            self.lock.release()
 
-    def _wait_for_result_text(self, root):
+    def _wait_for_result_text(self, root, deadline: Deadline | None = None):
         """Đợi tới khi block kết quả có dữ liệu thực tế (mã/link)."""
-        deadline = time.time() + RESULT_POLL_MAX
+        poll_max = min(RESULT_POLL_MAX, deadline.remaining()) if deadline else RESULT_POLL_MAX
+        poll_until = time.time() + poll_max
         last_text = None
-        while time.time() < deadline:
+        while time.time() < poll_until:
             text = (root.text or "").strip()
             if text:
                 if text != last_text:
                     # nếu là cảnh báo hoặc đã có chữ 'Thời gian'/'Thành công' thì trả ngay
-                    if re.search(r"(?i)thời gian nhận|thành công|tìm kiếm hoàn tất|mã", text):
+                    if _RESULT_READY_RE.search(text):
                         return text
                     # nếu có số dài hoặc link => coi như có dữ liệu
-                    if re.search(r"\d{3,}", text) or "http" in text:
+                    if _RESULT_DIGITS_RE.search(text) or "http" in text:
                         return text
-                    if re.search(r"(?i)không tìm|không có dữ liệu|chưa có", text):
+                    if _RESULT_EMPTY_RE.search(text):
                         return text
                     last_text = text
                 else:
                     # nội dung không đổi nhưng đã có đủ thông tin
-                    if re.search(r"\d{3,}", text) or "http" in text:
+                    if _RESULT_DIGITS_RE.search(text) or "http" in text:
                         return text
-                    if re.search(r"(?i)không tìm|không có dữ liệu|chưa có", text):
+                    if _RESULT_EMPTY_RE.search(text):
                         return text
-            time.sleep(RESULT_POLL_INTERVAL)
+            time.sleep(min(RESULT_POLL_INTERVAL, max(0.0, poll_until - time.time())))
         return (root.text or "").strip()